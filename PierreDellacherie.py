@@ -4,17 +4,32 @@
 
 import os
 import random
-import pygame
+import time
+from collections import OrderedDict
+import numpy as np
 from game import *
 from gameconst import *
+from bitboard import BitBoard
+from boardstats import BoardStats
+from geometry import getGeometry, getColumnTops
+from features import Dellacherie_features, getKernel, getAfterstate
+from instrument import Progress
+from reachability import Reachability, playPath
 
 
 
+Default_A = [-4.500158825082766, 3.4181268101392694, -3.2178882868487753, -9.348695305445199, -7.899265427351652, -3.3855972247263626]
+
+
 class PierreDellacherie():
     """
-    计算特定方块放置情况下 Pierre Dellacherie 算法的经验公式值
+    计算特定方块放置情况下 Pierre Dellacherie 算法的经验公式值。features 为 features.Features 中登记的特征名，
+    默认为 Dellacherie 的 6 项特征，系数 A 与 features 一一对应
     """
-    def __init__(self, field_width, field_height, A):
+    def __init__(self, field_width, field_height, A, features=None):
+        self.features = list(features) if features is not None else Dellacherie_features
+        if len(A) != len(self.features):
+            raise ValueError("expected " + str(len(self.features)) + " coefficients for features " + ", ".join(self.features) + ", got " + str(len(A)))
         self.field_map = None
         self.field_width = field_width
         self.field_height = field_height
@@ -24,7 +39,13 @@ class PierreDellacherie():
         self.board_col_transitions = 0
         self.board_buried_holes = 0
         self.board_wells = 0
-        self.a1, self.a2, self.a3, self.a4, self.a5, self.a6 = A
+        self.A = list(A)
+        self.is_default = self.features == Dellacherie_features
+        if self.is_default:
+            self.a1, self.a2, self.a3, self.a4, self.a5, self.a6 = A
+        self.kernel = getKernel(self.features, field_width, field_height)
+        self.values = ()
+        self.cache = None
 
     def copyMap(self, field_map):
         """
@@ -33,7 +54,7 @@ class PierreDellacherie():
         self.field_map = [[0] * self.field_width for _ in range(self.field_height)]
         for y in range(self.field_height):
             for x in range(self.field_width):
-                if type(field_map[y][x]) is Brick:
+                if field_map[y][x] >= Brick_base:
                     self.field_map[y][x] = 1
                 elif field_map[y][x] == 1:
                     self.field_map[y][x] = 2
@@ -144,7 +165,60 @@ class PierreDellacherie():
                     is_hole = False
                     hole_deep = 0
 
-    def initialize(self, position, layout, field_map):
+    def initializeBitBoard(self, position, layout, field_map):
+        """
+        在 BitBoard 上计算各项特征，结果与列表形式的游戏区域完全一致
+        """
+        self.field_map = field_map.copy()
+        self.field_map.place(layout, position)
+        eroded_cells = self.field_map.getErodedCells(layout, position)
+        self.getLandingHeight(position, layout)
+        self.eroded_piece_cells_metric = self.field_map.eliminateLines() * eroded_cells
+        (self.board_row_transitions, self.board_col_transitions, self.board_buried_holes, self.board_wells) = self.field_map.getFeatures()
+
+    def initializeStats(self, position, layout, stats):
+        """
+        由 BoardStats 增量计算各项特征，不消行时只需重新计算方块占据的行和列。
+        设置了 cache 时先以游戏区域与方块的 Zobrist 哈希值查找缓存
+        """
+        self.getLandingHeight(position, layout)
+        if self.cache is None:
+            features = stats.getAfterstateFeatures(layout, position)
+        else:
+            key = (stats.hash, stats.getPieceHash(layout, position))
+            features = self.cache.get(key)
+            if features is None:
+                features = stats.getAfterstateFeatures(layout, position)
+                self.cache.put(key, features)
+        (self.eroded_piece_cells_metric, self.board_row_transitions, self.board_col_transitions, self.board_buried_holes, self.board_wells) = features
+
+    def initializeKernel(self, position, layout, field_map):
+        """
+        构造方块放置并消行之后的 BitBoard，一次遍历计算 features 中的所有特征，结果按 features 的顺序保存在 values 中。
+        列表形式的游戏区域需要先用 AI.dropBlock 标记方块
+        """
+        self.getLandingHeight(position, layout)
+        if type(field_map) is BoardStats:
+            key = None
+            if self.cache is not None:
+                key = (self.kernel.names, field_map.hash, field_map.getPieceHash(layout, position))
+                values = self.cache.get(key)
+                if values is not None:
+                    self.values = values
+                    return
+            (self.field_map, eroded_metric) = getAfterstate(layout, position, field_map.board)
+        else:
+            key = None
+            (self.field_map, eroded_metric) = getAfterstate(layout, position, field_map)
+        self.values = self.kernel.getFeatures(self.field_map.rows, self.landing_height, eroded_metric)
+        if key is not None:
+            self.cache.put(key, self.values)
+
+    def initializeReference(self, position, layout, field_map):
+        """
+        逐个小方格计算 Dellacherie 的 6 项特征，作为 BitBoard、BoardStats 与融合特征计算结果的参照。
+        field_map 为已经用 AI.dropBlock 标记了方块的二维列表
+        """
         self.copyMap(field_map)
         self.getLandingHeight(position, layout)
         self.getErodedPieceCellsMetric(self.eliminateLines())
@@ -153,8 +227,24 @@ class PierreDellacherie():
         self.getBoardBuriedHoles()
         self.getBoardWells()
 
+    def initialize(self, position, layout, field_map):
+        if self.is_default and type(field_map) is BitBoard:
+            self.initializeBitBoard(position, layout, field_map)
+            return
+        if self.is_default and type(field_map) is BoardStats:
+            self.initializeStats(position, layout, field_map)
+            return
+        self.initializeKernel(position, layout, field_map)
+        if self.is_default:
+            (self.landing_height, self.eroded_piece_cells_metric, self.board_row_transitions, self.board_col_transitions, self.board_buried_holes, self.board_wells) = self.values
+
     def evaluate(self, position, layout, field_map):
         self.initialize(position, layout, field_map)
+        if not self.is_default:
+            score = 0
+            for (a, value) in zip(self.A, self.values):
+                score += a * value
+            return score
         score = self.a1 * self.landing_height \
               + self.a2 * self.eroded_piece_cells_metric \
               + self.a3 * self.board_row_transitions \
@@ -164,40 +254,174 @@ class PierreDellacherie():
         return score
 
 
+class EvaluationCache():
+    """
+    以 (游戏区域的 Zobrist 哈希值, 方块所占格子的 Zobrist 哈希值) 为键，缓存方块放置后除落点高度以外的各项特征。
+    缓存的是特征而不是分数，与系数 A 无关，可以被多个 AI 共享。条目数超过 max_bytes 对应的上限时按 LRU 顺序淘汰
+    """
+    entry_bytes = 320
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max(1, max_bytes // self.entry_bytes)
+        self.table = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        features = self.table.get(key)
+        if features is None:
+            self.misses += 1
+            return None
+        self.table.move_to_end(key)
+        self.hits += 1
+        return features
+
+    def put(self, key, features):
+        self.table[key] = features
+        if len(self.table) > self.max_entries:
+            self.table.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.table.clear()
+
+    def getStats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.table),
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+class PierreDellacherieBatch():
+    """
+    使用 NumPy 一次性计算所有候选放置情况的经验公式值，各项特征的定义与 PierreDellacherie 完全一致，
+    因此同一组系数 A 下的分数与 PierreDellacherie.evaluate 相同
+    """
+    def __init__(self, field_width, field_height, A):
+        self.field_width = field_width
+        self.field_height = field_height
+        self.A = A
+
+    def getBoard(self, field_map):
+        """
+        将游戏区域转换为 (field_height, field_width) 的布尔数组
+        """
+        if type(field_map) is BitBoard:
+            return np.array(field_map.toMap(), dtype=bool)
+        return np.array(field_map) >= Brick_base
+
+    def getAfterstates(self, candidates, field_map):
+        """
+        构造所有候选放置情况下的游戏区域，返回形状为 (N, field_height, field_width) 的游戏区域和方块所占的格子
+        """
+        n = len(candidates)
+        boards = np.repeat(self.getBoard(field_map)[None], n, axis=0)
+        pieces = np.zeros_like(boards)
+        index = np.repeat(np.arange(n), 4)
+        ys = np.array([position[1] + y for (position, layout) in candidates for (x, y) in layout])
+        xs = np.array([position[0] + x for (position, layout) in candidates for (x, y) in layout])
+        boards[index, ys, xs] = True
+        pieces[index, ys, xs] = True
+        return boards, pieces
+
+    def getLandingHeight(self, candidates):
+        return np.array([sum(self.field_height - (position[1] + y) for (x, y) in layout) for (position, layout) in candidates]) / 4
+
+    def eliminateLines(self, boards, pieces):
+        """
+        消除所有满行并将上方的行下移，返回消除后的游戏区域、消除的行数以及方块中被消除的小方格数
+        """
+        full = boards.all(axis=2)
+        lines = full.sum(axis=1)
+        eroded_cells = (pieces & full[:, :, None]).sum(axis=(1, 2))
+        order = np.argsort(~full, axis=1, kind='stable')
+        boards = np.take_along_axis(boards, order[:, :, None], axis=1)
+        boards[np.arange(self.field_height)[None, :] < lines[:, None]] = False
+        return boards, lines, eroded_cells
+
+    def getBoardRowTransitions(self, boards):
+        walls = np.ones(boards.shape[:2] + (1,), dtype=bool)
+        extended = np.concatenate((walls, boards, walls), axis=2)
+        return (extended[:, :, 1:] != extended[:, :, :-1]).sum(axis=(1, 2))
+
+    def getBoardColTransitions(self, boards):
+        return (boards[:, 1:] != boards[:, :-1]).sum(axis=(1, 2)) + (~boards[:, -1]).sum(axis=1)
+
+    def getBoardBuriedHoles(self, boards):
+        return (boards[:, :-1] & ~boards[:, 1:]).sum(axis=(1, 2))
+
+    def getBoardWells(self, boards):
+        """
+        每一列中井从两侧都有小方格（墙也算作小方格）的空格开始，一直延伸到下一个有小方格的位置，
+        井中第 k 个格子贡献深度 k
+        """
+        walls = np.ones(boards.shape[:2] + (1,), dtype=bool)
+        extended = np.concatenate((walls, boards, walls), axis=2)
+        start = ~boards & extended[:, :, :-2] & extended[:, :, 2:]
+        rows = np.arange(self.field_height)[None, :, None]
+        last_filled = np.maximum.accumulate(np.where(boards, rows, -1), axis=1)
+        starts = np.cumsum(start, axis=1)
+        starts_before = np.take_along_axis(np.concatenate((np.zeros_like(starts[:, :1]), starts), axis=1), last_filled + 1, axis=1)
+        is_well = ~boards & (starts > starts_before)
+        last_not_well = np.maximum.accumulate(np.where(is_well, -1, rows), axis=1)
+        return (rows - last_not_well).sum(axis=(1, 2))
+
+    def evaluate(self, candidates, field_map):
+        """
+        candidates 为 ((x, y), layout) 的列表，返回每个候选放置情况的经验公式值
+        """
+        boards, pieces = self.getAfterstates(candidates, field_map)
+        landing_height = self.getLandingHeight(candidates)
+        boards, lines, eroded_cells = self.eliminateLines(boards, pieces)
+        a1, a2, a3, a4, a5, a6 = self.A
+        return a1 * landing_height \
+             + a2 * (lines * eroded_cells) \
+             + a3 * self.getBoardRowTransitions(boards) \
+             + a4 * self.getBoardColTransitions(boards) \
+             + a5 * self.getBoardBuriedHoles(boards) \
+             + a6 * self.getBoardWells(boards)
+
+
 class AI():
     """
     找出经验公式值最大的放置方法并放置方块
     """
-    def __init__(self, field_width, field_height, A):
-        self.evaluation = PierreDellacherie(field_width, field_height, A)
+    def __init__(self, field_width, field_height, A, batch=False, cache=None, reachability=False, features=None):
+        self.evaluation = PierreDellacherie(field_width, field_height, A, features)
+        self.evaluation.cache = cache
+        if batch and not self.evaluation.is_default:
+            raise ValueError("batch evaluation only supports the Dellacherie features")
+        self.batch_evaluation = PierreDellacherieBatch(field_width, field_height, A) if batch else None
         self.field_width = field_width
         self.field_height = field_height
+        self.reachability = reachability
+        self.animated = False
 
     def getAllPossibleLocation(self, block, layout, field_map):
         """
         找出方块在特定方向下所有可行的放置位置
         """
-        all_possible_position = []
-        for x in range(self.field_width):
-            if block.isLegal(layout, (x, -4), field_map) is not State.Middle:
-                all_possible_position.append(x)
-        return all_possible_position
+        return getGeometry(layout).getLegalRange(self.field_width)
 
-    def findBottomPosition(self, block, x, layout, field_map):
+    def findBottomPosition(self, block, x, layout, field_map, tops=None):
         """
-        找出方块最终下落到底部方块的堆顶的位置
+        找出方块最终下落到底部方块的堆顶的位置，tops 为 getColumnTops 的结果，同一局面下的多次调用可以共用
         """
-        y = -4
-        while block.isLegal(layout, (x, y), field_map) is not State.Bottom:
-            y += 1
-        return y - 1
+        if tops is None:
+            tops = getColumnTops(self.field_width, self.field_height, field_map)
+        return getGeometry(layout).getLanding(x, tops)
 
     def dropBlock(self, x0, y0, layout, field_map):
         """
-        模拟将方块放置到目标底部位置上的情况
+        模拟将方块放置到目标底部位置上的情况，BitBoard 与 BoardStats 上只检查方块是否完全在游戏区域内
         """
+        if type(field_map) is BitBoard or type(field_map) is BoardStats:
+            return all(y0 + y >= 0 for (x, y) in layout)
         for (x, y) in layout:
-            if 0 <= y0 + y < self.field_height:
+            if 0 <= y0 + y < self.field_height and field_map[y0 + y][x0 + x] < Brick_base:
                 field_map[y0 + y][x0 + x] = 1
             if y0 + y < 0:
                 return False
@@ -207,6 +431,8 @@ class AI():
         """
         将游戏区域恢复到方块放置前，删除方块模拟放置信息
         """
+        if type(field_map) is BitBoard or type(field_map) is BoardStats:
+            return
         count = 0
         for y in range(self.field_height):
             for x in range(self.field_width):
@@ -229,54 +455,200 @@ class AI():
         while not block.is_stop:
             block.down(field_map)
 
-    def ai(self, block, field_map):
-        best_position = (float('-inf'), (-1, -1), 0)
+    def getCandidates(self, block, board):
+        """
+        列出方块所有候选的放置位置 ((x, y), 方向)。reachability 为 True 时使用可达性搜索，
+        包括从上方无法直接落下、需要在悬空的小方格下方横移或旋转才能到达的位置
+        """
+        if self.reachability:
+            return Reachability(block, board).getPlacements()
+        candidates = []
+        tops = getColumnTops(self.field_width, self.field_height, board)
+        for direction in range(len(block.layouts)):
+            for x in self.getAllPossibleLocation(block, block.layouts[direction], board):
+                candidates.append(((x, self.findBottomPosition(block, x, block.layouts[direction], board, tops)), direction))
+        return candidates
+
+    def moveBlock(self, block, position, direction, field_map):
+        """
+        将方块落定在选定的位置。默认直接调用 Block.place，无法放置时抛出 ValueError；animated 为 True 时通过游戏提供的接口逐步移动，
+        使用可达性搜索时按最短的操作序列移动
+        """
+        if not self.animated:
+            if not block.place(position, direction, field_map):
+                raise ValueError("cannot place block " + str(block.block_type) + " at " + str(position) + " with direction " + str(direction))
+        elif self.reachability:
+            playPath(block, Reachability(block, field_map).getPath(position, direction), field_map)
+        else:
+            self.getNewMap(block, position, direction, field_map)
+
+    def aiBatch(self, block, field_map):
+        """
+        先收集所有候选放置位置，再用 PierreDellacherieBatch 一次性计算经验公式值
+        """
+        candidates = []
+        tops = getColumnTops(self.field_width, self.field_height, field_map)
         for direction in range(len(block.layouts)):
             for x in self.getAllPossibleLocation(block, block.layouts[direction], field_map):
-                y = self.findBottomPosition(block, x, block.layouts[direction], field_map)
-                if self.dropBlock(x, y, block.layouts[direction], field_map):
-                    score = self.evaluation.evaluate((x, y), block.layouts[direction], field_map)
-                    if score > best_position[0]:
-                        best_position = (score, (x, y), direction)
-                self.resetMap(field_map)
+                y = self.findBottomPosition(block, x, block.layouts[direction], field_map, tops)
+                if all(y + dy >= 0 for (dx, dy) in block.layouts[direction]):
+                    candidates.append(((x, y), direction))
+        if candidates == []:
+            return False
+        scores = self.batch_evaluation.evaluate([(position, block.layouts[direction]) for (position, direction) in candidates], field_map)
+        (position, direction) = candidates[int(np.argmax(scores))]
+        self.moveBlock(block, position, direction, field_map)
+        return True
+
+    def ai(self, block, field_map, stats=None, next_blocks=()):
+        """
+        stats 为与 field_map 同步的 BoardStats，给定时在它上面增量计算各候选位置的特征。
+        next_blocks 为预览的后续方块，贪心算法不使用
+        """
+        if self.batch_evaluation is not None:
+            return self.aiBatch(block, field_map)
+        board = stats if stats is not None else field_map
+        best_position = (float('-inf'), (-1, -1), 0)
+        for ((x, y), direction) in self.getCandidates(block, board):
+            if self.dropBlock(x, y, block.layouts[direction], board):
+                score = self.evaluation.evaluate((x, y), block.layouts[direction], board)
+                if score > best_position[0]:
+                    best_position = (score, (x, y), direction)
+            self.resetMap(board)
         if best_position[0] > float('-inf'):
-            self.getNewMap(block, best_position[1], best_position[2], field_map)
+            self.moveBlock(block, best_position[1], best_position[2], field_map)
             return True
         else:
             return False
 
 
+class BeamSearchAI(AI):
+    """
+    利用预览的后续方块进行束搜索：展开当前方块的所有放置位置，按经验公式值保留最好的 beam_width 个，
+    再用下一个方块展开，选出 depth 步经验公式值之和最大的一条路线并执行它的第一步。
+    每一步的搜索时间超过 time_budget 秒时放弃搜索，退回贪心算法的结果
+    """
+    def __init__(self, field_width, field_height, A, depth=2, beam_width=5, time_budget=None, cache=None, reachability=False, features=None):
+        super(BeamSearchAI, self).__init__(field_width, field_height, A, False, cache, reachability, features)
+        self.depth = depth
+        self.beam_width = beam_width
+        self.time_budget = time_budget
+        self.timeouts = 0
+
+    def getPlacements(self, block, stats):
+        """
+        列出方块在 stats 上所有放置位置的 (经验公式值, 位置, 方向)
+        """
+        placements = []
+        for ((x, y), direction) in self.getCandidates(block, stats):
+            if self.dropBlock(x, y, block.layouts[direction], stats):
+                placements.append((self.evaluation.evaluate((x, y), block.layouts[direction], stats), (x, y), direction))
+        return placements
+
+    def search(self, block, stats, next_blocks, start_time):
+        """
+        返回 (第一步的位置, 方向)，没有可行的放置位置时返回 None，超时返回 False
+        """
+        pieces = [block] + list(next_blocks)[:self.depth - 1]
+        beam = [(0, stats, None)]
+        best = None
+        for ply in range(len(pieces)):
+            children = []
+            for (value, node, first) in beam:
+                if self.time_budget is not None and time.perf_counter() - start_time > self.time_budget:
+                    return False
+                for (score, position, direction) in self.getPlacements(pieces[ply], node):
+                    children.append((value + score, node, first if first is not None else (position, direction), pieces[ply].layouts[direction], position))
+            if children == []:
+                break
+            children.sort(key=lambda child: child[0], reverse=True)
+            best = children[0][2]
+            if ply == len(pieces) - 1:
+                break
+            beam = []
+            for (value, node, first, layout, position) in children[:self.beam_width]:
+                child = node.copy()
+                child.lock(layout, position)
+                child.eliminateLines()
+                beam.append((value, child, first))
+        return best
+
+    def ai(self, block, field_map, stats=None, next_blocks=()):
+        if stats is None or self.depth <= 1 or len(next_blocks) == 0:
+            return super(BeamSearchAI, self).ai(block, field_map, stats)
+        best = self.search(block, stats, next_blocks, time.perf_counter())
+        if best is False:
+            self.timeouts += 1
+            return super(BeamSearchAI, self).ai(block, field_map, stats)
+        if best is None:
+            return False
+        self.moveBlock(block, best[0], best[1], field_map)
+        return True
+
+
 class AIGame(Game):
-    def __init__(self):
-        super(AIGame, self).__init__(10, 20)
+    def __init__(self, bitboard=False, batch=False, rng=None, sequence=None, cache=None, depth=1, beam_width=5, time_budget=None, reachability=False, features=None):
+        super(AIGame, self).__init__(10, 20, bitboard, rng, sequence)
+        self.batch = batch
+        self.cache = cache
+        self.depth = depth
+        self.beam_width = beam_width
+        self.time_budget = time_budget
+        self.reachability = reachability
+        self.features = features
+
+    def getAI(self, A):
+        """
+        depth 大于 1 时使用 BeamSearchAI 利用预览的下一个方块进行搜索，reachability 为 True 时候选位置包括需要横移或旋转塞入的位置，
+        features 不为 None 时按这组特征计算经验公式值，A 为对应的系数
+        """
+        if self.depth > 1:
+            return BeamSearchAI(self.field_width, self.field_height, A, self.depth, self.beam_width, self.time_budget, self.cache, self.reachability, self.features)
+        return AI(self.field_width, self.field_height, A, self.batch, self.cache, self.reachability, self.features)
 
     def checkEvents(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit(0)
+        self.renderer.checkQuit()
 
     def start(self, A):
         self.initialize()
         self.initializePygame()
-        self.ai = AI(self.field_width, self.field_height, A)
-        while not self.block_factory.is_failed and self.ai.ai(self.block_factory.cur_block, self.field_map):
+        self.ai = self.getAI(A)
+        self.ai.animated = True
+        while not self.block_factory.is_failed and self.ai.ai(self.block_factory.cur_block, self.field_map, self.stats, [self.block_factory.next_block]):
             self.checkEvents()
             self.update()
             self.draw()
         return self.lines_num
 
-    def startWithoutGUI(self, A):
+    def startWithoutGUI(self, A, max_pieces=None, verbose=True, replay=None):
+        """
+        不显示界面运行一局游戏，max_pieces 限制本局最多放置的方块数，replay 为 ReplayWriter 时记录每一步的放置，
+        verbose 为 True 时每秒输出一次进度
+        """
         self.initialize()
-        self.ai = AI(self.field_width, self.field_height, A)
-        while not self.block_factory.is_failed and self.ai.ai(self.block_factory.cur_block, self.field_map):
+        self.ai = self.getAI(A)
+        self.pieces_num = 0
+        progress = Progress() if verbose else None
+        while not self.block_factory.is_failed and (max_pieces is None or self.pieces_num < max_pieces):
+            block = self.block_factory.cur_block
+            spawn_direction = block.direction
+            if not self.ai.ai(block, self.field_map, self.stats, [self.block_factory.next_block]):
+                break
             self.update()
-            print("\r" + "Lines: " + str(self.lines_num), end="", flush=True)
+            self.pieces_num += 1
+            if replay is not None:
+                replay.record(self, block, spawn_direction)
+            if progress is not None:
+                progress.update(self)
+        if progress is not None:
+            progress.update(self, True)
+            print()
         return self.lines_num
 
 
 if __name__ == '__main__':
-    A = [-4.500158825082766, 3.4181268101392694, -3.2178882868487753, -9.348695305445199, -7.899265427351652, -3.3855972247263626]
+    A = Default_A
     game = AIGame()
     lines_num = game.start(A)
     #lines_num = game.startWithoutGUI(A)
+    #lines_num = AIGame(bitboard=True).startWithoutGUI(A)
@@ -2,8 +2,20 @@
 这份代码使用 Q learning 算法训练并运行俄罗斯方块游戏 ai。其中简化状态空间的方法可参考论文 Adapting Reinforcement Learning to Tetris
 """
 
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import time
 import numpy as np
+from multiprocessing import shared_memory
 from game import *
+from bitboard import BitBoard
+from boardstats import BoardStats
+from sparseboard import SparseBoard
+from geometry import getGeometry, getColumnTops
+from symmetry import Canonicalizer, Mirror_type, getAllLocations
 
 
 
@@ -11,6 +23,53 @@ sub_well = 4
 base = 7
 
 
+def newQTable(field_width):
+    """
+    Q 表为连续的 NumPy 数组，下标依次为状态索引、方块种类、放置位置和方向
+    """
+    return np.zeros((base**(field_width-1), 7, field_width, 4))
+
+
+def saveArray(path, array):
+    """
+    先写入临时文件再替换，避免进程被杀死时留下不完整的文件
+    """
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, array)
+    os.replace(path + ".tmp", path)
+
+
+def loadQTable(path, field_width=sub_well):
+    """
+    以 mmap_mode 打开 .npy 格式的 Q 表，无需读入整个文件；旧版本保存的字典格式会被转换为数组
+    """
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        table = np.load(path, allow_pickle=True).item()
+        Q = newQTable(field_width)
+        for (((state, block), (position, direction)), value) in table.items():
+            Q[state, block, position, direction] = value
+        return Q
+
+
+def convertQTable(Q, symmetry, field_width=sub_well):
+    """
+    在未压缩的 Q 表与 symmetry（Canonicalizer 或 None）使用的压缩 Q 表之间转换
+    """
+    if symmetry is not None and Q.ndim == 4:
+        return symmetry.canonicalizeTable(Q)
+    if symmetry is None and Q.ndim == 3:
+        return Canonicalizer(field_width, base).expandTable(Q)
+    return Q
+
+
+def getQIndex(symmetry, state, block_type, action):
+    if symmetry is None:
+        return (state, block_type, action[0], action[1])
+    return symmetry.getIndex(state, block_type, action[0], action[1])
+
+
 def getStateIndex(field_width, field_height, field_map):
     """
     因为每一列有 7 种不同的情况，所以采用七进制数来作为状态索引
@@ -19,9 +78,12 @@ def getStateIndex(field_width, field_height, field_map):
     convert = {}
     for i in range(-(base - 1)//2, (base - 1)//2 + 1):
         convert[i] = i + (base - 1)//2
-    for x in range(field_width):
-        while temp[x] < field_height and field_map[temp[x]][x] == 0:
-            temp[x] += 1
+    if type(field_map) is BitBoard or type(field_map) is BoardStats or type(field_map) is SparseBoard:
+        temp = field_map.getColumnTops()
+    else:
+        for x in range(field_width):
+            while temp[x] < field_height and field_map[temp[x]][x] == 0:
+                temp[x] += 1
     index = 0
     for i in range(field_width-1):
         if temp[i+1] - temp[i] > (base - 1)//2:
@@ -33,24 +95,41 @@ def getStateIndex(field_width, field_height, field_map):
     return index
 
 
+def isEmpty(field_map, x, y):
+    if type(field_map) is BitBoard or type(field_map) is SparseBoard:
+        return not field_map.getCell(x, y)
+    return field_map[y][x] == 0
+
+
+def getReward(field_height, field_map, tops, block):
+    """
+    block 落定之后、消行之前的奖励：各列堆顶的方差乘以 -2，加上方块每个小方格正下方连续的空格数之和乘以 -1。
+    空格按方块所在的绝对列计算，左右镜像的局面得到相同的奖励
+    """
+    buried_holes = 0
+    for (x, y) in block.layout:
+        i = 1
+        while block.position[1]+y+i < field_height and isEmpty(field_map, block.position[0]+x, block.position[1]+y+i):
+            buried_holes += 1
+            i += 1
+    return np.var(tops)*(-2) + buried_holes*(-1)
+
+
 def getAllPossibleLocation(field_width, field_map, block, layout):
-    all_possible_position = []
-    for x in range(field_width):
-        if block.isLegal(layout, (x, -4), field_map) is not State.Middle:
-            all_possible_position.append(x)
-    return all_possible_position
+    return getGeometry(layout).getLegalRange(field_width)
 
 
-def findBottomPosition(field_map, block, x, layout):
-    y = -4
-    while block.isLegal(layout, (x, y), field_map) is not State.Bottom:
-        y += 1
-    return y - 1
+def findBottomPosition(field_map, block, x, layout, tops=None):
+    if tops is None:
+        tops = getColumnTops(block.field_width, block.field_height, field_map)
+    return getGeometry(layout).getLanding(x, tops)
 
 
 def dropBlock(field_height, field_map, x0, y0, layout):
+    if type(field_map) is BitBoard:
+        return field_map.mark(layout, (x0, y0))
     for (x, y) in layout:
-        if 0 <= y0 + y < field_height:
+        if 0 <= y0 + y < field_height and field_map[y0 + y][x0 + x] < Brick_base:
             field_map[y0 + y][x0 + x] = 1
         if y0 + y < 0:
             return False
@@ -58,6 +137,9 @@ def dropBlock(field_height, field_map, x0, y0, layout):
 
 
 def resetMap(field_width, field_height, field_map):
+    if type(field_map) is BitBoard:
+        field_map.unmark()
+        return
     count = 0
     for y in range(field_height):
         for x in range(field_width):
@@ -80,122 +162,356 @@ def getNewMap(block, position, direction, field_map):
 
 
 class QLearning(Game):
-    def __init__(self):
-        super(QLearning, self).__init__(sub_well, 1000)
+    """
+    在 sub_well 列、1000 行的井中训练。默认使用列表或 BitBoard（bitboard 为 True）并由 BoardStats 提供每列堆顶；
+    sparse 为 True 时改用 SparseBoard，每一步的开销只与堆叠的高度有关。
+    symmetric 为 True 时左右镜像的局面共用 Q 表中的同一行（见 symmetry.py），Q 值相同的放置方法中选择换算后列与方向最小的一个，
+    因此镜像局面下选出的放置方法也互为镜像
+    """
+    def __init__(self, bitboard=False, rng=None, sparse=False, symmetric=False):
+        super(QLearning, self).__init__(sub_well, 1000, bitboard, rng, None, sparse)
         self.repeat_num = 200
         self.alpha = 0.2
         self.gamma = 0.8
         self.lambda_ = 0.3
         self.epsilon = 0.01
-        self.key = [((s, b), (p, d)) for s in range(base**(self.field_width-1)) for b in range(7) for p in range(self.field_width) for d in range(4)]
-        self.V = [0 for _ in range(len(self.key))]
-        self.Q = dict(zip(self.key, self.V))
-        #self.Q = np.load('QL.npy').item()
+        self.symmetry = Canonicalizer(self.field_width, base) if symmetric else None
+        self.Q = self.symmetry.newTable() if symmetric else newQTable(self.field_width)
+        self.epoch = 0
+        self.record = []
+        self.path = 'QL.npy'
+        self.checkpoint = 'QL_checkpoint.json'
+
+    def initialize(self):
+        super(QLearning, self).initialize()
+        self.board = self.field_map if self.sparse else self.stats
 
     def checkEvents(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit(0)
+        self.renderer.checkQuit()
 
     def getBlock(self, block):
-        for x in range(len(Blocks_color)):
-            if block.color == Blocks_color[x]:
-                return x
+        return block.block_type
 
     def getReward(self):
-        temp = [0 for _ in range(self.field_width)]
-        for x in range(self.field_width):
-            while temp[x] < self.field_height and self.field_map[temp[x]][x] == 0:
-                temp[x] += 1
-        buried_holes = 0
-        block = self.block_factory.cur_block
-        for (x, y) in block.layout:
-            i = 1
-            while block.position[1]+y+i < self.field_height and self.field_map[block.position[1]+y+i][x] == 0:
-                buried_holes += 1
-                i += 1
-        return np.var(temp)*(-2) + buried_holes*(-1)
+        return getReward(self.field_height, self.field_map, self.board.getColumnTops(), self.block_factory.cur_block)
 
     def getAllActions(self, block):
         actions = []
+        tops = getColumnTops(self.field_width, self.field_height, self.board)
         for direction in range(len(block.layouts)):
-            for x in getAllPossibleLocation(self.field_width, self.field_map, block, block.layouts[direction]):
-                y = findBottomPosition(self.field_map, block, x, block.layouts[direction])
-                if dropBlock(self.field_height, self.field_map, x, y, block.layouts[direction]):
+            if self.symmetry is None:
+                locations = getAllPossibleLocation(self.field_width, self.board, block, block.layouts[direction])
+            else:
+                locations = getAllLocations(self.field_width, block.layouts[direction])
+            for x in locations:
+                y = findBottomPosition(self.board, block, x, block.layouts[direction], tops)
+                if all(y + dy >= 0 for (dx, dy) in block.layouts[direction]):
                     actions.append((x, direction))
-                    resetMap(self.field_width, self.field_height, self.field_map)
         return actions
 
     def getBestActionWithGreedy(self, block):
         block_type = self.getBlock(block)
-        state = getStateIndex(self.field_width, self.field_height, self.field_map)
+        state = getStateIndex(self.field_width, self.field_height, self.board)
         actions = self.getAllActions(block)
         actions_value = {}
         for action in actions:
-            actions_value[action] = self.Q[((state, block_type), action)]
+            actions_value[action] = self.Q[getQIndex(self.symmetry, state, block_type, action)]
         if actions_value == {}:
             return None
-        elif random.random() > self.epsilon:
-            return max(actions_value, key=actions_value.get)
+        elif self.rng.random() > self.epsilon:
+            return self.getMaxAction(state, block_type, actions_value)
         else:
-            return list(actions_value.keys())[random.randint(0, len(actions_value)-1)]
+            return list(actions_value.keys())[self.rng.randint(0, len(actions_value)-1)]
 
     def getBestAction(self, block):
         block_type = self.getBlock(block)
-        state = getStateIndex(self.field_width, self.field_height, self.field_map)
+        state = getStateIndex(self.field_width, self.field_height, self.board)
         actions = self.getAllActions(block)
         actions_value = {}
         for action in actions:
-            actions_value[action] = self.Q[((state, block_type), action)]
+            actions_value[action] = self.Q[getQIndex(self.symmetry, state, block_type, action)]
         if actions_value == {}:
             return None
-        return max(actions_value, key=actions_value.get)
-
-    def train(self):
-        record = []
-        for i in range(1, self.repeat_num+1):
-            self.initialize()
-            while not self.block_factory.is_failed:
-                cur_state = getStateIndex(self.field_width, self.field_height, self.field_map)
-                cur_block = self.getBlock(self.block_factory.cur_block)
-                cur_action = self.getBestActionWithGreedy(self.block_factory.cur_block)
-                cur_index = ((cur_state, cur_block), cur_action)
-                if cur_action == None: break
-                getNewMap(self.block_factory.cur_block, cur_action, cur_action[1], self.field_map)
-                next_state = getStateIndex(self.field_width, self.field_height, self.field_map)
-                next_block = self.getBlock(self.block_factory.next_block)
-                next_action = self.getBestAction(self.block_factory.next_block)
-                next_index = ((next_state, next_block), next_action)
-                if next_action == None: break
-                self.Q[cur_index] += self.alpha*(self.getReward()+self.gamma*self.Q[next_index] - self.Q[cur_index])
-                self.update()
-            print("Epoch:"+str(i)+"/"+str(self.repeat_num)+"   Lines:"+ str(self.lines_num)+"   Alpha:"+str(self.alpha))
-            record.append(self.lines_num)
-            if i % 100 == 0:
+        return self.getMaxAction(state, block_type, actions_value)
+
+    def getMaxAction(self, state, block_type, actions_value):
+        if self.symmetry is None:
+            return max(actions_value, key=actions_value.get)
+        return max(actions_value, key=lambda action: (actions_value[action], [-i for i in self.symmetry.getIndex(state, block_type, action[0], action[1])]))
+
+    def updateQ(self, index, delta):
+        self.Q[index] += delta
+
+    def trainEpisode(self, max_steps=None):
+        """
+        训练一局游戏，max_steps 限制本局最多放置的方块数，返回实际放置的方块数
+        """
+        self.initialize()
+        steps = 0
+        while not self.block_factory.is_failed and (max_steps is None or steps < max_steps):
+            cur_state = getStateIndex(self.field_width, self.field_height, self.board)
+            cur_block = self.getBlock(self.block_factory.cur_block)
+            cur_action = self.getBestActionWithGreedy(self.block_factory.cur_block)
+            if cur_action == None: break
+            cur_index = getQIndex(self.symmetry, cur_state, cur_block, cur_action)
+            self.block_factory.drop(cur_action[0], cur_action[1], self.field_map, self.board.getColumnTops(1))
+            next_state = getStateIndex(self.field_width, self.field_height, self.board)
+            next_block = self.getBlock(self.block_factory.next_block)
+            next_action = self.getBestAction(self.block_factory.next_block)
+            if next_action == None: break
+            next_index = getQIndex(self.symmetry, next_state, next_block, next_action)
+            self.updateQ(cur_index, self.alpha*(self.getReward()+self.gamma*self.Q[next_index] - self.Q[cur_index]))
+            self.update()
+            steps += 1
+        return steps
+
+    def saveCheckpoint(self):
+        """
+        把 Q 表保存到 path，并在检查点中记录 Q 表的路径以及继续训练所需的轮数、学习率、随机数状态和每轮消除的行数
+        """
+        saveArray(self.path, self.Q)
+        state = {"path": self.path, "epoch": self.epoch, "alpha": self.alpha, "rng": self.rng.getstate(), "record": self.record}
+        with open(self.checkpoint + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(self.checkpoint + ".tmp", self.checkpoint)
+
+    def loadCheckpoint(self):
+        """
+        从检查点中记录的路径读取 Q 表（没有记录时使用 path），并按 symmetric 转换为对应的形式
+        """
+        with open(self.checkpoint) as f:
+            state = json.load(f)
+        self.path = state.get("path", self.path)
+        self.Q = convertQTable(np.array(loadQTable(self.path, self.field_width)), self.symmetry, self.field_width)
+        self.epoch = state["epoch"]
+        self.alpha = state["alpha"]
+        self.record = state["record"]
+        (version, internal_state, gauss_next) = state["rng"]
+        self.rng.setstate((version, tuple(internal_state), gauss_next))
+
+    def train(self, resume=False, checkpoint_interval=10):
+        """
+        每训练 checkpoint_interval 轮保存一次检查点，resume 为 True 时从检查点继续训练
+        """
+        if resume and os.path.exists(self.checkpoint):
+            self.loadCheckpoint()
+        while self.epoch < self.repeat_num:
+            self.epoch += 1
+            self.trainEpisode()
+            print("Epoch:"+str(self.epoch)+"/"+str(self.repeat_num)+"   Lines:"+ str(self.lines_num)+"   Alpha:"+str(self.alpha))
+            self.record.append(self.lines_num)
+            if self.epoch % 100 == 0:
                 self.alpha *= 0.5
-                np.save('QL.npy', {"V": self.V})
-                np.save('record_QL.npy', {"record": record})
-        np.save('QL.npy', self.Q)
-        np.save('record_QL.npy', {"record": record})
+            if self.epoch % checkpoint_interval == 0:
+                self.saveCheckpoint()
+        self.saveCheckpoint()
+        np.save('record_QL.npy', {"record": self.record})
+
+    def trainParallel(self, workers=4, sync_interval=100, target_lines=None, checkpoint_interval=10, seed=0):
+        """
+        多进程训练：Q 表放在共享内存中，每个 actor 进程使用独立的随机数生成器进行 epsilon-greedy 训练，
+        在本地副本上更新并每隔 sync_interval 步把累计的更新量加到共享的 Q 表上，再取回最新的 Q 表。
+        最近 10 轮的平均行数达到 target_lines 时停止分配新的训练轮次。有 actor 进程异常退出时停止训练并抛出 RuntimeError
+        """
+        memory = shared_memory.SharedMemory(create=True, size=self.Q.nbytes)
+        shared_Q = np.ndarray(self.Q.shape, dtype=self.Q.dtype, buffer=memory.buf)
+        shared_Q[:] = self.Q
+        lock = multiprocessing.Lock()
+        next_episode = multiprocessing.Value('i', self.epoch + 1)
+        stop = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        start_epoch = self.epoch
+        start_alpha = self.alpha
+        processes = [multiprocessing.Process(target=runActor, args=(worker, memory.name, self.Q.shape, lock, next_episode, stop, results, self.repeat_num, start_epoch, start_alpha, sync_interval, self.bitboard, seed, self.sparse, self.symmetry is not None)) for worker in range(workers)]
+        for process in processes:
+            process.start()
+        start_time = time.time()
+        finished = 0
+        try:
+            while finished < workers:
+                try:
+                    result = results.get(timeout=1)
+                except queue.Empty:
+                    checkActors(processes)
+                    continue
+                if result is None:
+                    finished += 1
+                    continue
+                (episode, lines_num) = result
+                self.epoch += 1
+                self.alpha = start_alpha * 0.5**(self.epoch//100 - start_epoch//100)
+                self.record.append(lines_num)
+                print("Epoch:"+str(self.epoch)+"/"+str(self.repeat_num)+"   Episode:"+str(episode)+"   Lines:"+str(lines_num)+"   Time:"+format(time.time()-start_time, ".1f")+"s")
+                if target_lines is not None and len(self.record) >= 10 and np.mean(self.record[-10:]) >= target_lines:
+                    stop.set()
+                if self.epoch % checkpoint_interval == 0:
+                    with lock:
+                        self.Q = np.array(shared_Q)
+                    self.saveCheckpoint()
+        finally:
+            stop.set()
+            for process in processes:
+                process.join(timeout=None if finished == workers else 1)
+                if process.is_alive():
+                    process.terminate()
+            self.Q = np.array(shared_Q)
+            del shared_Q
+            memory.close()
+            memory.unlink()
+        checkActors(processes)
+        self.saveCheckpoint()
+        np.save('record_QL.npy', {"record": self.record})
+
+
+class QLearningActor(QLearning):
+    """
+    在 Q 表的本地副本上训练，并定期与共享内存中的 Q 表同步
+    """
+    def __init__(self, shared_Q, lock, sync_interval, bitboard, rng, sparse=False, symmetric=False):
+        super(QLearningActor, self).__init__(bitboard, rng, sparse, symmetric)
+        self.shared_Q = shared_Q
+        self.lock = lock
+        self.sync_interval = sync_interval
+        self.Q = np.array(shared_Q)
+        self.delta = {}
+        self.steps = 0
+
+    def updateQ(self, index, delta):
+        self.Q[index] += delta
+        self.delta[index] = self.delta.get(index, 0) + delta
+        self.steps += 1
+        if self.steps % self.sync_interval == 0:
+            self.sync()
+
+    def sync(self):
+        with self.lock:
+            for (index, delta) in self.delta.items():
+                self.shared_Q[index] += delta
+            self.Q[:] = self.shared_Q
+        self.delta = {}
+
+
+def runActor(worker, memory_name, shape, lock, next_episode, stop, results, repeat_num, start_epoch, start_alpha, sync_interval, bitboard, seed, sparse, symmetric):
+    """
+    actor 进程的入口。无论正常结束还是出现异常，都会关闭共享内存并发送 None 通知主进程，异常仍然使进程以非 0 的 exitcode 退出
+    """
+    memory = shared_memory.SharedMemory(name=memory_name)
+    try:
+        shared_Q = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+        actor = QLearningActor(shared_Q, lock, sync_interval, bitboard, random.Random(seed * 1000 + worker), sparse, symmetric)
+        while not stop.is_set():
+            with next_episode.get_lock():
+                episode = next_episode.value
+                next_episode.value += 1
+            if episode > repeat_num:
+                break
+            actor.alpha = start_alpha * 0.5**((episode - 1)//100 - start_epoch//100)
+            actor.trainEpisode()
+            actor.sync()
+            results.put((episode, actor.lines_num))
+    finally:
+        # 出现异常时 traceback 仍引用着本帧，需要先释放指向共享内存的数组才能关闭
+        actor = shared_Q = None
+        memory.close()
+        results.put(None)
+
+
+def checkActors(processes):
+    """
+    有已经退出且 exitcode 不为 0 的 actor 进程时抛出 RuntimeError
+    """
+    for (worker, process) in enumerate(processes):
+        if not process.is_alive() and process.exitcode not in (0, None):
+            raise RuntimeError("actor " + str(worker) + " exited with code " + str(process.exitcode))
+
+
+def checkSymmetry(ql, boards=200, seed=0, max_height=8):
+    """
+    自检：在随机生成的各列高度的井中，对每种方块比较原局面与左右镜像局面下 getBestAction 选出的放置方法。
+    镜像局面下选出的放置方法应当是原放置方法的镜像（局面自身对称时可以是与它等价的放置方法），
+    并且按 Canonicalizer 换算的镜像放置方法落定的小方格恰好是原小方格的镜像。返回不一致的次数
+    """
+    symmetry = ql.symmetry if ql.symmetry is not None else Canonicalizer(ql.field_width, base)
+    rng = random.Random(seed)
+    board = ql.board if hasattr(ql, "board") else None
+    mismatches = 0
+
+    def getCells(field_map, block_type, action):
+        layout = Blocks_layout[block_type][action[1]]
+        y0 = getGeometry(layout).getLanding(action[0], getColumnTops(ql.field_width, ql.field_height, field_map))
+        return {(action[0] + x, y0 + y) for (x, y) in layout}
+
+    for _ in range(boards):
+        heights = [rng.randint(0, max_height) for _ in range(ql.field_width)]
+        field_map = [[Brick_base if y >= ql.field_height - heights[x] else 0 for x in range(ql.field_width)] for y in range(ql.field_height)]
+        mirror_map = [lows[::-1] for lows in field_map]
+        state = getStateIndex(ql.field_width, ql.field_height, field_map)
+        for block_type in range(7):
+            ql.board = field_map
+            action = ql.getBestAction(Block(ql.field_width, ql.field_height, block_type, 0, (0, -4)))
+            ql.board = mirror_map
+            mirror_action = ql.getBestAction(Block(ql.field_width, ql.field_height, Mirror_type[block_type], 0, (0, -4)))
+            if action is None or mirror_action is None:
+                mismatches += (action is None) != (mirror_action is None)
+                continue
+            expected = symmetry.getMirrorAction(block_type, action[0], action[1])
+            cells = {(ql.field_width - 1 - x, y) for (x, y) in getCells(field_map, block_type, action)}
+            if getCells(mirror_map, Mirror_type[block_type], expected) != cells:
+                mismatches += 1
+            elif mirror_action != expected and not (symmetry.is_symmetric[state][block_type] and symmetry.getIndex(state, block_type, action[0], action[1]) == symmetry.getIndex(state, block_type, mirror_action[0], mirror_action[1])):
+                mismatches += 1
+    ql.board = board
+    return mismatches
+
+
+def checkRewardSymmetry(boards=200, seed=0, max_height=8):
+    """
+    自检：在随机生成的带空洞的 sub_well 列的井中，对每种方块的每个放置方法比较原局面与左右镜像局面下（按 Canonicalizer 换算镜像放置方法）
+    getReward 的值。奖励与镜像无关时 symmetric 合并的 Q 表才与未合并的 Q 表等价。返回不一致的次数
+    """
+    (field_width, field_height) = (sub_well, 20)
+    symmetry = Canonicalizer(field_width, base)
+    rng = random.Random(seed)
+    mismatches = 0
+
+    def getPlacedReward(field_map, block_type, action):
+        field_map = [lows[:] for lows in field_map]
+        block = Block(field_width, field_height, block_type, action[1], (0, -4))
+        if not block.drop(action[0], action[1], field_map):
+            return None
+        tops = [next((y for y in range(field_height) if field_map[y][x] != 0), field_height) for x in range(field_width)]
+        return getReward(field_height, field_map, tops, block)
+
+    for _ in range(boards):
+        heights = [rng.randint(0, max_height) for _ in range(field_width)]
+        field_map = [[Brick_base if y >= field_height - heights[x] and (y == field_height - heights[x] or rng.random() < 0.7) else 0 for x in range(field_width)] for y in range(field_height)]
+        mirror_map = [lows[::-1] for lows in field_map]
+        for block_type in range(7):
+            for (direction, layout) in enumerate(Blocks_layout[block_type]):
+                for x in getAllLocations(field_width, layout):
+                    reward = getPlacedReward(field_map, block_type, (x, direction))
+                    mirror_reward = getPlacedReward(mirror_map, Mirror_type[block_type], symmetry.getMirrorAction(block_type, x, direction))
+                    if (reward is None) != (mirror_reward is None) or (reward is not None and not np.isclose(reward, mirror_reward)):
+                        mismatches += 1
+    return mismatches
 
 
 class QLGame(Game):
-    def __init__(self):
-        super(QLGame, self).__init__(10, 20)
-        self.Q = np.load('QL.npy', allow_pickle=True).item()
+    """
+    在 10 列的游戏区域中使用 sub_well 列的 Q 表：对每个宽度为 sub_well 的子区域分别查表，选出 Q 值最大的放置方法。
+    rng 与 sequence 的含义与 Game 相同，path 为 Q 表文件，可以是未压缩的或按镜像压缩的 Q 表
+    """
+    def __init__(self, rng=None, sequence=None, path='QL.npy'):
+        super(QLGame, self).__init__(10, 20, False, rng, sequence)
+        self.Q = loadQTable(path)
+        self.symmetry = Canonicalizer(sub_well, base) if self.Q.ndim == 3 else None
         self.col = 0
 
     def checkEvents(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit(0)
+        self.renderer.checkQuit()
 
     def getBlock(self, block):
-        for x in range(len(Blocks_color)):
-            if block.color == Blocks_color[x]:
-                return x
+        return block.block_type
 
     def cutFieldMap(self, position):
         new_field_map = [[0]*sub_well for _ in range(self.field_height)]
@@ -206,19 +522,20 @@ class QLGame(Game):
 
     def getAllActions(self, field_width, field_height, block, field_map, init_pos):
         actions = {}
+        tops = getColumnTops(field_width, field_height, field_map)
         for direction in range(len(block.layouts)):
             for x in getAllPossibleLocation(field_width, field_map, block, block.layouts[direction]):
-                y = findBottomPosition(field_map, block, x, block.layouts[direction])
+                y = findBottomPosition(field_map, block, x, block.layouts[direction], tops)
                 if dropBlock(field_height, field_map, x, y, block.layouts[direction]):
                     block_type = self.getBlock(block)
                     state = getStateIndex(field_width, field_height, field_map)
-                    actions[(x + init_pos, direction)] = self.Q[((state, block_type), (x, direction))]
+                    actions[(x + init_pos, direction)] = self.Q[getQIndex(self.symmetry, state, block_type, (x, direction))]
                     resetMap(field_width, field_height, field_map)
         return actions
 
     def getBestAction(self):
         actions = {}
-        cur_block = Block(self.block_factory.cur_block.screen, sub_well, self.field_height, self.block_factory.cur_block.layouts, self.block_factory.cur_block.direction, self.block_factory.cur_block.color, (0, -4))
+        cur_block = Block(sub_well, self.field_height, self.block_factory.cur_block.block_type, self.block_factory.cur_block.direction, (0, -4))
         for x in range(self.field_width - sub_well + 1):
             loc_actions = self.getAllActions(sub_well, self.field_height, cur_block, self.cutFieldMap(x), x)
             for k, v in loc_actions.items():
@@ -243,11 +560,35 @@ class QLGame(Game):
             self.draw()
         return self.lines_num
 
+    def startWithoutGUI(self, max_pieces=None):
+        """
+        不显示界面运行一局游戏，max_pieces 限制本局最多放置的方块数
+        """
+        self.initialize()
+        self.pieces_num = 0
+        while not self.block_factory.is_failed and (max_pieces is None or self.pieces_num < max_pieces):
+            action = self.getBestAction()
+            if action == None:
+                break
+            self.block_factory.drop(action[0], action[1], self.field_map)
+            self.update()
+            self.pieces_num += 1
+        return self.lines_num
+
 
 
-if __name__ == '__main__':
+def main():
+    parser = argparse.ArgumentParser(description="Train the Q-learning agent, then watch it play with the learned table")
+    parser.add_argument("--resume", action="store_true", help="continue from QL_checkpoint.json instead of training from scratch")
+    args = parser.parse_args()
+
     train = QLearning()
-    train.train()
-    
+    train.train(resume=args.resume)
+    #train.trainParallel(workers=4, sync_interval=100)
+
     game = QLGame()
     game.start()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+使用进程池并行运行多局相互独立、固定随机种子的 Pierre Dellacherie 无界面游戏，
+每局结束后立即返回结果，全部结束（或被中断）后输出统计信息
+"""
+
+import argparse
+import multiprocessing
+import random
+import signal
+import time
+import numpy as np
+from PierreDellacherie import AIGame, Default_A
+
+
+
+def initializeWorker():
+    """
+    子进程忽略 Ctrl-C，由主进程统一终止进程池
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def playGame(task):
+    (index, seed, A, max_pieces, bitboard, batch) = task
+    game = AIGame(bitboard, batch, random.Random(seed))
+    start_time = time.time()
+    game.startWithoutGUI(A, max_pieces, verbose=False)
+    return {"index": index,
+            "seed": seed,
+            "lines": game.lines_num,
+            "score": game.score,
+            "pieces": game.pieces_num,
+            "time": time.time() - start_time,
+            "capped": max_pieces is not None and game.pieces_num >= max_pieces}
+
+
+def runGames(A, games, seed=0, max_pieces=None, processes=None, bitboard=True, batch=False):
+    """
+    第 i 局使用随机种子 seed + i。按完成顺序逐局返回结果；调用方停止迭代或按下 Ctrl-C 时会终止所有未完成的游戏
+    """
+    tasks = [(i, seed + i, A, max_pieces, bitboard, batch) for i in range(games)]
+    pool = multiprocessing.Pool(processes, initializeWorker)
+    try:
+        for result in pool.imap_unordered(playGame, tasks):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def summarize(results, wall_time):
+    if len(results) == 0:
+        return {"games": 0}
+    lines = np.array([result["lines"] for result in results])
+    pieces = sum(result["pieces"] for result in results)
+    return {"games": len(results),
+            "capped": sum(result["capped"] for result in results),
+            "lines_mean": float(np.mean(lines)),
+            "lines_std": float(np.std(lines)),
+            "lines_min": int(np.min(lines)),
+            "lines_p10": float(np.percentile(lines, 10)),
+            "lines_p25": float(np.percentile(lines, 25)),
+            "lines_median": float(np.median(lines)),
+            "lines_p75": float(np.percentile(lines, 75)),
+            "lines_p90": float(np.percentile(lines, 90)),
+            "lines_max": int(np.max(lines)),
+            "score_mean": float(np.mean([result["score"] for result in results])),
+            "pieces": pieces,
+            "wall_time": wall_time,
+            "pieces_per_second": pieces / wall_time if wall_time > 0 else 0.0}
+
+
+def printSummary(summary):
+    if summary["games"] == 0:
+        print("No finished games")
+        return
+    print("Games: " + str(summary["games"]) + " (capped: " + str(summary["capped"]) + ")")
+    print("Lines: mean " + format(summary["lines_mean"], ".1f") + "  std " + format(summary["lines_std"], ".1f") + "  median " + format(summary["lines_median"], ".1f"))
+    print("Lines percentiles: min " + str(summary["lines_min"]) + "  p10 " + format(summary["lines_p10"], ".1f") + "  p25 " + format(summary["lines_p25"], ".1f") + "  p75 " + format(summary["lines_p75"], ".1f") + "  p90 " + format(summary["lines_p90"], ".1f") + "  max " + str(summary["lines_max"]))
+    print("Score: mean " + format(summary["score_mean"], ".1f"))
+    print("Pieces: " + str(summary["pieces"]) + " in " + format(summary["wall_time"], ".2f") + "s (" + format(summary["pieces_per_second"], ".0f") + " pieces/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many headless Pierre Dellacherie games in parallel")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--processes", type=int, default=None, help="number of worker processes, defaults to the number of CPUs")
+    parser.add_argument("--seed", type=int, default=0, help="game i uses seed + i")
+    parser.add_argument("--max-pieces", type=int, default=None, help="stop each game after this many pieces")
+    parser.add_argument("--weights", type=float, nargs=6, default=Default_A, metavar="A", help="the six Dellacherie coefficients")
+    parser.add_argument("--list-board", action="store_true", help="use the list-of-lists field_map instead of BitBoard")
+    parser.add_argument("--batch", action="store_true", help="use the NumPy batch evaluator")
+    args = parser.parse_args()
+
+    results = []
+    start_time = time.time()
+    try:
+        for result in runGames(args.weights, args.games, args.seed, args.max_pieces, args.processes, not args.list_board, args.batch):
+            results.append(result)
+            print("Game " + str(len(results)) + "/" + str(args.games) + "  seed " + str(result["seed"]) + "  lines " + str(result["lines"]) + "  score " + str(result["score"]) + "  pieces " + str(result["pieces"]) + "  time " + format(result["time"], ".2f") + "s" + ("  (capped)" if result["capped"] else ""), flush=True)
+    except KeyboardInterrupt:
+        print("Cancelled after " + str(len(results)) + " games")
+    printSummary(summarize(results, time.time() - start_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""
+游戏引擎与两种算法的基准测试。所有方块序列和游戏区域都由固定的随机种子生成，
+结果写入 JSON 文件，可以与之前保存的基线结果对比以发现性能退化
+"""
+
+import argparse
+import json
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+import numpy as np
+from game import *
+from bitboard import BitBoard
+from geometry import getColumnTops
+from PierreDellacherie import AI, AIGame, PierreDellacherieBatch, EvaluationCache, Default_A
+from QLearning import QLearning
+
+
+
+def getSequence(seed, length):
+    """
+    由固定随机种子的 7-bag 生成长度为 length 的 (block_type, direction) 方块序列
+    """
+    factory = BlockFactory(10, 20, random.Random(seed))
+    sequence = [(factory.cur_block.block_type, factory.cur_block.direction), (factory.next_block.block_type, factory.next_block.direction)]
+    while len(sequence) < length:
+        block = factory.choose()
+        sequence.append((block.block_type, block.direction))
+    return sequence[:length]
+
+
+def getFieldMap(seed, height, field_width=10, field_height=20, bitboard=False, full_lines=0):
+    """
+    生成底部 height 行有小方格的游戏区域，每行随机留一个空格，其中最底部的 full_lines 行为满行
+    """
+    rng = random.Random(seed)
+    field_map = [[0] * field_width for _ in range(field_height)]
+    for y in range(field_height - height, field_height):
+        hole = rng.randrange(field_width) if y < field_height - full_lines else -1
+        for x in range(field_width):
+            if x != hole:
+                field_map[y][x] = Brick_base + rng.randrange(7)
+    if bitboard:
+        return BitBoard(field_width, field_height, [sum(1 << x for x in range(field_width) if field_map[y][x] != 0) for y in range(field_height)])
+    return field_map
+
+
+def getCandidates(ai, block, field_map):
+    candidates = []
+    tops = getColumnTops(ai.field_width, ai.field_height, field_map)
+    for direction in range(len(block.layouts)):
+        for x in ai.getAllPossibleLocation(block, block.layouts[direction], field_map):
+            y = ai.findBottomPosition(block, x, block.layouts[direction], field_map, tops)
+            if all(y + dy >= 0 for (dx, dy) in block.layouts[direction]):
+                candidates.append(((x, y), block.layouts[direction]))
+    return candidates
+
+
+def benchIsLegal(seed, calls):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(calls):
+        layouts = Blocks_layout[rng.randrange(7)]
+        queries.append((layouts[rng.randrange(len(layouts))], (rng.randrange(-1, 10), rng.randrange(-4, 20))))
+    result = {}
+    for (name, bitboard) in (("list", False), ("bitboard", True)):
+        field_map = getFieldMap(seed, 8, bitboard=bitboard)
+        block = Block(10, 20, 0, 0, (3, -4))
+        start_time = time.perf_counter()
+        for (layout, position) in queries:
+            block.isLegal(layout, position, field_map)
+        result[name + "_calls_per_s"] = calls / (time.perf_counter() - start_time)
+    return result
+
+
+def benchEvaluate(seed, boards):
+    result = {}
+    for (name, bitboard) in (("list", False), ("bitboard", True)):
+        ai = AI(10, 20, Default_A)
+        elapsed = 0
+        count = 0
+        for i in range(boards):
+            field_map = getFieldMap(seed + i, 4 + i % 10, bitboard=bitboard)
+            block = Block(10, 20, i % 7, 0, (3, -4))
+            for (position, layout) in getCandidates(ai, block, field_map):
+                ai.dropBlock(position[0], position[1], layout, field_map)
+                start_time = time.perf_counter()
+                ai.evaluation.evaluate(position, layout, field_map)
+                elapsed += time.perf_counter() - start_time
+                count += 1
+                ai.resetMap(field_map)
+        result[name + "_evaluate_us"] = elapsed / count * 1e6
+    batch = PierreDellacherieBatch(10, 20, Default_A)
+    elapsed = 0
+    for i in range(boards):
+        field_map = getFieldMap(seed + i, 4 + i % 10)
+        candidates = getCandidates(AI(10, 20, Default_A), Block(10, 20, i % 7, 0, (3, -4)), field_map)
+        start_time = time.perf_counter()
+        batch.evaluate(candidates, field_map)
+        elapsed += time.perf_counter() - start_time
+    result["batch_evaluate_all_us"] = elapsed / boards * 1e6
+    return result
+
+
+def benchAI(seed, pieces):
+    result = {}
+    sequence = getSequence(seed, pieces + 1)
+    for (name, bitboard, batch) in (("list", False, False), ("bitboard", True, False), ("batch", False, True)):
+        game = AIGame(bitboard, batch, random.Random(seed), sequence)
+        start_time = time.perf_counter()
+        game.startWithoutGUI(Default_A, pieces, verbose=False)
+        elapsed = time.perf_counter() - start_time
+        result[name + "_moves_per_s"] = game.pieces_num / elapsed
+        result[name + "_lines"] = game.lines_num
+    return result
+
+
+def benchLookahead(seed, pieces):
+    """
+    每一步决策的延迟（毫秒），包括贪心算法与不同束宽的两步束搜索
+    """
+    result = {}
+    sequence = getSequence(seed, pieces + 1)
+    for (name, depth, beam_width) in (("greedy", 1, 1), ("beam1", 2, 1), ("beam5", 2, 5), ("beam34", 2, 34)):
+        game = AIGame(True, False, random.Random(seed), sequence, EvaluationCache(), depth, beam_width)
+        game.initialize()
+        ai = game.getAI(Default_A)
+        latencies = []
+        while not game.block_factory.is_failed and len(latencies) < pieces:
+            start_time = time.perf_counter()
+            if not ai.ai(game.block_factory.cur_block, game.field_map, game.stats, [game.block_factory.next_block]):
+                break
+            latencies.append(time.perf_counter() - start_time)
+            game.update()
+        result[name + "_p50_ms"] = float(np.percentile(latencies, 50)) * 1000
+        result[name + "_p95_ms"] = float(np.percentile(latencies, 95)) * 1000
+    return result
+
+
+def benchEliminateLines(seed, repeats):
+    result = {}
+    for height in (4, 8, 12, 16):
+        for (name, bitboard) in (("list", False), ("bitboard", True)):
+            game = Game(10, 20, bitboard)
+            game.initialize()
+            field_maps = [getFieldMap(seed, height, bitboard=bitboard, full_lines=1) for _ in range(repeats)]
+            start_time = time.perf_counter()
+            for field_map in field_maps:
+                game.field_map = field_map
+                game.eliminateLines()
+            result[name + "_height" + str(height) + "_us"] = (time.perf_counter() - start_time) / repeats * 1e6
+    return result
+
+
+def benchQLearning(seed, steps):
+    start_time = time.perf_counter()
+    QLearning()
+    result = {"init_s": time.perf_counter() - start_time}
+    for (name, bitboard, sparse) in (("list", False, False), ("bitboard", True, False), ("sparse", False, True)):
+        train = QLearning(bitboard, random.Random(seed), sparse=sparse)
+        start_time = time.perf_counter()
+        done = train.trainEpisode(steps)
+        result[name + "_steps_per_s"] = done / (time.perf_counter() - start_time)
+    return result
+
+
+def benchMemory(seed, pieces):
+    """
+    使用 tracemalloc 统计 Python 对象占用内存的峰值，单位为 KB
+    """
+    result = {}
+    tracemalloc.start()
+    train = QLearning(True, random.Random(seed), sparse=False)
+    result["qlearning_table_peak_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+    del train
+    for (name, bitboard) in (("list", False), ("bitboard", True)):
+        tracemalloc.reset_peak()
+        AIGame(bitboard, False, random.Random(seed)).startWithoutGUI(Default_A, pieces, verbose=False)
+        result[name + "_game_peak_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    result["process_max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def isHigherBetter(metric):
+    return metric.endswith("_per_s")
+
+
+def compare(results, baseline, threshold):
+    """
+    逐项输出与基线的比值，变差超过 threshold 的项标记为 REGRESSION，返回退化的项数
+    """
+    regressions = 0
+    for (bench, metrics) in results.items():
+        for (metric, value) in metrics.items():
+            if bench not in baseline or metric not in baseline[bench] or metric.endswith("_lines"):
+                continue
+            old = baseline[bench][metric]
+            ratio = value / old if old else float('inf')
+            worse = ratio < 1 - threshold if isHigherBetter(metric) else ratio > 1 + threshold
+            regressions += worse
+            print(bench + "." + metric + ": " + format(old, ".4g") + " -> " + format(value, ".4g") + "  (x" + format(ratio, ".2f") + ")" + ("  REGRESSION" if worse else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seeded benchmarks for the game engine and both agents")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="smaller workloads for a fast check")
+    parser.add_argument("--output", default="benchmark.json", help="machine-readable results")
+    parser.add_argument("--baseline", default=None, help="earlier results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change reported as a regression")
+    args = parser.parse_args()
+
+    scale = 1 if args.quick else 5
+    benchmarks = [("is_legal", benchIsLegal, 20000 * scale),
+                  ("evaluate", benchEvaluate, 4 * scale),
+                  ("ai", benchAI, 100 * scale),
+                  ("lookahead", benchLookahead, 40 * scale),
+                  ("eliminate_lines", benchEliminateLines, 200 * scale),
+                  ("qlearning_train", benchQLearning, 40 * scale),
+                  ("memory", benchMemory, 100 * scale)]
+    results = {}
+    for (name, bench, size) in benchmarks:
+        start_time = time.perf_counter()
+        results[name] = bench(args.seed, size)
+        print(name + " (" + format(time.perf_counter() - start_time, ".1f") + "s): " + ", ".join(metric + "=" + format(value, ".4g") for (metric, value) in results[name].items()), flush=True)
+
+    report = {"meta": {"seed": args.seed,
+                       "quick": args.quick,
+                       "python": sys.version.split()[0],
+                       "platform": platform.platform(),
+                       "time": time.strftime("%Y-%m-%d %H:%M:%S")},
+              "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
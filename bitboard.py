@@ -0,0 +1,190 @@
+"""
+使用整数位掩码表示游戏区域：每一行是一个整数，第 x 位为 1 表示该行第 x 列有小方格。
+碰撞检测、满行判断和消行都只需要对几行做位运算，适合无界面模式下的训练和参数搜索
+"""
+
+from gameconst import *
+
+
+
+layout_masks = {}
+
+
+def getLayoutMasks(layout):
+    """
+    计算方块某一方向下最左、最右的列偏移以及每一行对应的位掩码（以最左列为第 0 位），结果按 layout 缓存
+    """
+    if layout not in layout_masks:
+        min_x = min(x for (x, y) in layout)
+        max_x = max(x for (x, y) in layout)
+        rows = {}
+        for (x, y) in layout:
+            rows[y] = rows.get(y, 0) | (1 << (x - min_x))
+        layout_masks[layout] = (min_x, max_x, sorted(rows.items()))
+    return layout_masks[layout]
+
+
+class BitBoard():
+    def __init__(self, field_width, field_height, rows=None):
+        self.field_width = field_width
+        self.field_height = field_height
+        self.full_row = (1 << field_width) - 1
+        self.rows = rows if rows is not None else [0] * field_height
+        self.saved_rows = []
+
+    def copy(self):
+        return BitBoard(self.field_width, self.field_height, self.rows[:])
+
+    def toMap(self):
+        """
+        转换为与 Game.field_map 相同的二维列表，有小方格的位置为 1
+        """
+        return [[(row >> x) & 1 for x in range(self.field_width)] for row in self.rows]
+
+    def isLegal(self, layout, position):
+        """
+        与 Block.isLegal 的判断规则一致，其中第 0 行的小方格不参与碰撞检测
+        """
+        (x0, y0) = position
+        (min_x, max_x, masks) = getLayoutMasks(layout)
+        if x0 + min_x < 0 or x0 + max_x >= self.field_width:
+            return State.Middle
+        for (y, mask) in masks:
+            if y + y0 >= self.field_height or (y + y0 > 0 and self.rows[y + y0] & (mask << (x0 + min_x))):
+                return State.Bottom
+        return State.Success
+
+    def getAllPossibleLocation(self, layout):
+        """
+        与逐列调用 isLegal 的结果一致，列出 0 到 field_width - 1 中方块不越过左右边界的放置位置
+        """
+        (min_x, max_x, masks) = getLayoutMasks(layout)
+        return list(range(max(0, -min_x), self.field_width - max_x))
+
+    def findBottomPosition(self, layout, x0):
+        """
+        从 y=-4 开始下落，找出方块落到堆顶时的位置。最高的非空行之上不会发生碰撞，因此直接跳过这些空行
+        """
+        (min_x, max_x, masks) = getLayoutMasks(layout)
+        masks = [(y, mask << (x0 + min_x)) for (y, mask) in masks]
+        top = 1
+        while top < self.field_height and self.rows[top] == 0:
+            top += 1
+        y0 = max(-4, top - 1 - masks[-1][0])
+        while True:
+            for (y, mask) in masks:
+                if y + y0 + 1 >= self.field_height or (y + y0 + 1 > 0 and self.rows[y + y0 + 1] & mask):
+                    return y0
+            y0 += 1
+
+    def place(self, layout, position):
+        """
+        将方块写入游戏区域，若方块有部分在游戏区域上方则返回 False
+        """
+        (x0, y0) = position
+        (min_x, max_x, masks) = getLayoutMasks(layout)
+        is_inside = True
+        for (y, mask) in masks:
+            if y + y0 < 0:
+                is_inside = False
+            else:
+                self.rows[y + y0] |= mask << (x0 + min_x)
+        return is_inside
+
+    def mark(self, layout, position):
+        """
+        模拟放置方块并记录被修改的行，之后可通过 unmark 恢复
+        """
+        (x0, y0) = position
+        (min_x, max_x, masks) = getLayoutMasks(layout)
+        for (y, mask) in masks:
+            if y + y0 < 0:
+                return False
+        for (y, mask) in masks:
+            self.saved_rows.append((y + y0, self.rows[y + y0]))
+            self.rows[y + y0] |= mask << (x0 + min_x)
+        return True
+
+    def unmark(self):
+        for (y, row) in reversed(self.saved_rows):
+            self.rows[y] = row
+        self.saved_rows = []
+
+    def getCell(self, x, y):
+        return (self.rows[y] >> x) & 1
+
+    def checkLine(self, line):
+        return self.rows[line] == self.full_row
+
+    def getErodedCells(self, layout, position):
+        """
+        计算方块中处于满行的小方格数
+        """
+        (x0, y0) = position
+        cells = 0
+        for (y, mask) in getLayoutMasks(layout)[2]:
+            if 0 <= y + y0 < self.field_height and self.rows[y + y0] == self.full_row:
+                cells += mask.bit_count()
+        return cells
+
+    def eliminateLines(self):
+        rows = [row for row in self.rows if row != self.full_row]
+        lines = self.field_height - len(rows)
+        if lines:
+            self.rows = [0] * lines + rows
+        return lines
+
+    def getColumnTops(self, start=0):
+        """
+        计算每一列第 start 行及以下最上方小方格所在的行，空列为 field_height
+        """
+        tops = [self.field_height] * self.field_width
+        remaining = self.full_row
+        for y in range(start, self.field_height):
+            found = self.rows[y] & remaining
+            remaining ^= found
+            while found:
+                low = found & -found
+                tops[low.bit_length() - 1] = y
+                found ^= low
+            if not remaining:
+                break
+        return tops
+
+    def getFeatures(self):
+        """
+        一次遍历计算行变换数、列变换数、空洞数与井深和，定义与 PierreDellacherie 中的各项特征相同
+        """
+        width = self.field_width
+        full = self.full_row
+        walls = 1 | (1 << (width + 1))
+        pairs = (full << 1) | 1
+        right_wall = 1 << (width - 1)
+        rows = self.rows
+        top = 0
+        while top < self.field_height and rows[top] == 0:
+            top += 1
+        row_transitions = 2 * top
+        col_transitions = (~rows[self.field_height - 1] & full).bit_count()
+        buried_holes = 0
+        wells = 0
+        active = 0
+        depth = [0] * width
+        above = rows[top - 1] if top > 0 else rows[0]
+        for row in rows[top:]:
+            extended = (row << 1) | walls
+            row_transitions += ((extended ^ (extended >> 1)) & pairs).bit_count()
+            col_transitions += (above ^ row).bit_count()
+            buried_holes += (above & ~row).bit_count()
+            above = row
+            empty = full ^ row
+            start = empty & ((row << 1) | 1) & ((row >> 1) | right_wall) & ~active
+            active = (active & empty) | start
+            bits = active
+            while bits:
+                low = bits & -bits
+                x = low.bit_length() - 1
+                depth[x] = 1 if start & low else depth[x] + 1
+                wells += depth[x]
+                bits ^= low
+        return row_transitions, col_transitions, buried_holes, wells
@@ -0,0 +1,299 @@
+"""
+增量维护的游戏区域统计信息：每列堆顶、每行小方格数、每行与每列的变换数、空洞数以及井深和。
+方块落定时只更新它占据的行和列（井深还包括左右相邻的两列），消行时只重新扫描各列堆顶以下的部分，
+特征查询只需 O(1) 或 O(列数)，定义与 PierreDellacherie 中的各项特征相同
+"""
+
+import copy
+import random
+from bitboard import BitBoard, getLayoutMasks
+
+
+
+mask_width = [(1 << width) - 1 for width in range(64)]
+zobrist_tables = {}
+
+
+def getZobristTable(field_width, field_height, salt=0):
+    """
+    每个格子一个 64 位随机数，使用固定的随机种子生成，不同进程、不同局面的哈希值可以相互比较。
+    salt 不同的表相互独立，用于区分游戏区域中的小方格与正在放置的方块
+    """
+    if (field_width, field_height, salt) not in zobrist_tables:
+        rng = random.Random((field_width * 100003 + field_height) * 31 + salt)
+        zobrist_tables[(field_width, field_height, salt)] = [[rng.getrandbits(64) for _ in range(field_width)] for _ in range(field_height)]
+    return zobrist_tables[(field_width, field_height, salt)]
+
+
+class BoardStats():
+    def __init__(self, field_width, field_height):
+        self.field_width = field_width
+        self.field_height = field_height
+        self.board = BitBoard(field_width, field_height)
+        self.walls = 1 | (1 << (field_width + 1))
+        self.pairs = (self.board.full_row << 1) | 1
+        self.fills = [0] * field_height
+        self.row_transitions = [2] * field_height
+        self.tops = [field_height] * field_width
+        self.col_transitions = [1] * field_width
+        self.holes = [0] * field_width
+        self.wells = [0] * field_width
+        self.board_row_transitions = 2 * field_height
+        self.board_col_transitions = field_width
+        self.board_buried_holes = 0
+        self.board_wells = 0
+        self.full_rows = []
+        self.zobrist = getZobristTable(field_width, field_height)
+        self.piece_zobrist = getZobristTable(field_width, field_height, 1)
+        self.hash = 0
+
+    def copy(self):
+        stats = copy.copy(self)
+        stats.board = self.board.copy()
+        stats.fills = self.fills[:]
+        stats.row_transitions = self.row_transitions[:]
+        stats.tops = self.tops[:]
+        stats.col_transitions = self.col_transitions[:]
+        stats.holes = self.holes[:]
+        stats.wells = self.wells[:]
+        stats.full_rows = self.full_rows[:]
+        return stats
+
+    def getHash(self):
+        """
+        重新计算整个游戏区域的 Zobrist 哈希值，只需遍历非空的行
+        """
+        value = 0
+        for y in range(min(self.tops), self.field_height):
+            row = self.board.rows[y]
+            while row:
+                low = row & -row
+                value ^= self.zobrist[y][low.bit_length() - 1]
+                row ^= low
+        return value
+
+    def getPieceHash(self, layout, position):
+        """
+        方块所占格子的 Zobrist 哈希值，方块必须完全在游戏区域内
+        """
+        (x0, y0) = position
+        value = 0
+        for (x, y) in layout:
+            value ^= self.piece_zobrist[y + y0][x + x0]
+        return value
+
+    def getRowTransitions(self, row):
+        extended = (row << 1) | self.walls
+        return ((extended ^ (extended >> 1)) & self.pairs).bit_count()
+
+    def getColumnFeatures(self, x, top):
+        """
+        计算第 x 列的变换数与空洞数，top 为该列的堆顶，堆顶之上全是空格，只需扫描堆顶以下的部分
+        """
+        rows = self.board.rows
+        bit = 1 << x
+        transitions = 1 if 0 < top < self.field_height else 0
+        holes = 0
+        for y in range(top, self.field_height - 1):
+            if (rows[y] ^ rows[y + 1]) & bit:
+                transitions += 1
+                if rows[y] & bit:
+                    holes += 1
+        if not rows[self.field_height - 1] & bit:
+            transitions += 1
+        return transitions, holes
+
+    def getColumnWells(self, x, tops):
+        """
+        计算第 x 列的井深和。井只能从左右两侧都有小方格（或墙壁）的行开始，因此从相邻列堆顶中较低的一个开始扫描
+        """
+        rows = self.board.rows
+        bit = 1 << x
+        left = 1 << (x - 1) if x > 0 else 0
+        right = 1 << (x + 1) if x < self.field_width - 1 else 0
+        start = min(tops[x], max(tops[x - 1] if left else 0, tops[x + 1] if right else 0))
+        is_hole = False
+        hole_deep = 0
+        wells = 0
+        for y in range(start, self.field_height):
+            row = rows[y]
+            if row & bit:
+                is_hole = False
+                hole_deep = 0
+            elif is_hole:
+                hole_deep += 1
+                wells += hole_deep
+            elif (not left or row & left) and (not right or row & right):
+                is_hole = True
+                hole_deep = 1
+                wells += 1
+        return wells
+
+    def getMaskedFeatures(self, start, col_mask, well_mask):
+        """
+        与 BitBoard.getFeatures 相同的逐行位运算，但只从第 start 行开始，只统计 col_mask 中各列的变换数与空洞数
+        以及 well_mask 中各列的井深和。调用方需保证这些列在第 start 行之上没有小方格也没有井
+        """
+        rows = self.board.rows
+        full = self.board.full_row
+        right_wall = 1 << (self.field_width - 1)
+        col_transitions = (~rows[self.field_height - 1] & col_mask).bit_count()
+        buried_holes = 0
+        wells = 0
+        active = 0
+        depth = [0] * self.field_width
+        above = rows[start - 1] if start > 0 else rows[0]
+        for row in rows[start:]:
+            changed = (above ^ row) & col_mask
+            if changed:
+                col_transitions += changed.bit_count()
+                buried_holes += (changed & above).bit_count()
+            above = row
+            empty = full ^ row
+            begin = empty & ((row << 1) | 1) & ((row >> 1) | right_wall) & ~active & well_mask
+            active = (active & empty) | begin
+            bits = active
+            while bits:
+                low = bits & -bits
+                x = low.bit_length() - 1
+                depth[x] = 1 if begin & low else depth[x] + 1
+                wells += depth[x]
+                bits ^= low
+        return col_transitions, buried_holes, wells
+
+    def updateRow(self, y):
+        row = self.board.rows[y]
+        self.fills[y] = row.bit_count()
+        transitions = self.getRowTransitions(row)
+        self.board_row_transitions += transitions - self.row_transitions[y]
+        self.row_transitions[y] = transitions
+        if row == self.board.full_row and y not in self.full_rows:
+            self.full_rows.append(y)
+
+    def updateColumn(self, x):
+        (transitions, holes) = self.getColumnFeatures(x, self.tops[x])
+        self.board_col_transitions += transitions - self.col_transitions[x]
+        self.board_buried_holes += holes - self.holes[x]
+        self.col_transitions[x] = transitions
+        self.holes[x] = holes
+
+    def updateWells(self, x):
+        wells = self.getColumnWells(x, self.tops)
+        self.board_wells += wells - self.wells[x]
+        self.wells[x] = wells
+
+    def lock(self, layout, position):
+        """
+        方块落定时调用，位于游戏区域上方的小方格不会被记录，与 BitBoard.place 一致
+        """
+        (x0, y0) = position
+        (min_x, max_x, masks) = getLayoutMasks(layout)
+        for (x, y) in layout:
+            if y + y0 >= 0 and not (self.board.rows[y + y0] >> (x + x0)) & 1:
+                self.hash ^= self.zobrist[y + y0][x + x0]
+        self.board.place(layout, position)
+        for (y, mask) in masks:
+            if y + y0 >= 0:
+                self.updateRow(y + y0)
+        for (x, y) in layout:
+            if y + y0 >= 0 and y + y0 < self.tops[x + x0]:
+                self.tops[x + x0] = y + y0
+        for x in range(x0 + min_x, x0 + max_x + 1):
+            self.updateColumn(x)
+        for x in range(max(0, x0 + min_x - 1), min(self.field_width, x0 + max_x + 2)):
+            self.updateWells(x)
+
+    def eliminateLines(self):
+        """
+        消除 lock 时记录下的满行，返回消除的行数
+        """
+        if not self.full_rows:
+            return 0
+        lines = len(self.full_rows)
+        for y in sorted(self.full_rows, reverse=True):
+            del self.fills[y], self.row_transitions[y]
+        self.full_rows = []
+        self.board.eliminateLines()
+        self.fills[:0] = [0] * lines
+        self.row_transitions[:0] = [2] * lines
+        self.board_row_transitions = sum(self.row_transitions)
+        rows = self.board.rows
+        for x in range(self.field_width):
+            y = self.tops[x]
+            while y < self.field_height and not (rows[y] >> x) & 1:
+                y += 1
+            self.tops[x] = y
+        for x in range(self.field_width):
+            self.updateColumn(x)
+            self.updateWells(x)
+        self.hash = self.getHash()
+        return lines
+
+    def setRows(self, rows):
+        """
+        用给定的各行位掩码替换游戏区域，并重新计算所有统计信息
+        """
+        self.board.rows = rows[:]
+        self.full_rows = []
+        for y in range(self.field_height):
+            self.updateRow(y)
+        self.tops = self.board.getColumnTops()
+        for x in range(self.field_width):
+            self.updateColumn(x)
+            self.updateWells(x)
+        self.hash = self.getHash()
+
+    def getColumnTops(self, start=0):
+        """
+        每一列第 start 行及以下最上方小方格所在的行，空列为 field_height
+        """
+        if start == 0:
+            return self.tops[:]
+        tops = self.tops[:]
+        for x in range(self.field_width):
+            y = tops[x]
+            while y < start or (y < self.field_height and not (self.board.rows[y] >> x) & 1):
+                y += 1
+            tops[x] = y
+        return tops
+
+    def getFeatures(self):
+        return self.board_row_transitions, self.board_col_transitions, self.board_buried_holes, self.board_wells
+
+    def getAfterstateFeatures(self, layout, position):
+        """
+        计算方块放置在 position 之后的被消除小方格指标与四项局面特征。不消行时只重新计算方块占据的行和列，
+        会消行时在 BitBoard 副本上完整计算
+        """
+        (x0, y0) = position
+        (min_x, max_x, masks) = getLayoutMasks(layout)
+        rows = self.board.rows
+        full_row = self.board.full_row
+        for (y, mask) in masks:
+            if rows[y + y0] | (mask << (x0 + min_x)) == full_row:
+                field_map = self.board.copy()
+                field_map.place(layout, position)
+                eroded_cells = field_map.getErodedCells(layout, position)
+                return (field_map.eliminateLines() * eroded_cells,) + field_map.getFeatures()
+        row_transitions = self.board_row_transitions
+        self.board.mark(layout, position)
+        for (y, mask) in masks:
+            row_transitions += self.getRowTransitions(rows[y + y0]) - self.row_transitions[y + y0]
+        tops = self.tops[:]
+        for (x, y) in layout:
+            if y + y0 < tops[x + x0]:
+                tops[x + x0] = y + y0
+        left = max(0, x0 + min_x - 1)
+        right = min(self.field_width, x0 + max_x + 2)
+        start = self.field_height
+        for x in range(left, right):
+            neighbours = max(tops[x - 1] if x > 0 else 0, tops[x + 1] if x < self.field_width - 1 else 0)
+            start = min(start, tops[x], neighbours)
+        col_mask = mask_width[max_x - min_x + 1] << (x0 + min_x)
+        well_mask = mask_width[right - left] << left
+        (col_transitions, buried_holes, wells) = self.getMaskedFeatures(start, col_mask, well_mask)
+        col_transitions += self.board_col_transitions - sum(self.col_transitions[x0 + min_x:x0 + max_x + 1])
+        buried_holes += self.board_buried_holes - sum(self.holes[x0 + min_x:x0 + max_x + 1])
+        wells += self.board_wells - sum(self.wells[left:right])
+        self.board.unmark()
+        return 0, row_transitions, col_transitions, buried_holes, wells
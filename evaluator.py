@@ -0,0 +1,365 @@
+"""
+序贯比较多个 AI：每一轮所有仍在比较中的 AI 使用相同的随机种子（相同的方块序列）各玩一局，对每两个 AI 的行数之差
+在线更新时间一致（任意时刻查看都有效）的渐近置信序列，参考 Time-uniform central limit theory and asymptotic confidence sequences。
+某个 AI 确定比另一个差时将其淘汰，剩下的 AI 两两之差都确定小于 margin 或只剩一个时停止，否则在用完预算时停止。
+
+行数是重尾分布，每局最多放置 max_pieces 个方块，达到上限的局面视为删失：成对比较的是截断后的行数，
+另外假设游戏长度服从指数分布（每个方块以固定的概率导致游戏结束），由总行数与结束的局数估计不截断时的平均行数及其置信区间
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import random
+import time
+from statistics import NormalDist
+from batchrunner import initializeWorker
+
+
+
+class Agent():
+    """
+    kind 为 "dellacherie" 时使用系数 A（默认为 Default_A）与特征 features，为 "qlearning" 时使用 path 中的 Q 表
+    """
+    def __init__(self, name, kind="dellacherie", A=None, features=None, path=None, bitboard=True):
+        if kind not in ("dellacherie", "qlearning"):
+            raise ValueError("unknown agent kind: " + kind)
+        self.name = name
+        self.kind = kind
+        self.A = A
+        self.features = features
+        self.path = path
+        self.bitboard = bitboard
+
+    def newGame(self, seed):
+        """
+        开始一局无界面游戏，之后每次调用 move 放置一个方块
+        """
+        if self.kind == "qlearning":
+            from QLearning import QLGame
+            game = QLGame(random.Random(seed), None, self.path)
+            game.initialize()
+        else:
+            from PierreDellacherie import AIGame, Default_A
+            game = AIGame(self.bitboard, False, random.Random(seed), features=self.features)
+            game.initialize()
+            game.ai = game.getAI(self.A if self.A is not None else Default_A)
+        game.pieces_num = 0
+        return game
+
+    def move(self, game):
+        """
+        放置一个方块，游戏已经结束或没有可行的放置位置时返回 False
+        """
+        if game.block_factory.is_failed:
+            return False
+        if self.kind == "qlearning":
+            action = game.getBestAction()
+            if action == None:
+                return False
+            game.block_factory.drop(action[0], action[1], game.field_map)
+        elif not game.ai.ai(game.block_factory.cur_block, game.field_map, game.stats, [game.block_factory.next_block]):
+            return False
+        game.update()
+        game.pieces_num += 1
+        return True
+
+    def play(self, seed, max_pieces=None):
+        if self.kind == "qlearning":
+            from QLearning import QLGame
+            game = QLGame(random.Random(seed), None, self.path)
+            game.startWithoutGUI(max_pieces)
+        else:
+            from PierreDellacherie import AIGame, Default_A
+            game = AIGame(self.bitboard, False, random.Random(seed), features=self.features)
+            game.startWithoutGUI(self.A if self.A is not None else Default_A, max_pieces, verbose=False)
+        return {"lines": game.lines_num,
+                "score": game.score,
+                "pieces": game.pieces_num,
+                "capped": max_pieces is not None and game.pieces_num >= max_pieces}
+
+
+def parseAgent(spec):
+    """
+    命令行中的 AI："dellacherie"、"dellacherie:a1,a2,...[:feature1,feature2,...]" 或 "qlearning:Q 表文件"，
+    可以在前面加上 "名称=" 指定报告中的名称
+    """
+    (name, kind) = spec.split("=", 1) if "=" in spec else (spec, spec)
+    parts = kind.split(":")
+    if parts[0] == "qlearning":
+        return Agent(name, "qlearning", path=parts[1] if len(parts) > 1 else "QL.npy")
+    if parts[0] != "dellacherie":
+        raise ValueError("unknown agent: " + spec)
+    A = [float(a) for a in parts[1].split(",")] if len(parts) > 1 and parts[1] else None
+    features = parts[2].split(",") if len(parts) > 2 else None
+    return Agent(name, "dellacherie", A, features)
+
+
+def playTask(task):
+    (agent_index, agent, seed, max_pieces) = task
+    result = agent.play(seed, max_pieces)
+    result["agent"] = agent_index
+    result["seed"] = seed
+    return result
+
+
+def getChiSquareQuantile(p, k):
+    """
+    自由度为 k 的卡方分布的 p 分位数（Wilson-Hilferty 近似）
+    """
+    if k <= 0:
+        return 0.0
+    z = NormalDist().inv_cdf(p)
+    return k * max(0.0, 1 - 2 / (9 * k) + z * math.sqrt(2 / (9 * k)))**3
+
+
+class Survival():
+    """
+    一个 AI 所有对局的删失估计：结束的局数 deaths、总方块数 exposure 与总行数 lines
+    """
+    def __init__(self):
+        self.games = 0
+        self.deaths = 0
+        self.exposure = 0
+        self.lines = 0
+
+    def add(self, result):
+        self.games += 1
+        self.deaths += 0 if result["capped"] else 1
+        self.exposure += result["pieces"]
+        self.lines += result["lines"]
+
+    def getMeanLines(self):
+        """
+        平均行数 = 每个方块消除的行数 * 平均方块数 = 总行数 / 结束的局数，没有结束的局时为 inf
+        """
+        return self.lines / self.deaths if self.deaths else float('inf')
+
+    def getInterval(self, alpha):
+        """
+        由指数分布失效率的精确置信区间得到平均行数的置信区间
+        """
+        if self.exposure == 0:
+            return (0.0, float('inf'))
+        rate_low = getChiSquareQuantile(alpha / 2, 2 * self.deaths) / (2 * self.exposure)
+        rate_high = getChiSquareQuantile(1 - alpha / 2, 2 * self.deaths + 2) / (2 * self.exposure)
+        lines_per_piece = self.lines / self.exposure
+        return (lines_per_piece / rate_high, lines_per_piece / rate_low if rate_low > 0 else float('inf'))
+
+
+class PairedStats():
+    """
+    两个 AI 在相同种子下截断行数之差的在线均值与方差（Welford 算法）
+    """
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, difference):
+        self.n += 1
+        delta = difference - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (difference - self.mean)
+
+    def getVariance(self):
+        return self.m2 / self.n if self.n > 0 else 0.0
+
+    def getInterval(self, alpha, rho):
+        """
+        双侧 1 - alpha 渐近置信序列，rho 由 getRho 得到
+        """
+        if self.n == 0:
+            return (float('-inf'), float('inf'))
+        scale = self.n * self.getVariance() * rho**2 + 1
+        width = math.sqrt(2 * scale / (self.n**2 * rho**2) * math.log(math.sqrt(scale) / alpha))
+        return (self.mean - width, self.mean + width)
+
+
+def getRho(alpha, games):
+    """
+    使置信序列在第 games 局时最窄的参数
+    """
+    return math.sqrt((-2 * math.log(alpha) + math.log(-2 * math.log(alpha) + 1)) / games)
+
+
+class Race():
+    """
+    agents 为 Agent 的列表。alpha 为所有成对比较合计的错误率（Bonferroni 分配），margin 为视为相当的行数差，
+    budget 为所有 AI 合计的最大局数，每一轮使用 batch 个种子并行进行，min_games 局之前不做判断
+    """
+    def __init__(self, agents, alpha=0.05, margin=10.0, budget=1000, max_pieces=None, seed=0, processes=None, batch=None, min_games=10):
+        if len(agents) < 2:
+            raise ValueError("need at least two agents")
+        self.agents = agents
+        self.alpha = alpha
+        self.margin = margin
+        self.budget = budget
+        self.max_pieces = max_pieces
+        self.seed = seed
+        self.processes = processes
+        self.batch = batch if batch is not None else (processes or multiprocessing.cpu_count())
+        self.min_games = min_games
+        self.pair_alpha = alpha / (len(agents) * (len(agents) - 1) / 2)
+        self.rho = getRho(self.pair_alpha, max(min_games, budget // len(agents) // 2))
+        self.active = list(range(len(agents)))
+        self.eliminated = {}
+        self.survival = [Survival() for _ in agents]
+        self.pairs = {(i, j): PairedStats() for i in range(len(agents)) for j in range(i + 1, len(agents))}
+        self.rounds = 0
+        self.games = 0
+        self.stop_reason = None
+
+    def getPair(self, i, j):
+        """
+        返回 i 与 j 行数之差（i - j）的置信序列
+        """
+        if i < j:
+            return self.pairs[(i, j)].getInterval(self.pair_alpha, self.rho)
+        (low, high) = self.pairs[(j, i)].getInterval(self.pair_alpha, self.rho)
+        return (-high, -low)
+
+    def addRound(self, results):
+        """
+        results 为同一个种子下所有仍在比较中的 AI 的结果
+        """
+        lines = {}
+        for result in results:
+            if result["agent"] in self.active:
+                self.survival[result["agent"]].add(result)
+                lines[result["agent"]] = result["lines"]
+        for i in self.active:
+            for j in self.active:
+                if i < j:
+                    self.pairs[(i, j)].add(lines[i] - lines[j])
+        self.rounds += 1
+        self.games += len(results)
+
+    def update(self):
+        """
+        淘汰确定比另一个仍在比较中的 AI 差的 AI，返回是否已经可以停止
+        """
+        if self.rounds < self.min_games:
+            return False
+        for i in list(self.active):
+            for j in self.active:
+                if i != j and j not in self.eliminated and self.getPair(i, j)[1] < 0:
+                    self.eliminated[i] = (self.rounds, j)
+                    break
+        self.active = [i for i in self.active if i not in self.eliminated]
+        if len(self.active) == 1:
+            self.stop_reason = "decided"
+            return True
+        if all(-self.margin < self.getPair(i, j)[0] and self.getPair(i, j)[1] < self.margin for i in self.active for j in self.active if i < j):
+            self.stop_reason = "equivalent within margin"
+            return True
+        return False
+
+    def run(self, verbose=True):
+        pool = multiprocessing.Pool(self.processes, initializeWorker)
+        try:
+            while self.stop_reason is None:
+                if self.games + len(self.active) > self.budget:
+                    self.stop_reason = "budget"
+                    break
+                seeds = [self.seed + self.rounds + k for k in range(min(self.batch, (self.budget - self.games) // len(self.active)))]
+                tasks = [(i, self.agents[i], seed, self.max_pieces) for seed in seeds for i in self.active]
+                results = {}
+                for result in pool.imap_unordered(playTask, tasks):
+                    results.setdefault(result["seed"], []).append(result)
+                # 按种子的顺序更新，结果与进程数和完成顺序无关
+                for seed in seeds:
+                    self.addRound(results[seed])
+                    if self.update():
+                        break
+                if verbose:
+                    print("Round: " + str(self.rounds) + "   Games: " + str(self.games) + "   Active: " + ", ".join(self.agents[i].name for i in self.active), flush=True)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+        return self.getReport()
+
+    def getReport(self):
+        """
+        按排名列出每个 AI：仍在比较中的 AI 按截断行数的均值排在前面，被淘汰的 AI 按淘汰的轮数由晚到早排列
+        """
+        def getRankKey(i):
+            (eliminated_round, by) = self.eliminated.get(i, (float('inf'), None))
+            return (-eliminated_round, -self.survival[i].lines / max(self.survival[i].games, 1))
+        order = sorted(range(len(self.agents)), key=getRankKey)
+        best = order[0]
+        agents = []
+        for (rank, i) in enumerate(order):
+            survival = self.survival[i]
+            (eliminated_round, by) = self.eliminated.get(i, (None, None))
+            agents.append({"rank": rank + 1,
+                           "name": self.agents[i].name,
+                           "games": survival.games,
+                           "capped": survival.games - survival.deaths,
+                           "lines_mean": survival.lines / survival.games if survival.games else 0.0,
+                           "censored_lines_mean": survival.getMeanLines(),
+                           "censored_lines_interval": survival.getInterval(self.alpha),
+                           "difference_to_best": self.getPair(i, best) if i != best else None,
+                           "eliminated_round": eliminated_round,
+                           "eliminated_by": self.agents[by].name if by is not None else None})
+        return {"rounds": self.rounds,
+                "games": self.games,
+                "stop_reason": self.stop_reason,
+                "alpha": self.alpha,
+                "margin": self.margin,
+                "max_pieces": self.max_pieces,
+                "agents": agents}
+
+
+def compare(agent_a, agent_b, **kwargs):
+    """
+    比较两个 AI，参数与 Race 相同
+    """
+    return Race([agent_a, agent_b], **kwargs).run()
+
+
+def printReport(report):
+    print("Stopped after " + str(report["rounds"]) + " rounds, " + str(report["games"]) + " games: " + report["stop_reason"])
+    for agent in report["agents"]:
+        (low, high) = agent["censored_lines_interval"]
+        line = "#" + str(agent["rank"]) + " " + agent["name"] + "   games " + str(agent["games"]) + " (capped " + str(agent["capped"]) + ")" \
+             + "   lines " + format(agent["lines_mean"], ".1f") \
+             + "   censored estimate " + format(agent["censored_lines_mean"], ".1f") + " [" + format(low, ".1f") + ", " + format(high, ".1f") + "]"
+        if agent["difference_to_best"] is not None:
+            line += "   vs #1 [" + format(agent["difference_to_best"][0], ".1f") + ", " + format(agent["difference_to_best"][1], ".1f") + "]"
+        if agent["eliminated_round"] is not None:
+            line += "   eliminated in round " + str(agent["eliminated_round"]) + " by " + agent["eliminated_by"]
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank Tetris agents with paired seeded games and sequential confidence sequences")
+    parser.add_argument("--agent", action="append", required=True, help="[name=]dellacherie[:a1,...,a6[:features]] or [name=]qlearning[:path], repeat for each agent")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--margin", type=float, default=10.0, help="line difference below which two agents are considered equivalent")
+    parser.add_argument("--budget", type=int, default=1000, help="maximum number of games over all agents")
+    parser.add_argument("--max-pieces", type=int, default=None, help="censor each game after this many pieces")
+    parser.add_argument("--seed", type=int, default=0, help="round r uses seed + r for every agent")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--min-games", type=int, default=10)
+    parser.add_argument("--output", default=None, help="write the report as JSON")
+    args = parser.parse_args()
+
+    race = Race([parseAgent(spec) for spec in args.agent], args.alpha, args.margin, args.budget, args.max_pieces, args.seed, args.processes, min_games=args.min_games)
+    start_time = time.time()
+    try:
+        report = race.run()
+    except KeyboardInterrupt:
+        race.stop_reason = "cancelled"
+        report = race.getReport()
+    printReport(report)
+    print("Time: " + format(time.time() - start_time, ".1f") + "s")
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,360 @@
+"""
+融合的局面特征计算：每项特征由三个函数（遍历前的初始化、对每一行执行的更新以及最终结果）定义并登记在 Features 中，
+FeatureKernel 只需自上而下遍历一次方块放置并消行之后的游戏区域（每一行是一个整数位掩码），就能同时得到选中的所有特征，
+增加特征不会增加遍历次数。几项特征共用的中间结果（例如每列的堆顶）作为 Shared 只计算一次。
+
+init(scan) 返回该项的初始状态，row(scan, state) 返回处理完当前行之后的状态，result(scan, state) 返回特征值；
+每一项的状态相互独立，Shared 的当前状态通过 scan.shared[名称] 读取。scan 为 Scan，其中可以使用的属性：
+    rows、width、height、full（满行的位掩码）、walls、pairs、right_wall
+    top（最高的非空行）、y、row（当前行）、above（上一行）、empty（当前行的空格）
+    landing_height、eroded_metric（由方块的放置情况得到，不需要遍历游戏区域）
+"""
+
+import argparse
+import random
+import time
+from gameconst import *
+from bitboard import BitBoard
+
+
+
+class Shared():
+    def __init__(self, name, init, row=None, needs=()):
+        self.name = name
+        self.init = init
+        self.row = row
+        self.needs = tuple(needs)
+
+
+class Feature():
+    def __init__(self, name, result, init=None, row=None, needs=(), description=""):
+        self.name = name
+        self.result = result
+        self.init = init
+        self.row = row
+        self.needs = tuple(needs)
+        self.description = description
+
+
+Shared_values = {}
+Features = {}
+
+
+def checkPart(part, registered, callables):
+    """
+    登记前检查：名称未被占用，给出的函数均可调用，needs 中的 Shared 均已登记
+    """
+    if part.name in registered:
+        raise ValueError(part.name + " is already registered")
+    for name in callables:
+        function = getattr(part, name)
+        if function is not None and not callable(function):
+            raise TypeError(part.name + "." + name + " is not callable")
+    for name in part.needs:
+        if name not in Shared_values:
+            raise ValueError(part.name + " needs unregistered shared value " + name)
+
+
+def registerShared(shared):
+    if shared.init is None:
+        raise TypeError(shared.name + ".init is required")
+    checkPart(shared, Shared_values, ("init", "row"))
+    Shared_values[shared.name] = shared
+
+
+def registerFeature(feature):
+    if feature.result is None:
+        raise TypeError(feature.name + ".result is required")
+    checkPart(feature, Features, ("result", "init", "row"))
+    Features[feature.name] = feature
+
+
+class Scan():
+    """
+    遍历游戏区域时传给各项函数的参数，见模块说明
+    """
+    def __init__(self, rows, width, height, landing_height, eroded_metric):
+        self.rows = rows
+        self.width = width
+        self.height = height
+        self.full = (1 << width) - 1
+        self.walls = 1 | (1 << (width + 1))
+        self.pairs = (self.full << 1) | 1
+        self.right_wall = 1 << (width - 1)
+        self.landing_height = landing_height
+        self.eroded_metric = eroded_metric
+        self.top = 0
+        while self.top < height and rows[self.top] == 0:
+            self.top += 1
+        self.y = self.top
+        self.row = 0
+        self.above = rows[self.top - 1] if self.top > 0 else rows[0]
+        self.empty = 0
+        self.shared = {}
+
+
+class ColumnTops():
+    """
+    seen 为上方已经出现过小方格的列，tops 为每一列最上方小方格所在的行
+    """
+    def __init__(self, width, height):
+        self.seen = 0
+        self.tops = [height] * width
+
+
+def updateColumnTops(scan, state):
+    new = scan.row & ~state.seen
+    if new:
+        state.seen |= new
+        while new:
+            low = new & -new
+            state.tops[low.bit_length() - 1] = scan.y
+            new ^= low
+    return state
+
+
+def countRowTransitions(scan, count):
+    extended = (scan.row << 1) | scan.walls
+    return count + ((extended ^ (extended >> 1)) & scan.pairs).bit_count()
+
+
+class Wells():
+    """
+    active 为当前行中处于井内的列，depth 为每一列当前井的深度
+    """
+    def __init__(self, width):
+        self.wells = 0
+        self.active = 0
+        self.depth = [0] * width
+
+
+def updateWells(scan, state):
+    row = scan.row
+    start = scan.empty & ((row << 1) | 1) & ((row >> 1) | scan.right_wall) & ~state.active
+    state.active = (state.active & scan.empty) | start
+    bits = state.active
+    while bits:
+        low = bits & -bits
+        x = low.bit_length() - 1
+        state.depth[x] = 1 if start & low else state.depth[x] + 1
+        state.wells += state.depth[x]
+        bits ^= low
+    return state
+
+
+def getTops(scan):
+    return scan.shared["tops"].tops
+
+
+def getHoles(scan):
+    return scan.empty & scan.shared["tops"].seen
+
+
+def addHoleDepth(scan, depth):
+    bits = getHoles(scan)
+    tops = getTops(scan)
+    while bits:
+        low = bits & -bits
+        depth += scan.y - tops[low.bit_length() - 1]
+        bits ^= low
+    return depth
+
+
+def getState(scan, state):
+    return state
+
+
+def zero(scan):
+    return 0
+
+
+registerShared(Shared("tops", lambda scan: ColumnTops(scan.width, scan.height), updateColumnTops))
+
+registerFeature(Feature("landing_height", lambda scan, state: scan.landing_height,
+                        description="方块放置之后，方块重心距离游戏区域底部的距离"))
+registerFeature(Feature("eroded_piece_cells_metric", lambda scan, state: scan.eroded_metric,
+                        description="方块放置后消除的行数与当前摆放的方块中被消除的小方块的格数的乘积"))
+registerFeature(Feature("row_transitions", getState,
+                        init=lambda scan: 2 * scan.top,
+                        row=countRowTransitions,
+                        description="每一行从左往右看（两侧的墙视为小方格），有无小方格发生变化的次数之和"))
+registerFeature(Feature("col_transitions", getState,
+                        init=lambda scan: (~scan.rows[scan.height - 1] & scan.full).bit_count(),
+                        row=lambda scan, count: count + (scan.above ^ scan.row).bit_count(),
+                        description="每一列从上往下看（底部视为小方格），有无小方格发生变化的次数之和"))
+registerFeature(Feature("buried_holes", getState,
+                        init=zero,
+                        row=lambda scan, count: count + (scan.above & scan.empty).bit_count(),
+                        description="每一列中小方格正下方为空格的次数之和"))
+registerFeature(Feature("wells", lambda scan, state: state.wells,
+                        init=lambda scan: Wells(scan.width),
+                        row=updateWells,
+                        description="井从两侧都有小方格（或墙）的空格开始向下延伸到下一个小方格，井中第 k 个格子贡献深度 k"))
+registerFeature(Feature("aggregate_height", lambda scan, state: scan.width * scan.height - sum(getTops(scan)), needs=("tops",),
+                        description="各列高度之和"))
+registerFeature(Feature("max_height", lambda scan, state: scan.height - min(getTops(scan)), needs=("tops",),
+                        description="最高一列的高度"))
+registerFeature(Feature("bumpiness", lambda scan, state: sum(abs(a - b) for (a, b) in zip(getTops(scan), getTops(scan)[1:])), needs=("tops",),
+                        description="相邻两列高度差的绝对值之和"))
+registerFeature(Feature("holes", getState,
+                        init=zero,
+                        row=lambda scan, count: count + getHoles(scan).bit_count(), needs=("tops",),
+                        description="上方有小方格的空格数"))
+registerFeature(Feature("hole_depth", getState,
+                        init=zero,
+                        row=addHoleDepth, needs=("tops",),
+                        description="每个空洞到所在列堆顶的距离之和"))
+registerFeature(Feature("row_holes", getState,
+                        init=zero,
+                        row=lambda scan, count: count + 1 if getHoles(scan) else count, needs=("tops",),
+                        description="含有空洞的行数"))
+
+Dellacherie_features = ["landing_height", "eroded_piece_cells_metric", "row_transitions", "col_transitions", "buried_holes", "wells"]
+
+
+class FeatureKernel():
+    """
+    names 为 Features 中的特征名，调用 getFeatures 返回按 names 顺序排列的特征值
+    """
+    def __init__(self, names, field_width, field_height):
+        self.names = tuple(names)
+        self.field_width = field_width
+        self.field_height = field_height
+        for name in self.names:
+            if name not in Features:
+                raise ValueError("unknown feature " + name)
+        self.features = [Features[name] for name in self.names]
+        self.shared = []
+        for feature in self.features:
+            self.addShared(feature.needs)
+        self.shared_rows = [shared for shared in self.shared if shared.row is not None]
+        self.feature_rows = [(i, feature.row) for (i, feature) in enumerate(self.features) if feature.row is not None]
+
+    def addShared(self, needs):
+        for name in needs:
+            shared = Shared_values[name]
+            if shared not in self.shared:
+                self.addShared(shared.needs)
+                self.shared.append(shared)
+
+    def getFeatures(self, rows, landing_height=0, eroded_metric=0):
+        scan = Scan(rows, self.field_width, self.field_height, landing_height, eroded_metric)
+        shared_states = scan.shared
+        for shared in self.shared:
+            shared_states[shared.name] = shared.init(scan)
+        states = [feature.init(scan) if feature.init is not None else None for feature in self.features]
+        if self.shared_rows or self.feature_rows:
+            full = scan.full
+            for row in rows[scan.top:]:
+                scan.row = row
+                scan.empty = full ^ row
+                for shared in self.shared_rows:
+                    shared_states[shared.name] = shared.row(scan, shared_states[shared.name])
+                for (i, update) in self.feature_rows:
+                    states[i] = update(scan, states[i])
+                scan.above = row
+                scan.y += 1
+        return tuple(feature.result(scan, state) for (feature, state) in zip(self.features, states))
+
+    def getTimes(self, boards, repeat=3):
+        """
+        估计每项特征的开销：对 boards 中的每个局面计时，用包含全部特征的计算与去掉该项特征的计算的时间差作为这项特征的开销，
+        返回 {特征名: 每个局面的秒数}，"base" 为不计算任何特征时遍历的开销
+        """
+        def measure(kernel):
+            best = float('inf')
+            for _ in range(repeat):
+                start_time = time.perf_counter()
+                for rows in boards:
+                    kernel.getFeatures(rows)
+                best = min(best, time.perf_counter() - start_time)
+            return best / len(boards)
+        total = measure(self)
+        times = {"base": measure(FeatureKernel([], self.field_width, self.field_height)), "total": total}
+        for name in self.names:
+            times[name] = max(0.0, total - measure(FeatureKernel([other for other in self.names if other != name], self.field_width, self.field_height)))
+        return times
+
+
+kernels = {}
+
+
+def getKernel(names, field_width, field_height):
+    key = (tuple(names), field_width, field_height)
+    if key not in kernels:
+        kernels[key] = FeatureKernel(names, field_width, field_height)
+    return kernels[key]
+
+
+def getAfterstate(layout, position, field_map):
+    """
+    返回方块放置并消行之后的 BitBoard 以及被消除小方格指标。field_map 为 BitBoard，
+    或已经用 AI.dropBlock 标记了方块的二维列表
+    """
+    if type(field_map) is BitBoard:
+        board = field_map.copy()
+        board.place(layout, position)
+    else:
+        board = BitBoard(len(field_map[0]), len(field_map), [sum(1 << x for (x, brick) in enumerate(lows) if brick != 0) for lows in field_map])
+    eroded_cells = board.getErodedCells(layout, position)
+    return board, board.eliminateLines() * eroded_cells
+
+
+def checkReference(boards, field_width, field_height):
+    """
+    boards 为 (每一行的位掩码, 方块种类) 的列表。对每个局面尝试该方块的所有放置位置，比较 PierreDellacherie.initializeReference
+    逐个小方格计算的 Dellacherie 特征与 FeatureKernel 的结果，返回 (比较的次数, 不一致的次数)
+    """
+    from PierreDellacherie import AI, PierreDellacherie, Default_A
+    from game import Block
+    ai = AI(field_width, field_height, Default_A)
+    reference = PierreDellacherie(field_width, field_height, Default_A)
+    fused = PierreDellacherie(field_width, field_height, Default_A)
+    (checked, mismatches) = (0, 0)
+    for (rows, block_type) in boards:
+        field_map = [[Brick_base if (row >> x) & 1 else 0 for x in range(field_width)] for row in rows]
+        block = Block(field_width, field_height, block_type, 0, (field_width // 2 - 2, -4))
+        for (position, direction) in ai.getCandidates(block, field_map):
+            layout = block.layouts[direction]
+            if ai.dropBlock(position[0], position[1], layout, field_map):
+                reference.initializeReference(position, layout, field_map)
+                fused.initializeKernel(position, layout, field_map)
+                checked += 1
+                if (reference.landing_height, reference.eroded_piece_cells_metric, reference.board_row_transitions, reference.board_col_transitions, reference.board_buried_holes, reference.board_wells) != fused.values:
+                    mismatches += 1
+            ai.resetMap(field_map)
+    return checked, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each registered board feature inside the fused kernel")
+    parser.add_argument("--features", default=",".join(Features), help="comma separated feature names")
+    parser.add_argument("--boards", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true", help="compare the fused kernel with the cell-by-cell reference on every placement of the sampled boards")
+    args = parser.parse_args()
+
+    from PierreDellacherie import AIGame, Default_A
+    game = AIGame(True, False, random.Random(args.seed))
+    game.initialize()
+    game.ai = game.getAI(Default_A)
+    boards = []
+    while len(boards) < args.boards:
+        if game.block_factory.is_failed or not game.ai.ai(game.block_factory.cur_block, game.field_map, game.stats):
+            game.initialize()
+            continue
+        game.update()
+        boards.append((game.field_map.rows[:], game.block_factory.cur_block.block_type))
+    if args.check:
+        (checked, mismatches) = checkReference(boards, 10, 20)
+        print("Checked " + str(checked) + " placements against the reference, mismatches: " + str(mismatches))
+        return
+    boards = [rows for (rows, block_type) in boards]
+    kernel = FeatureKernel(args.features.split(","), 10, 20)
+    times = kernel.getTimes(boards)
+    for (name, seconds) in times.items():
+        print(format(name, "28s") + format(seconds * 1e6, "8.2f") + " us")
+
+
+if __name__ == '__main__':
+    main()
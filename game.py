@@ -1,64 +1,88 @@
+"""
+俄罗斯方块的游戏逻辑：游戏区域、方块、7-bag 选块策略与计分。本模块不依赖 pygame，
+无界面的训练和评估只需导入本模块；需要窗口时再由 render.py 中的 Renderer 包装游戏进行绘制。
+游戏区域 field_map 中只保存整数，落定的小方格记为 Brick_base + 方块种类，位置与颜色由渲染层按需计算
+"""
+
 import random
-import pygame
 from gameconst import *
+from bitboard import BitBoard
+from boardstats import BoardStats
+from sparseboard import SparseBoard
+from geometry import getGeometry, getColumnTops
 
 
 
-class Brick():
-    def __init__(self, screen, brick_position, brick_color):
-        self.screen = screen
-        self.position = brick_position
-        self.color = brick_color
-        self.image = pygame.Surface([Brick_size, Brick_size])
-        self.image.fill(self.color)
-
-    def setColor(self, new_color):
-        self.color = new_color
-        self.image.fill(self.color)
-
-    def draw(self):
-        self.screen.blit(self.image, (self.position[0] * Brick_size, self.position[1] * Brick_size))
-
-
 class Block():
-    def __init__(self, screen, field_width, field_height, block_layouts, block_direction, block_color, block_position):
-        self.screen = screen
+    def __init__(self, field_width, field_height, block_type, block_direction, block_position):
         self.field_width = field_width
         self.field_height = field_height
-        self.layouts = block_layouts
+        self.block_type = block_type
+        self.layouts = Blocks_layout[block_type]
         self.direction = block_direction
         self.layout = self.layouts[self.direction]
         self.position = block_position
-        self.color = block_color
         self.option = None
         self.is_stop = False
         self.is_failed = False
-        self.bricks = [Brick(self.screen, (self.position[0] + x, self.position[1] + y), self.color) for (x, y) in self.layout]
+        self.stats = None
 
     def left(self, field_map):
         new_position = (self.position[0] - 1, self.position[1])
         if not self.is_stop and self.isLegal(self.layout, new_position, field_map) is State.Success:
             self.position = new_position
-            self.refreshBircks()
 
     def right(self, field_map):
         new_position = (self.position[0] + 1, self.position[1])
         if not self.is_stop and self.isLegal(self.layout, new_position, field_map) is State.Success:
             self.position = new_position
-            self.refreshBircks()
 
     def down(self, field_map):
         new_position = (self.position[0], self.position[1] + 1)
         if not self.is_stop and self.isLegal(self.layout, new_position, field_map) is State.Success:
             self.position = new_position
-            self.refreshBircks()
         if not self.is_stop and self.isLegal(self.layout, new_position, field_map) is State.Bottom:
-            for (brick, (x, y)) in zip(self.bricks, self.layout):
+            self.lock(field_map)
+
+    def lock(self, field_map):
+        """
+        将方块落定在当前位置，有小方格位于游戏区域上方时游戏失败
+        """
+        if type(field_map) is BitBoard or type(field_map) is SparseBoard:
+            self.is_failed = not field_map.place(self.layout, self.position)
+        else:
+            for (x, y) in self.layout:
                 if self.position[1] + y < 0:
                     self.is_failed = True
                 else:
-                    field_map[self.position[1] + y][self.position[0] + x] = brick
-            self.is_stop = True
+                    field_map[self.position[1] + y][self.position[0] + x] = Brick_base + self.block_type
+        if self.stats is not None:
+            self.stats.lock(self.layout, self.position)
+        self.is_stop = True
+
+    def place(self, position, direction, field_map):
+        """
+        不经过逐步的旋转、移动和下落，直接将方块落定在 position、direction。只检查一次目标位置合法且正下方已被挡住，
+        不检查方块能否移动到该位置；落定与游戏失败的判断与逐步下落相同。返回是否放置成功
+        """
+        layout = self.layouts[direction]
+        if self.is_stop or self.isLegal(layout, position, field_map) is not State.Success or \
+           self.isLegal(layout, (position[0], position[1] + 1), field_map) is not State.Bottom:
+            return False
+        self.direction = direction
+        self.layout = layout
+        self.position = position
+        self.lock(field_map)
+        return True
+
+    def drop(self, x, direction, field_map, tops=None):
+        """
+        与先旋转、再左右移动、最后下落到底的结果相同，由每列的堆顶直接算出落点后调用 place。
+        tops 为 geometry.getColumnTops 的结果，可以用 BoardStats.getColumnTops(1) 代替
+        """
+        if tops is None:
+            tops = getColumnTops(self.field_width, self.field_height, field_map)
+        return self.place((x, getGeometry(self.layouts[direction]).getLanding(x, tops)), direction, field_map)
 
     def rotate(self, field_map):
         new_direction = (self.direction + 1) % len(self.layouts)
@@ -66,21 +90,18 @@ class Block():
         if not self.is_stop and self.isLegal(new_layout, self.position, field_map) is State.Success:
             self.direction = new_direction
             self.layout = new_layout
-            self.refreshBircks()
 
     def isLegal(self, new_layout, new_position, field_map):
+        if type(field_map) is BitBoard or type(field_map) is SparseBoard:
+            return field_map.isLegal(new_layout, new_position)
         (x0, y0) = new_position
         for (x, y) in new_layout:
             if x + x0 < 0 or x + x0 >= self.field_width:
                 return State.Middle
-            if y + y0 >= self.field_height or (y + y0 > 0 and type(field_map[y + y0][x + x0]) is Brick):
+            if y + y0 >= self.field_height or (y + y0 > 0 and field_map[y + y0][x + x0] >= Brick_base):
                 return State.Bottom
         return State.Success
 
-    def refreshBircks(self):
-        for (brick, (x, y)) in zip(self.bricks, self.layout):
-            brick.position = (self.position[0] + x, self.position[1] + y)
-
     def update(self, field_map):
         if self.option is Option.Rotate:
             self.rotate(field_map)
@@ -91,18 +112,21 @@ class Block():
         elif self.option is Option.Right:
             self.right(field_map)
 
-    def draw(self):
-        for brick in self.bricks:
-            brick.draw()
-
 
 class BlockFactory():
-    def __init__(self, screen, field_width, field_height):
-        self.screen = screen
+    """
+    rng 为随机数生成器（默认使用 random 模块），sequence 为固定的 (block_type, direction) 序列，给定时按顺序循环出块，
+    stats 为 BoardStats，给定时方块落定后会更新其中的统计信息
+    """
+    def __init__(self, field_width, field_height, rng=random, sequence=None, stats=None):
         self.field_width = field_width
         self.field_height = field_height
+        self.rng = rng
+        self.sequence = sequence
+        self.stats = stats
+        self.sequence_index = 0
         self.bag = list(range(7))
-        random.shuffle(self.bag)
+        self.rng.shuffle(self.bag)
         self.block_index = 0
         self.cur_block = self.choose()
         self.next_block = self.choose()
@@ -112,18 +136,32 @@ class BlockFactory():
         last_block = self.bag[-1]
         flag = True
         while flag:
-            random.shuffle(self.bag)
+            self.rng.shuffle(self.bag)
             flag = True if self.bag[0] == last_block else False
 
     def choose(self):
-        block_type = self.bag[self.block_index]
-        self.block_index += 1
-        if self.block_index == len(self.bag):
-            self.setBag()
-            self.block_index = 0
-        block_layouts = Blocks_layout[block_type]
-        block_direction = random.randint(0, len(block_layouts) - 1)
-        return Block(self.screen, self.field_width, self.field_height, block_layouts, block_direction, Blocks_color[block_type], (self.field_width // 2 - 2, -4))
+        if self.sequence is not None:
+            (block_type, block_direction) = self.sequence[self.sequence_index % len(self.sequence)]
+            self.sequence_index += 1
+        else:
+            block_type = self.bag[self.block_index]
+            self.block_index += 1
+            if self.block_index == len(self.bag):
+                self.setBag()
+                self.block_index = 0
+            block_direction = self.rng.randint(0, len(Blocks_layout[block_type]) - 1)
+        block = Block(self.field_width, self.field_height, block_type, block_direction, (self.field_width // 2 - 2, -4))
+        block.stats = self.stats
+        return block
+
+    def place(self, position, direction, field_map):
+        """
+        直接落定当前方块，见 Block.place。下一次 update 时换到下一个方块
+        """
+        return self.cur_block.place(position, direction, field_map)
+
+    def drop(self, x, direction, field_map, tops=None):
+        return self.cur_block.drop(x, direction, field_map, tops)
 
     def update(self, level, time, field_map):
         if self.cur_block.is_failed:
@@ -137,57 +175,46 @@ class BlockFactory():
             if time % interval == 0:
                 self.cur_block.down(field_map)
 
-    def draw(self, level, field_map):
-        self.cur_block.draw()
-        for lows in field_map:
-            for brick in lows:
-                if type(brick) is Brick:
-                    brick.setColor(Buttom_Blocks_color[level % 10])
-                    brick.draw()
-
 
 class Game():
-    def __init__(self, field_width, field_height):
+    """
+    bitboard 为 True 时使用 BitBoard 表示游戏区域；sparse 为 True 时使用只保存堆叠部分的 SparseBoard，
+    适合很高的游戏区域，此时不维护 BoardStats（stats 为 None）
+    """
+    def __init__(self, field_width, field_height, bitboard=False, rng=None, sequence=None, sparse=False):
         self.field_width = field_width
         self.field_height = field_height
+        self.bitboard = bitboard
+        self.sparse = sparse
+        self.rng = rng if rng is not None else random
+        self.sequence = sequence
 
     def initializePygame(self):
-        pygame.init()
-        pygame.display.set_caption(Game_name)
-        self.screen = pygame.display.set_mode(((self.field_width + 8) * Brick_size, self.field_height * Brick_size))
-        self.level_font = pygame.font.Font(None, Font_size)
-        self.score_font = pygame.font.Font(None, Font_size)
-        self.lines_font = pygame.font.Font(None, Font_size)
-        self.framerate = pygame.time.Clock()
-        self.frame = [Brick(self.screen, (x, y), pygame.Color(169, 169, 169)) for y in range(self.field_height) for x in range(self.field_width, self.field_width+8) if y == 0 or y == self.field_height-1 or y == 7 or x == self.field_width or x == self.field_width+7]
-        self.block_factory = BlockFactory(self.screen, self.field_width, self.field_height)
+        # 只有需要窗口时才导入渲染层，无界面运行时不会加载 pygame
+        from render import Renderer
+        self.renderer = Renderer(self)
+        self.block_factory = BlockFactory(self.field_width, self.field_height, self.rng, self.sequence, self.stats)
 
     def initialize(self):
         self.time = 0
         self.level = 0
         self.lines_num = 0
         self.score = 0
-        self.block_factory = BlockFactory(None, self.field_width, self.field_height)
-        self.field_map = [[0] * self.field_width for _ in range(self.field_height)]
+        self.stats = None if self.sparse else BoardStats(self.field_width, self.field_height)
+        self.block_factory = BlockFactory(self.field_width, self.field_height, self.rng, self.sequence, self.stats)
+        if self.sparse:
+            self.field_map = SparseBoard(self.field_width, self.field_height)
+        elif self.bitboard:
+            self.field_map = BitBoard(self.field_width, self.field_height)
+        else:
+            self.field_map = [[0] * self.field_width for _ in range(self.field_height)]
 
     def checkEvents(self, block, field_map):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit(0)
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_w or event.key == pygame.K_UP:
-                    block.rotate(field_map)
-                elif event.key == pygame.K_s or event.key == pygame.K_DOWN:
-                    block.option = Option.Down
-                elif event.key == pygame.K_a or event.key == pygame.K_LEFT:
-                    block.option = Option.Left
-                elif event.key == pygame.K_d or event.key == pygame.K_RIGHT:
-                    block.option = Option.Right
-            if event.type == pygame.KEYUP:
-                block.option = None
+        self.renderer.checkEvents(block, field_map)
 
     def checkLine(self, line):
+        if type(self.field_map) is BitBoard or type(self.field_map) is SparseBoard:
+            return self.field_map.checkLine(line)
         for brick in self.field_map[line]:
             if brick == 0:
                 return False
@@ -195,18 +222,17 @@ class Game():
 
     def eliminateLines(self):
         combo = 0
-        for y0 in list(range(self.field_height))[::-1]:
-            while self.checkLine(y0):
-                self.lines_num += 1
-                combo += 1
-                for y in list(range(y0+1))[::-1]:
-                    for x in range(self.field_width):
-                        if y == y0:
-                            self.field_map[y][x] = 0
-                        elif type(self.field_map[y][x]) is Brick:
-                            self.field_map[y][x].position = (self.field_map[y][x].position[0], self.field_map[y][x].position[1] + 1)
-                            self.field_map[y + 1][x] = self.field_map[y][x]
-                            self.field_map[y][x] = 0
+        if type(self.field_map) is BitBoard or type(self.field_map) is SparseBoard:
+            combo = self.field_map.eliminateLines()
+            self.lines_num += combo
+        else:
+            rows = [row for row in self.field_map if 0 in row]
+            combo = self.field_height - len(rows)
+            if combo:
+                self.field_map[:] = [[0] * self.field_width for _ in range(combo)] + rows
+            self.lines_num += combo
+        if self.stats is not None:
+            self.stats.eliminateLines()
         if combo == 1:
             self.score += 100
         elif combo == 2:
@@ -222,44 +248,19 @@ class Game():
         else:
             self.level = (self.lines_num - 150) // 50 + 5
 
-    def drawNextBlock(self):
-        next_block = Block(self.screen, self.field_width, self.field_height, self.block_factory.next_block.layouts, self.block_factory.next_block.direction, self.block_factory.next_block.color, (12, 3))
-        next_block.refreshBircks()
-        next_block.draw()
-
-    def drawLevelScoreLine(self):
-        level_string = "Level: " + str(self.level)
-        score_string = "Score: " + str(self.score)
-        lines_string = "Lines: " + str(self.lines_num)
-        level_image = self.level_font.render(level_string, True, pygame.Color(255, 255, 255))
-        score_image = self.score_font.render(score_string, True, pygame.Color(255, 255, 255))
-        lines_image = self.lines_font.render(lines_string, True, pygame.Color(255, 255, 255))
-        self.screen.blit(level_image, (370, 240))
-        self.screen.blit(score_image, (370, 260))
-        self.screen.blit(lines_image, (370, 280))
-
-    def drawFrame(self):
-        for brick in self.frame:
-            brick.draw()
-        self.drawLevelScoreLine()
-        self.drawNextBlock()
-
     def update(self):
         self.block_factory.update(self.level, self.time, self.field_map)
         self.eliminateLines()
         self.checkUpgrade()
 
     def draw(self):
-        self.screen.fill((0, 0, 0))
-        self.block_factory.draw(self.level, self.field_map)
-        self.drawFrame()
-        pygame.display.flip()
+        self.renderer.draw()
 
     def start(self):
         self.initialize()
         self.initializePygame()
         while not self.block_factory.is_failed:
-            self.framerate.tick(Framerate)
+            self.renderer.tick()
             self.time += 1
             self.checkEvents(self.block_factory.cur_block, self.field_map)
             self.update()
@@ -1,5 +1,4 @@
 from enum import Enum
-import pygame
 
 
 
@@ -16,6 +15,7 @@ class Option(Enum):
     Right = 3
 
 Brick_size = 30
+Brick_base = 2  # field_map 中 0 为空格，1 为 AI 模拟放置时的标记，落定的小方格记为 Brick_base + 方块种类
 Blocks_layout = [
         [((0, 0), (0, 1), (0, 2), (0, 3)),  # 长条
          ((0, 1), (1, 1), (2, 1), (3, 1))],
@@ -37,24 +37,26 @@ Blocks_layout = [
          ((2, 0), (1, 0), (1, 1), (1, 2)),
          ((2, 2), (2, 1), (1, 1), (0, 1))]]
 Blocks_color = (
-        pygame.Color(255, 0, 0),     # 长条为红色
-        pygame.Color(0, 0, 255),     # 方块为蓝色
-        pygame.Color(255, 255, 0),   # T型为黄色
-        pygame.Color(0, 255, 255),   # Z型为青色
-        pygame.Color(0, 255, 0),     # S型为绿色
-        pygame.Color(255, 165, 0),   # J型为橙色
-        pygame.Color(255, 181, 197)) # L型为粉色
+        (255, 0, 0),      # 长条为红色
+        (0, 0, 255),      # 方块为蓝色
+        (255, 255, 0),    # T型为黄色
+        (0, 255, 255),    # Z型为青色
+        (0, 255, 0),      # S型为绿色
+        (255, 165, 0),    # J型为橙色
+        (255, 181, 197))  # L型为粉色
 Buttom_Blocks_color = (
-        pygame.Color(255, 255, 255), # LV0为白色
-        pygame.Color(255, 0, 0),     # LV1为红色
-        pygame.Color(255, 255, 0),   # LV2为黄色
-        pygame.Color(0, 0, 255),     # LV3为蓝色
-        pygame.Color(255, 165, 0),   # LV4为橙色
-        pygame.Color(255, 181, 197), # LV5为粉色
-        pygame.Color(0, 255, 0),     # LV6为绿色
-        pygame.Color(0, 255, 255),   # LV7为青色
-        pygame.Color(160, 32, 240),  # LV8为紫色
-        pygame.Color(144, 238, 144)) # LV9为浅绿
+        (255, 255, 255),  # LV0为白色
+        (255, 0, 0),      # LV1为红色
+        (255, 255, 0),    # LV2为黄色
+        (0, 0, 255),      # LV3为蓝色
+        (255, 165, 0),    # LV4为橙色
+        (255, 181, 197),  # LV5为粉色
+        (0, 255, 0),      # LV6为绿色
+        (0, 255, 255),    # LV7为青色
+        (160, 32, 240),   # LV8为紫色
+        (144, 238, 144))  # LV9为浅绿
+Frame_color = (169, 169, 169)
+Text_color = (255, 255, 255)
 Blocks_speed = [30, 27, 21, 16, 12, 9, 8, 7, 6, 5, 4, 3, 2, 1]
 
 Game_name = "Tetris"
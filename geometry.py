@@ -0,0 +1,60 @@
+"""
+预先计算每种方块每个方向的几何信息：宽度、合法的放置列范围以及每一列最下方小方格的偏移。
+已知每一列的堆顶高度时，方块的落点只需要对它覆盖的至多 4 列取一次最小值，不必逐行下落检测碰撞
+"""
+
+from gameconst import *
+from bitboard import BitBoard
+from boardstats import BoardStats
+from sparseboard import SparseBoard
+
+
+
+class Geometry():
+    def __init__(self, layout):
+        self.layout = layout
+        self.min_x = min(x for (x, y) in layout)
+        self.max_x = max(x for (x, y) in layout)
+        self.width = self.max_x - self.min_x + 1
+        bottoms = {}
+        for (x, y) in layout:
+            bottoms[x] = max(bottoms.get(x, y), y)
+        self.bottoms = tuple(sorted(bottoms.items()))
+
+    def getLegalRange(self, field_width):
+        """
+        与逐列调用 Block.isLegal 的结果一致，列出 0 到 field_width - 1 中方块不越过左右边界的放置位置
+        """
+        return range(max(0, -self.min_x), field_width - self.max_x)
+
+    def getLanding(self, x0, tops):
+        """
+        根据 getColumnTops 得到的每列堆顶计算方块从上方竖直下落后停住的位置 y
+        """
+        return min(tops[x0 + x] - y for (x, y) in self.bottoms) - 1
+
+
+Blocks_geometry = [[Geometry(layout) for layout in layouts] for layouts in Blocks_layout]
+layout_geometry = {geometry.layout: geometry for geometries in Blocks_geometry for geometry in geometries}
+
+
+def getGeometry(layout):
+    if layout not in layout_geometry:
+        layout_geometry[layout] = Geometry(layout)
+    return layout_geometry[layout]
+
+
+def getColumnTops(field_width, field_height, field_map):
+    """
+    计算每一列第 1 行及以下最上方小方格所在的行，空列为 field_height。
+    与 Block.isLegal 一致，第 0 行的小方格不参与碰撞检测，因此也不计入堆顶
+    """
+    if type(field_map) is BitBoard or type(field_map) is BoardStats or type(field_map) is SparseBoard:
+        return field_map.getColumnTops(1)
+    tops = [field_height] * field_width
+    for x in range(field_width):
+        y = 1
+        while y < field_height and field_map[y][x] == 0:
+            y += 1
+        tops[x] = y
+    return tops
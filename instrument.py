@@ -0,0 +1,207 @@
+"""
+热点路径的计数与计时。未启用时不会对任何函数做包装，没有额外开销；调用 enable() 后才把下面 Hot_paths 中列出的
+方法替换为带计数或计时的版本，disable() 恢复原来的方法。计时结果保存在对数分桶的直方图中，可以估计分位数，
+并导出为 JSON 或 CSV 文件
+"""
+
+import argparse
+import csv
+import functools
+import importlib
+import json
+import random
+import time
+
+
+
+# (模块, 类, 方法, 统计方式)，"count" 只计数，"time" 同时记录每次调用的耗时
+Hot_paths = [("game", "Block", "isLegal", "count"),
+             ("bitboard", "BitBoard", "isLegal", "count"),
+             ("game", "Game", "eliminateLines", "time"),
+             ("boardstats", "BoardStats", "lock", "time"),
+             ("PierreDellacherie", "PierreDellacherie", "evaluate", "time"),
+             ("PierreDellacherie", "PierreDellacherieBatch", "evaluate", "time"),
+             ("PierreDellacherie", "AI", "ai", "time"),
+             ("PierreDellacherie", "BeamSearchAI", "ai", "time"),
+             ("QLearning", "QLearning", "getBestActionWithGreedy", "time"),
+             ("QLearning", "QLGame", "getAllActions", "time"),
+             ("QLearning", "QLGame", "getBestAction", "time")]
+
+counters = {}
+histograms = {}
+originals = {}
+
+
+class Histogram():
+    """
+    以纳秒为单位的对数分桶直方图：小于 16 ns 的值各占一个桶，之后每个 2 的幂区间再分为 8 个桶，分位数的相对误差约为 6%
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = {}
+
+    def add(self, ns):
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+        if ns < 16:
+            index = ns
+        else:
+            shift = ns.bit_length() - 4
+            index = (shift << 3) + (ns >> shift)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def getBucketValue(self, index):
+        if index < 16:
+            return index
+        (shift, mantissa) = (index // 8 - 1, index % 8 + 8)
+        return ((2 * mantissa + 1) << shift) / 2
+
+    def getPercentile(self, percent):
+        if self.count == 0:
+            return 0
+        target = percent / 100 * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= target:
+                return min(self.getBucketValue(index), self.max)
+        return self.max
+
+    def getSummary(self):
+        return {"count": self.count,
+                "total_s": self.total / 1e9,
+                "mean_us": self.total / self.count / 1e3 if self.count else 0.0,
+                "p50_us": self.getPercentile(50) / 1e3,
+                "p90_us": self.getPercentile(90) / 1e3,
+                "p99_us": self.getPercentile(99) / 1e3,
+                "max_us": self.max / 1e3}
+
+
+def wrapCount(name, function):
+    counters[name] = counters.get(name, 0)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        counters[name] += 1
+        return function(*args, **kwargs)
+    return wrapper
+
+
+def wrapTime(name, function):
+    histogram = histograms.setdefault(name, Histogram())
+    clock = time.perf_counter_ns
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start_time = clock()
+        result = function(*args, **kwargs)
+        histogram.add(clock() - start_time)
+        return result
+    return wrapper
+
+
+def enable():
+    for (module_name, class_name, method_name, kind) in Hot_paths:
+        name = class_name + "." + method_name
+        if name in originals:
+            continue
+        owner = getattr(importlib.import_module(module_name), class_name)
+        function = owner.__dict__[method_name]
+        originals[name] = (owner, method_name, function)
+        setattr(owner, method_name, wrapCount(name, function) if kind == "count" else wrapTime(name, function))
+
+
+def disable():
+    for (owner, method_name, function) in originals.values():
+        setattr(owner, method_name, function)
+    originals.clear()
+
+
+def reset():
+    for name in counters:
+        counters[name] = 0
+    for histogram in histograms.values():
+        histogram.clear()
+
+
+def getSummary():
+    summary = {}
+    for (name, count) in counters.items():
+        summary[name] = {"count": count}
+    for (name, histogram) in histograms.items():
+        summary[name] = histogram.getSummary()
+    return summary
+
+
+def printSummary(summary=None):
+    summary = getSummary() if summary is None else summary
+    for (name, values) in summary.items():
+        if values["count"] == 0:
+            continue
+        if "mean_us" in values:
+            print(name + ": " + str(values["count"]) + " calls, " + format(values["total_s"], ".3f") + "s, mean " + format(values["mean_us"], ".1f") + "us, p50 " + format(values["p50_us"], ".1f") + "us, p90 " + format(values["p90_us"], ".1f") + "us, p99 " + format(values["p99_us"], ".1f") + "us, max " + format(values["max_us"], ".1f") + "us")
+        else:
+            print(name + ": " + str(values["count"]) + " calls")
+
+
+def export(path, summary=None):
+    """
+    按文件扩展名导出为 JSON 或 CSV
+    """
+    summary = getSummary() if summary is None else summary
+    if path.endswith(".csv"):
+        fields = ["name", "count", "total_s", "mean_us", "p50_us", "p90_us", "p99_us", "max_us"]
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fields)
+            writer.writeheader()
+            for (name, values) in summary.items():
+                writer.writerow(dict(values, name=name))
+    else:
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=1)
+
+
+class Progress():
+    """
+    无界面运行时每隔 interval 秒输出一次进度，代替每放置一个方块就输出一次
+    """
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.start_time = time.perf_counter()
+        self.last_time = self.start_time
+
+    def update(self, game, force=False):
+        now = time.perf_counter()
+        if force or now - self.last_time >= self.interval:
+            self.last_time = now
+            print("\r" + "Lines: " + str(game.lines_num) + "   Pieces: " + str(game.pieces_num) + "   " + format(game.pieces_num / max(now - self.start_time, 1e-9), ".0f") + " pieces/s", end="", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an instrumented headless Dellacherie game and report hot-path timings")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-pieces", type=int, default=2000)
+    parser.add_argument("--list-board", action="store_true")
+    parser.add_argument("--depth", type=int, default=1, help="2 for beam search over the next-piece preview")
+    parser.add_argument("--output", default=None, help="write the summary to a .json or .csv file")
+    args = parser.parse_args()
+
+    from PierreDellacherie import AIGame, Default_A
+    enable()
+    game = AIGame(not args.list_board, False, random.Random(args.seed), depth=args.depth)
+    game.startWithoutGUI(Default_A, args.max_pieces)
+    disable()
+    printSummary()
+    if args.output is not None:
+        export(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+使用带噪声的交叉熵方法搜索 Pierre Dellacherie 算法的 6 个系数 A，参考论文 Learning Tetris Using the Noisy Cross-Entropy Method。
+每一代的候选系数在进程池中并行评估，同一代的所有候选使用相同的随机种子（相同的方块序列）以减小方差，
+每局游戏限制最多放置的方块数，每一代结束后原子地保存分布状态，被中断后可以继续运行
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+from batchrunner import initializeWorker, playGame
+
+
+
+class CrossEntropyOptimizer():
+    def __init__(self, population=50, elite=10, games=5, max_pieces=2000, noise=4.0, seed=0, processes=None, checkpoint="optimizer.json", bitboard=True):
+        self.population = population
+        self.elite = elite
+        self.games = games
+        self.max_pieces = max_pieces
+        self.noise = noise
+        self.seed = seed
+        self.processes = processes
+        self.checkpoint = checkpoint
+        self.bitboard = bitboard
+        self.generation = 0
+        self.mean = np.zeros(6)
+        self.std = np.full(6, 10.0)
+        self.best_A = None
+        self.best_score = float('-inf')
+        self.curve = []
+        self.rng = np.random.default_rng(seed)
+
+    def getNoise(self):
+        """
+        每一代在精英样本的方差上额外加入线性衰减的噪声，防止分布过早收敛
+        """
+        return max(self.noise - self.generation / 10, 0)
+
+    def evaluate(self, pool, candidates):
+        """
+        第 g 代的第 k 局对所有候选都使用种子 seed + g * games + k，返回每个候选的平均行数
+        """
+        seeds = [self.seed + self.generation * self.games + k for k in range(self.games)]
+        tasks = [((i, k), seeds[k], list(candidates[i]), self.max_pieces, self.bitboard, False) for i in range(len(candidates)) for k in range(self.games)]
+        lines = np.zeros((len(candidates), self.games))
+        for result in pool.imap_unordered(playGame, tasks):
+            (i, k) = result["index"]
+            lines[i, k] = result["lines"]
+        return lines.mean(axis=1)
+
+    def step(self, pool):
+        start_time = time.time()
+        candidates = self.rng.normal(self.mean, self.std, (self.population, 6))
+        scores = self.evaluate(pool, candidates)
+        elites = candidates[np.argsort(scores)[::-1][:self.elite]]
+        self.mean = elites.mean(axis=0)
+        self.std = np.sqrt(elites.var(axis=0) + self.getNoise())
+        best = int(np.argmax(scores))
+        if scores[best] > self.best_score:
+            self.best_score = float(scores[best])
+            self.best_A = candidates[best].tolist()
+        self.generation += 1
+        self.curve.append({"generation": self.generation,
+                           "mean_lines": float(scores.mean()),
+                           "elite_lines": float(np.sort(scores)[::-1][:self.elite].mean()),
+                           "best_lines": float(scores[best]),
+                           "time": time.time() - start_time})
+
+    def getConfig(self):
+        return {"population": self.population, "elite": self.elite, "games": self.games, "max_pieces": self.max_pieces, "noise": self.noise, "seed": self.seed}
+
+    def save(self):
+        """
+        先写入临时文件再替换，避免进程被杀死时留下不完整的检查点
+        """
+        state = {"generation": self.generation,
+                 "mean": self.mean.tolist(),
+                 "std": self.std.tolist(),
+                 "best_A": self.best_A,
+                 "best_score": self.best_score,
+                 "curve": self.curve,
+                 "rng": self.rng.bit_generator.state,
+                 "config": self.getConfig()}
+        temp_path = self.checkpoint + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(state, f, indent=1)
+        os.replace(temp_path, self.checkpoint)
+
+    def load(self):
+        """
+        读取检查点。检查点中的设置与当前的设置不同时抛出 ValueError：种群大小改变后分布状态与随机数序列无法接续，
+        每代局数改变后各代的种子会与之前的代重叠，学习曲线中的各代不再可比
+        """
+        with open(self.checkpoint) as f:
+            state = json.load(f)
+        config = self.getConfig()
+        different = [key + "=" + str(value) + " (checkpoint " + str(state["config"][key]) + ")" for (key, value) in config.items() if "config" in state and state["config"].get(key) != value]
+        if different:
+            raise ValueError(self.checkpoint + " was written with different settings: " + ", ".join(different))
+        self.generation = state["generation"]
+        self.mean = np.array(state["mean"])
+        self.std = np.array(state["std"])
+        self.best_A = state["best_A"]
+        self.best_score = state["best_score"]
+        self.curve = state["curve"]
+        self.rng.bit_generator.state = state["rng"]
+
+    def run(self, generations):
+        pool = multiprocessing.Pool(self.processes, initializeWorker)
+        try:
+            while self.generation < generations:
+                self.step(pool)
+                self.save()
+                point = self.curve[-1]
+                print("Generation: " + str(point["generation"]) + "/" + str(generations) + "   Mean: " + format(point["mean_lines"], ".1f") + "   Elite: " + format(point["elite_lines"], ".1f") + "   Best: " + format(point["best_lines"], ".1f") + "   Time: " + format(point["time"], ".1f") + "s", flush=True)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+        return self.best_A
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the Dellacherie coefficients with the noisy cross-entropy method")
+    parser.add_argument("--generations", type=int, default=50)
+    parser.add_argument("--population", type=int, default=50)
+    parser.add_argument("--elite", type=int, default=10)
+    parser.add_argument("--games", type=int, default=5, help="games per candidate, shared by every candidate of a generation")
+    parser.add_argument("--max-pieces", type=int, default=2000, help="stop each game after this many pieces")
+    parser.add_argument("--noise", type=float, default=4.0, help="extra variance added in generation 0, decreasing by 0.1 per generation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--checkpoint", default="optimizer.json")
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint file")
+    args = parser.parse_args()
+
+    optimizer = CrossEntropyOptimizer(args.population, args.elite, args.games, args.max_pieces, args.noise, args.seed, args.processes, args.checkpoint)
+    if args.resume and os.path.exists(args.checkpoint):
+        optimizer.load()
+    try:
+        optimizer.run(args.generations)
+    except KeyboardInterrupt:
+        print("Interrupted at generation " + str(optimizer.generation) + ", resume with --resume")
+    print("Mean A: " + str(optimizer.mean.tolist()))
+    print("Best A: " + str(optimizer.best_A) + "   Lines: " + str(optimizer.best_score))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+基于可达性的走法生成：按 Block 的真实移动规则（顺时针旋转、左右移动一格、下落一格）在 (方向, y, 列) 状态上搜索，
+找出方块从出现的位置能够到达的所有落定位置，包括在悬空的小方格下方横移或旋转塞入的位置。
+每种方块的移动信息预先计算并缓存；每一行中方块的合法位置用一个位掩码表示，同一行内的左右移动与旋转用位运算扩展，
+再自上而下逐行推进，即可得到所有可达的状态。选定放置位置后，能从上方直接落下的位置按 先旋转、再左右移动、最后下落
+的顺序移动（与 AI.getNewMap 相同，也是最短的操作序列），其余位置用广度优先搜索求最短的操作序列
+"""
+
+from collections import deque
+from gameconst import *
+from bitboard import BitBoard, getLayoutMasks
+from boardstats import BoardStats
+
+
+
+class PieceMoves():
+    """
+    一种方块在给定宽度的游戏区域中的移动信息。状态中的列使用方块最左一列所在的列 p 表示，
+    这样每个方向下不越过左右边界的位置都是第 0 位到第 field_width - 宽度 位的连续位
+    """
+    def __init__(self, layouts, field_width):
+        self.layouts = layouts
+        self.count = len(layouts)
+        self.min_x = []
+        self.min_y = []
+        self.masks = []
+        self.spans = []
+        for layout in layouts:
+            (min_x, max_x, masks) = getLayoutMasks(layout)
+            self.min_x.append(min_x)
+            self.min_y.append(masks[0][0])
+            self.masks.append([(y, [bit for bit in range(max_x - min_x + 1) if (mask >> bit) & 1]) for (y, mask) in masks])
+            self.spans.append((1 << (field_width - (max_x - min_x))) - 1)
+        # 顺时针旋转到下一个方向时 p 的变化量，旋转不改变方块的 position
+        self.turns = [self.min_x[(direction + 1) % self.count] - self.min_x[direction] for direction in range(self.count)]
+
+    def getLegal(self, rows, top, field_height):
+        """
+        返回 legal[direction][y - top]，y 从 top 到 field_height，其中第 p 位为 1 表示方块在该位置时 Block.isLegal 为 Success。
+        与 Block.isLegal 一致，第 0 行及以上的小方格不参与碰撞检测
+        """
+        legal = []
+        for direction in range(self.count):
+            span = self.spans[direction]
+            masks = self.masks[direction]
+            column = []
+            for y0 in range(top, field_height + 1):
+                blocked = 0
+                for (y, bits) in masks:
+                    if y + y0 >= field_height:
+                        blocked = span
+                        break
+                    if y + y0 > 0 and rows[y + y0]:
+                        row = rows[y + y0]
+                        for bit in bits:
+                            blocked |= row >> bit
+                column.append(span & ~blocked)
+            legal.append(column)
+        return legal
+
+
+piece_moves = {}
+
+
+def getPieceMoves(block_type, field_width):
+    if (block_type, field_width) not in piece_moves:
+        piece_moves[(block_type, field_width)] = PieceMoves(Blocks_layout[block_type], field_width)
+    return piece_moves[(block_type, field_width)]
+
+
+def getRows(field_map):
+    """
+    取得游戏区域每一行的位掩码
+    """
+    if type(field_map) is BitBoard:
+        return field_map.rows
+    if type(field_map) is BoardStats:
+        return field_map.board.rows
+    return [sum(1 << x for (x, brick) in enumerate(lows) if brick >= Brick_base) for lows in field_map]
+
+
+def playPath(block, path, field_map):
+    """
+    通过游戏提供的接口按操作序列移动方块，序列的最后一步为使方块落定的下落
+    """
+    for option in path:
+        if option is Option.Rotate:
+            block.rotate(field_map)
+        elif option is Option.Left:
+            block.left(field_map)
+        elif option is Option.Right:
+            block.right(field_map)
+        else:
+            block.down(field_map)
+
+
+class Reachability():
+    """
+    方块 block 在游戏区域 field_map（二维列表、BitBoard 或 BoardStats）上从当前位置与方向出发的可达性
+    """
+    def __init__(self, block, field_map):
+        self.moves = getPieceMoves(block.block_type, block.field_width)
+        self.field_height = block.field_height
+        self.top = block.position[1]
+        self.spawn = (block.direction, 0, block.position[0] + self.moves.min_x[block.direction])
+        self.legal = self.moves.getLegal(getRows(field_map), self.top, self.field_height)
+
+    def getReachable(self):
+        """
+        自上而下逐行计算可达的状态，reach[direction][y - top] 的第 p 位为 1 表示该状态可达
+        """
+        moves = self.moves
+        legal = self.legal
+        (direction, y, p) = self.spawn
+        reach = [[0] * len(legal[0]) for _ in range(moves.count)]
+        cur = [0] * moves.count
+        cur[direction] = 1 << p
+        for y in range(len(legal[0]) - 1):
+            cur = [cur[direction] & legal[direction][y] for direction in range(moves.count)]
+            if not any(cur):
+                break
+            changed = True
+            while changed:
+                changed = False
+                for direction in range(moves.count):
+                    mask = cur[direction]
+                    if not mask:
+                        continue
+                    row = legal[direction][y]
+                    while True:
+                        expanded = mask | (((mask << 1) | (mask >> 1)) & row)
+                        if expanded == mask:
+                            break
+                        mask = expanded
+                    cur[direction] = mask
+                    if moves.count > 1:
+                        next_direction = (direction + 1) % moves.count
+                        turn = moves.turns[direction]
+                        rotated = (mask << turn if turn >= 0 else mask >> -turn) & legal[next_direction][y]
+                        if rotated & ~cur[next_direction]:
+                            cur[next_direction] |= rotated
+                            changed = True
+            for direction in range(moves.count):
+                reach[direction][y] = cur[direction]
+        return reach
+
+    def getPlacements(self):
+        """
+        列出所有可达的落定位置 ((x, y), 方向)，不包括有小方格位于游戏区域上方（会导致游戏结束）的位置
+        """
+        moves = self.moves
+        reach = self.getReachable()
+        placements = []
+        for direction in range(moves.count):
+            for y in range(len(reach[direction]) - 1):
+                locks = reach[direction][y] & ~self.legal[direction][y + 1]
+                if not locks or y + self.top + moves.min_y[direction] < 0:
+                    continue
+                while locks:
+                    low = locks & -locks
+                    placements.append(((low.bit_length() - 1 - moves.min_x[direction], y + self.top), direction))
+                    locks ^= low
+        return placements
+
+    def isLegal(self, state):
+        (direction, y, p) = state
+        return p >= 0 and 0 <= y < len(self.legal[direction]) and (self.legal[direction][y] >> p) & 1
+
+    def getDirectPath(self, target):
+        """
+        先旋转、再左右移动、最后下落的操作序列，途中任何一步不合法时返回 None
+        """
+        moves = self.moves
+        (direction, y, p) = self.spawn
+        path = []
+        while direction != target[0]:
+            (direction, p) = ((direction + 1) % moves.count, p + moves.turns[direction])
+            path.append(Option.Rotate)
+            if not self.isLegal((direction, y, p)):
+                return None
+        step = (Option.Left, -1) if target[2] < p else (Option.Right, 1)
+        while p != target[2]:
+            p += step[1]
+            path.append(step[0])
+            if not self.isLegal((direction, y, p)):
+                return None
+        while y != target[1]:
+            y += 1
+            path.append(Option.Down)
+            if not self.isLegal((direction, y, p)):
+                return None
+        return path
+
+    def getPath(self, position, direction):
+        """
+        返回将方块移动到 position、direction 并落定的最短操作序列，不可达时返回 None
+        """
+        target = (direction, position[1] - self.top, position[0] + self.moves.min_x[direction])
+        if not self.isLegal(target) or self.isLegal((direction, target[1] + 1, target[2])):
+            return None
+        path = self.getDirectPath(target)
+        if path is not None:
+            return path + [Option.Down]
+        moves = self.moves
+        parents = {self.spawn: None}
+        queue = deque([self.spawn])
+        while queue:
+            state = queue.popleft()
+            if state == target:
+                path = [Option.Down]
+                while parents[state] is not None:
+                    (state, option) = parents[state]
+                    path.append(option)
+                return path[::-1]
+            (direction, y, p) = state
+            for (option, next_state) in ((Option.Left, (direction, y, p - 1)),
+                                         (Option.Right, (direction, y, p + 1)),
+                                         (Option.Rotate, ((direction + 1) % moves.count, y, p + moves.turns[direction])),
+                                         (Option.Down, (direction, y + 1, p))):
+                if next_state not in parents and self.isLegal(next_state):
+                    parents[next_state] = (state, option)
+                    queue.append(next_state)
+        return None
@@ -0,0 +1,160 @@
+"""
+pygame 渲染层：包装 game.py 中的游戏逻辑，负责窗口、键盘事件与绘制。只有在需要窗口时才会被导入。
+边框和底色预先画在背景 Surface 上，每一帧只重画与上一帧相比发生变化的格子、预览方块和文字，
+并且只把这些区域更新到屏幕上
+"""
+
+import pygame
+from gameconst import *
+from bitboard import BitBoard
+
+
+
+class Renderer():
+    def __init__(self, game):
+        self.game = game
+        pygame.init()
+        pygame.display.set_caption(Game_name)
+        self.screen = pygame.display.set_mode(((game.field_width + 8) * Brick_size, game.field_height * Brick_size))
+        self.level_font = pygame.font.Font(None, Font_size)
+        self.score_font = pygame.font.Font(None, Font_size)
+        self.lines_font = pygame.font.Font(None, Font_size)
+        self.framerate = pygame.time.Clock()
+        # 显示在行数下方的额外文字，例如观战模式中的模拟速度与绘制帧率
+        self.status = []
+        self.frame = [(x, y) for y in range(game.field_height) for x in range(game.field_width, game.field_width+8) if y == 0 or y == game.field_height-1 or y == 7 or x == game.field_width or x == game.field_width+7]
+        self.tiles = {}
+        self.background = self.getBackground()
+        self.redraw()
+
+    def getTile(self, color):
+        """
+        每种颜色只创建一次小方格的 Surface
+        """
+        if color not in self.tiles:
+            self.tiles[color] = pygame.Surface([Brick_size, Brick_size])
+            self.tiles[color].fill(color)
+        return self.tiles[color]
+
+    def getBackground(self):
+        """
+        预先画好底色和边框，之后只需从背景上复制需要擦除的区域
+        """
+        background = pygame.Surface(self.screen.get_size())
+        background.fill((0, 0, 0))
+        for (x, y) in self.frame:
+            background.blit(self.getTile(Frame_color), (x * Brick_size, y * Brick_size))
+        return background
+
+    def redraw(self):
+        """
+        重画整个窗口并清空所有缓存的绘制状态，窗口需要重新显示时调用
+        """
+        self.screen.blit(self.background, (0, 0))
+        self.cells = [[None] * self.game.field_width for _ in range(self.game.field_height)]
+        self.next_block = None
+        self.texts = {}
+        self.dirty = []
+        pygame.display.flip()
+
+    def eraseRect(self, rect):
+        self.screen.blit(self.background, rect, rect)
+        self.dirty.append(rect)
+
+    def drawBrick(self, position, color):
+        rect = pygame.Rect(position[0] * Brick_size, position[1] * Brick_size, Brick_size, Brick_size)
+        if color is None:
+            self.eraseRect(rect)
+        else:
+            self.screen.blit(self.getTile(color), rect)
+            self.dirty.append(rect)
+
+    def drawBlock(self, block, position):
+        for (x, y) in block.layout:
+            self.drawBrick((position[0] + x, position[1] + y), Blocks_color[block.block_type])
+
+    def drawField(self):
+        """
+        计算每个格子的颜色（包括正在下落的方块），只重画与上一帧不同的格子
+        """
+        color = Buttom_Blocks_color[self.game.level % 10]
+        if type(self.game.field_map) is BitBoard:
+            cells = [[color if (row >> x) & 1 else None for x in range(self.game.field_width)] for row in self.game.field_map.rows]
+        else:
+            cells = [[color if brick >= Brick_base else None for brick in lows] for lows in self.game.field_map]
+        cur_block = self.game.block_factory.cur_block
+        for (x, y) in cur_block.layout:
+            (x0, y0) = (cur_block.position[0] + x, cur_block.position[1] + y)
+            if 0 <= y0 < self.game.field_height and 0 <= x0 < self.game.field_width:
+                cells[y0][x0] = Blocks_color[cur_block.block_type]
+        for y in range(self.game.field_height):
+            if cells[y] != self.cells[y]:
+                for x in range(self.game.field_width):
+                    if cells[y][x] != self.cells[y][x]:
+                        self.drawBrick((x, y), cells[y][x])
+        self.cells = cells
+
+    def drawNextBlock(self):
+        next_block = self.game.block_factory.next_block
+        if (next_block.block_type, next_block.direction) != self.next_block:
+            self.eraseRect(pygame.Rect(12 * Brick_size, 3 * Brick_size, 4 * Brick_size, 4 * Brick_size))
+            self.drawBlock(next_block, (12, 3))
+            self.next_block = (next_block.block_type, next_block.direction)
+
+    def drawText(self, name, string, font, position):
+        """
+        文字内容变化时才重新渲染，并擦除上一次文字所占的区域
+        """
+        if name in self.texts and self.texts[name][0] == string:
+            return
+        if name in self.texts:
+            self.eraseRect(self.texts[name][1])
+        image = font.render(string, True, Text_color)
+        rect = self.screen.blit(image, position)
+        self.dirty.append(rect)
+        self.texts[name] = (string, rect)
+
+    def drawLevelScoreLine(self):
+        self.drawText("level", "Level: " + str(self.game.level), self.level_font, (370, 240))
+        self.drawText("score", "Score: " + str(self.game.score), self.score_font, (370, 260))
+        self.drawText("lines", "Lines: " + str(self.game.lines_num), self.lines_font, (370, 280))
+        for (i, string) in enumerate(self.status):
+            self.drawText("status" + str(i), string, self.lines_font, (370, 300 + 20 * i))
+
+    def draw(self):
+        self.drawField()
+        self.drawNextBlock()
+        self.drawLevelScoreLine()
+        if self.dirty:
+            pygame.display.update(self.dirty)
+            self.dirty = []
+
+    def tick(self):
+        self.framerate.tick(Framerate)
+
+    def checkQuit(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                exit(0)
+            if event.type == pygame.VIDEOEXPOSE:
+                self.redraw()
+
+    def checkEvents(self, block, field_map):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                exit(0)
+            if event.type == pygame.VIDEOEXPOSE:
+                self.redraw()
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_w or event.key == pygame.K_UP:
+                    block.rotate(field_map)
+                elif event.key == pygame.K_s or event.key == pygame.K_DOWN:
+                    block.option = Option.Down
+                elif event.key == pygame.K_a or event.key == pygame.K_LEFT:
+                    block.option = Option.Left
+                elif event.key == pygame.K_d or event.key == pygame.K_RIGHT:
+                    block.option = Option.Right
+            if event.type == pygame.KEYUP:
+                block.option = None
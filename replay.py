@@ -0,0 +1,236 @@
+"""
+对局回放：在游戏进行时以流式写入紧凑的二进制记录，之后可以不运行 AI 的搜索、直接在无界面模式下重新模拟整局游戏。
+
+文件格式（小端序）：
+    文件头    magic "TRPL"、版本、游戏区域宽度与高度、随机种子（未知时为 -1）、快照间隔 interval
+    数据块    interval 条 4 字节的放置记录，之后是一个定长的局面快照，如此重复，最后一个数据块可以不完整
+放置记录第一个字节为 方块种类 | 出现时的方向 << 3 | 放置的方向 << 5，之后是有符号 1 字节的放置列 x 与有符号 2 字节的落定行 y，
+回放时直接把方块落定在 (x, y)，因此使用 reachability 的 AI 横移或旋转塞入的位置（以及 x 为负数的位置）也能正确回放。
+版本 1 的文件每条放置记录只有 2 字节（无符号的 x，没有 y），回放时从上方直接落下；
+快照记录此前已放置的方块数、消除的行数、分数以及每一行的小方格位掩码。
+由于记录和快照都是定长的，读取时用 mmap 打开文件，可以直接计算出任意一步所在的位置，
+从最近的快照开始重新模拟即可跳转到任意一步
+"""
+
+import argparse
+import mmap
+import random
+import struct
+import time
+from game import *
+from bitboard import BitBoard
+
+
+
+Header = struct.Struct("<4sBBHqI")
+Snapshot_header = struct.Struct("<QQQ")
+Move = struct.Struct("<Bbh")
+Move_v1 = struct.Struct("<BB")
+Magic = b"TRPL"
+Version = 2
+
+
+def getRowBytes(field_width):
+    return (field_width + 7) // 8
+
+
+def getSnapshotSize(field_width, field_height):
+    return Snapshot_header.size + getRowBytes(field_width) * field_height
+
+
+class ReplayWriter():
+    """
+    每放置一个方块调用一次 record，每 interval 步写入一次局面快照。写入经过缓冲，结束时需要调用 close
+    """
+    def __init__(self, path, field_width, field_height, seed=None, interval=1000):
+        self.file = open(path, "wb")
+        self.field_width = field_width
+        self.field_height = field_height
+        self.interval = interval
+        self.row_bytes = getRowBytes(field_width)
+        self.pieces_num = 0
+        self.file.write(Header.pack(Magic, Version, field_width, field_height, -1 if seed is None else seed, interval))
+
+    def writeMove(self, block_type, spawn_direction, direction, x, y):
+        self.file.write(Move.pack(block_type | spawn_direction << 3 | direction << 5, x, y))
+        self.pieces_num += 1
+
+    def writeSnapshot(self, game):
+        self.file.write(Snapshot_header.pack(self.pieces_num, game.lines_num, game.score))
+        self.file.write(b"".join(row.to_bytes(self.row_bytes, "little") for row in game.stats.board.rows))
+
+    def record(self, game, block, spawn_direction):
+        """
+        在方块落定且 game.update() 之后调用，block 为刚刚放置的方块，spawn_direction 为它出现时的方向
+        """
+        self.writeMove(block.block_type, spawn_direction, block.direction, block.position[0], block.position[1])
+        if self.pieces_num % self.interval == 0:
+            self.writeSnapshot(game)
+
+    def close(self):
+        self.file.close()
+
+
+class ReplayPieces():
+    """
+    从第 start 步开始的方块序列，作为 BlockFactory 的 sequence 使用
+    """
+    def __init__(self, reader, start):
+        self.reader = reader
+        self.start = start
+
+    def __len__(self):
+        return max(1, len(self.reader) - self.start)
+
+    def __getitem__(self, index):
+        (block_type, spawn_direction, direction, x, y) = self.reader.getMove(min(self.start + index, len(self.reader) - 1))
+        return (block_type, spawn_direction)
+
+
+class ReplayReader():
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.field_width, self.field_height, seed, self.interval) = Header.unpack_from(self.data, 0)
+        if magic != Magic or version not in (1, Version):
+            raise ValueError(path + " is not a replay file")
+        self.move = Move if version == Version else Move_v1
+        self.seed = None if seed == -1 else seed
+        self.row_bytes = getRowBytes(self.field_width)
+        self.snapshot_size = getSnapshotSize(self.field_width, self.field_height)
+        self.block_size = self.move.size * self.interval + self.snapshot_size
+        (blocks, rest) = divmod(len(self.data) - Header.size, self.block_size)
+        self.snapshots_num = blocks
+        self.pieces_num = blocks * self.interval + min(rest // self.move.size, self.interval)
+
+    def __len__(self):
+        return self.pieces_num
+
+    def getMove(self, index):
+        """
+        返回第 index 步的 (方块种类, 出现时的方向, 放置的方向, 放置的列, 落定的行)，版本 1 的文件中落定的行为 None
+        """
+        (block, offset) = divmod(index, self.interval)
+        position = Header.size + block * self.block_size + self.move.size * offset
+        if self.move is Move_v1:
+            (value, x) = Move_v1.unpack_from(self.data, position)
+            y = None
+        else:
+            (value, x, y) = Move.unpack_from(self.data, position)
+        return (value & 7, (value >> 3) & 3, value >> 5, x, y)
+
+    def getSnapshot(self, index):
+        """
+        返回第 index 个快照的 (已放置的方块数, 消除的行数, 分数, 各行位掩码)
+        """
+        position = Header.size + index * self.block_size + self.move.size * self.interval
+        (pieces_num, lines_num, score) = Snapshot_header.unpack_from(self.data, position)
+        position += Snapshot_header.size
+        rows = [int.from_bytes(self.data[position + y * self.row_bytes:position + (y + 1) * self.row_bytes], "little") for y in range(self.field_height)]
+        return (pieces_num, lines_num, score, rows)
+
+    def restore(self, game, snapshot):
+        (pieces_num, game.lines_num, game.score, rows) = snapshot
+        if type(game.field_map) is BitBoard:
+            game.field_map = BitBoard(self.field_width, self.field_height, rows[:])
+        else:
+            # 快照中只保存了是否有小方格，恢复后的小方格都记为第 0 种方块
+            game.field_map[:] = [[Brick_base if (row >> x) & 1 else 0 for x in range(self.field_width)] for row in rows]
+        game.stats.setRows(rows)
+        game.checkUpgrade()
+        return pieces_num
+
+    def seek(self, index, bitboard=True):
+        """
+        返回已经放置了 index 个方块的游戏，从 index 之前最近的快照开始重新模拟
+        """
+        snapshot = min(index // self.interval, self.snapshots_num)
+        start = snapshot * self.interval
+        game = Game(self.field_width, self.field_height, bitboard, sequence=ReplayPieces(self, start))
+        game.initialize()
+        if snapshot > 0:
+            self.restore(game, self.getSnapshot(snapshot - 1))
+        self.simulate(game, start, index)
+        return game
+
+    def simulate(self, game, start, stop, verify=False):
+        """
+        在 game 上重新模拟第 start 到 stop - 1 步，verify 为 True 时在每个快照处检查局面是否一致，返回不一致的快照数
+        """
+        mismatches = 0
+        for index in range(start, stop):
+            (block_type, spawn_direction, direction, x, y) = self.getMove(index)
+            block = game.block_factory.cur_block
+            if block.block_type != block_type:
+                raise ValueError("piece " + str(index) + " does not match the replay")
+            if y is None:
+                block.drop(x, direction, game.field_map, game.stats.getColumnTops(1))
+            elif not block.place((x, y), direction, game.field_map):
+                raise ValueError("piece " + str(index) + " cannot be placed at " + str((x, y)))
+            game.update()
+            if verify and (index + 1) % self.interval == 0 and (index + 1) // self.interval <= self.snapshots_num:
+                (pieces_num, lines_num, score, rows) = self.getSnapshot((index + 1) // self.interval - 1)
+                if (lines_num, score, rows) != (game.lines_num, game.score, game.stats.board.rows):
+                    mismatches += 1
+        return mismatches
+
+    def verify(self, bitboard=True):
+        """
+        从头重新模拟整局游戏，返回 (游戏, 不一致的快照数)
+        """
+        game = Game(self.field_width, self.field_height, bitboard, sequence=ReplayPieces(self, 0))
+        game.initialize()
+        mismatches = self.simulate(game, 0, len(self), True)
+        return game, mismatches
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+def record(path, seed, A, max_pieces=None, interval=1000, bitboard=True, reachability=False):
+    """
+    使用随机种子 seed 运行一局 Pierre Dellacherie 无界面游戏并写入回放文件
+    """
+    from PierreDellacherie import AIGame
+    game = AIGame(bitboard, False, random.Random(seed), reachability=reachability)
+    writer = ReplayWriter(path, game.field_width, game.field_height, seed, interval)
+    try:
+        game.startWithoutGUI(A, max_pieces, verbose=False, replay=writer)
+    finally:
+        writer.close()
+    return game
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record, verify and seek Tetris replay files")
+    parser.add_argument("path")
+    parser.add_argument("--record", action="store_true", help="play a seeded Dellacherie game and write it to path")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-pieces", type=int, default=None)
+    parser.add_argument("--interval", type=int, default=1000, help="pieces between board snapshots")
+    parser.add_argument("--reachability", action="store_true", help="record with the reachability search (tucks and spins)")
+    parser.add_argument("--seek", type=int, default=None, help="print the board after this many pieces")
+    args = parser.parse_args()
+
+    if args.record:
+        from PierreDellacherie import Default_A
+        start_time = time.time()
+        game = record(args.path, args.seed, Default_A, args.max_pieces, args.interval, reachability=args.reachability)
+        print("Recorded " + str(game.pieces_num) + " pieces, " + str(game.lines_num) + " lines in " + format(time.time() - start_time, ".1f") + "s")
+    reader = ReplayReader(args.path)
+    if args.seek is not None:
+        game = reader.seek(min(args.seek, len(reader)))
+        print("Piece " + str(min(args.seek, len(reader))) + "   Lines: " + str(game.lines_num) + "   Score: " + str(game.score))
+        for row in game.field_map.toMap():
+            print("".join("#" if cell else "." for cell in row))
+    else:
+        start_time = time.time()
+        (game, mismatches) = reader.verify()
+        elapsed = time.time() - start_time
+        print("Replayed " + str(len(reader)) + " pieces in " + format(elapsed, ".2f") + "s (" + format(len(reader) / elapsed if elapsed > 0 else 0, ".0f") + " pieces/s)   Lines: " + str(game.lines_num) + "   Score: " + str(game.score) + "   Snapshot mismatches: " + str(mismatches))
+    reader.close()
+
+
+if __name__ == '__main__':
+    main()
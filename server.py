@@ -0,0 +1,285 @@
+"""
+供其他进程中的 AI 使用的 asyncio 游戏服务器：一个进程中同时运行大量无界面游戏，客户端通过本地 TCP 或 Unix socket 连接，
+一个连接上可以同时进行多局游戏（会话）。服务器发送局面与方块信息，客户端返回放置的 (方向, 列)，服务器直接落定方块。
+
+消息都是定长的二进制格式（小端序），第一个字节为消息类型：
+    服务器 -> 客户端
+        连接后首先发送 Hello       magic "TSRV"、版本、游戏区域宽度与高度
+        State   会话编号、当前方块种类与方向、下一个方块种类、消除的行数、已放置的方块数，以及每一行的小方格位掩码
+                （按宽度使用 1、2、4 或 8 字节的整数，最多 64 列）
+        Over    会话编号、已放置的方块数、消除的行数、分数，游戏结束后会话随即关闭
+        Error   会话编号、错误码
+    客户端 -> 服务器
+        New     会话编号（由客户端指定）、随机种子（-1 表示随机）
+        Move    会话编号、放置的方向、放置的列
+        Close   会话编号
+同一连接在一次事件循环中产生的所有消息合并为一次写入；发送缓冲区超过上限时暂停读取该连接，直到缓冲区排空
+"""
+
+import argparse
+import asyncio
+import random
+import struct
+import time
+from collections import deque
+from game import *
+from geometry import getGeometry
+
+
+
+Hello = struct.Struct("<4sBBB")
+Magic = b"TSRV"
+Version = 1
+
+# 服务器 -> 客户端
+Msg_state = 1
+Msg_over = 2
+Msg_error = 3
+State_header = struct.Struct("<BIBBBII")
+Over = struct.Struct("<BIIIQ")
+Error = struct.Struct("<BIB")
+
+# 客户端 -> 服务器
+Msg_new = 1
+Msg_move = 2
+Msg_close = 3
+New = struct.Struct("<BIq")
+Move = struct.Struct("<BIBB")
+Close = struct.Struct("<BI")
+Client_messages = {Msg_new: New, Msg_move: Move, Msg_close: Close}
+
+Error_unknown_session = 1
+Error_duplicate_session = 2
+Error_too_many_sessions = 3
+Error_illegal_move = 4
+Error_bad_message = 5
+
+
+def getRowsStruct(field_width, field_height):
+    """
+    所有行的位掩码一次打包，每行使用能容纳 field_width 位的最小整数类型
+    """
+    code = "B" if field_width <= 8 else "H" if field_width <= 16 else "I" if field_width <= 32 else "Q"
+    return struct.Struct("<" + str(field_height) + code)
+
+
+def encodeState(session_id, game, rows_struct):
+    factory = game.block_factory
+    header = State_header.pack(Msg_state, session_id, factory.cur_block.block_type, factory.cur_block.direction,
+                               factory.next_block.block_type, game.lines_num, game.pieces_num)
+    return header + rows_struct.pack(*game.field_map.rows)
+
+
+def decodeState(data, offset, rows_struct):
+    """
+    返回 (会话编号, 当前方块种类, 方向, 下一个方块种类, 消除的行数, 已放置的方块数, 各行位掩码)
+    """
+    (msg, session_id, block_type, direction, next_type, lines_num, pieces_num) = State_header.unpack_from(data, offset)
+    return (session_id, block_type, direction, next_type, lines_num, pieces_num, list(rows_struct.unpack_from(data, offset + State_header.size)))
+
+
+class Session():
+    def __init__(self, session_id, field_width, field_height, seed):
+        self.session_id = session_id
+        self.game = Game(field_width, field_height, True, random.Random(seed if seed >= 0 else None))
+        self.game.initialize()
+        self.game.pieces_num = 0
+        self.start_time = time.perf_counter()
+
+    def move(self, direction, x):
+        """
+        落定当前方块，方向或列不合法时返回 False 且不改变局面
+        """
+        game = self.game
+        block = game.block_factory.cur_block
+        if direction >= len(block.layouts) or x not in getGeometry(block.layouts[direction]).getLegalRange(game.field_width):
+            return False
+        game.block_factory.drop(x, direction, game.field_map, game.stats.getColumnTops(1))
+        game.update()
+        game.pieces_num += 1
+        return True
+
+    def getMovesPerSecond(self):
+        return self.game.pieces_num / max(time.perf_counter() - self.start_time, 1e-9)
+
+
+class Connection(asyncio.Protocol):
+    def __init__(self, server):
+        self.server = server
+        self.buffer = bytearray()
+        self.frames = []
+        self.sessions = {}
+        self.transport = None
+        self.flush_scheduled = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.set_write_buffer_limits(self.server.high_water)
+        self.server.connections.add(self)
+        transport.write(Hello.pack(Magic, Version, self.server.field_width, self.server.field_height))
+
+    def connection_lost(self, exc):
+        self.server.connections.discard(self)
+        for session in self.sessions.values():
+            self.server.closeSession(session)
+        self.sessions = {}
+
+    def pause_writing(self):
+        # 客户端来不及接收时不再读取它的消息，也就不会产生新的局面
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self.transport.resume_reading()
+
+    def send(self, frame):
+        """
+        消息先放入缓冲，在本次事件循环的回调都执行完后合并写入
+        """
+        self.frames.append(frame)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+
+    def flush(self):
+        self.flush_scheduled = False
+        if self.frames and not self.transport.is_closing():
+            self.transport.write(b"".join(self.frames))
+        self.frames = []
+
+    def data_received(self, data):
+        self.buffer += data
+        offset = 0
+        while offset < len(self.buffer):
+            message = Client_messages.get(self.buffer[offset])
+            if message is None:
+                # close 之后 flush 不再写入，因此连同缓冲中的消息直接写出错误消息再关闭
+                self.frames.append(Error.pack(Msg_error, 0, Error_bad_message))
+                self.transport.write(b"".join(self.frames))
+                self.frames = []
+                self.transport.close()
+                return
+            if len(self.buffer) - offset < message.size:
+                break
+            self.handle(message.unpack_from(self.buffer, offset))
+            offset += message.size
+        del self.buffer[:offset]
+
+    def handle(self, message):
+        (msg, session_id) = message[:2]
+        if msg == Msg_new:
+            if session_id in self.sessions:
+                self.send(Error.pack(Msg_error, session_id, Error_duplicate_session))
+            elif self.server.sessions_num >= self.server.max_sessions:
+                self.send(Error.pack(Msg_error, session_id, Error_too_many_sessions))
+            else:
+                session = self.server.openSession(session_id, message[2])
+                self.sessions[session_id] = session
+                self.send(encodeState(session_id, session.game, self.server.rows_struct))
+            return
+        session = self.sessions.get(session_id)
+        if session is None:
+            self.send(Error.pack(Msg_error, session_id, Error_unknown_session))
+        elif msg == Msg_close:
+            self.server.closeSession(self.sessions.pop(session_id))
+        elif not session.move(message[2], message[3]):
+            self.send(Error.pack(Msg_error, session_id, Error_illegal_move))
+        elif session.game.block_factory.is_failed:
+            game = session.game
+            self.send(Over.pack(Msg_over, session_id, game.pieces_num, game.lines_num, game.score))
+            self.server.closeSession(self.sessions.pop(session_id))
+        else:
+            self.send(encodeState(session_id, session.game, self.server.rows_struct))
+
+
+class GameServer():
+    """
+    max_sessions 为所有连接上同时进行的游戏数上限，high_water 为每个连接发送缓冲区的上限（字节），
+    recent 为统计每秒步数时保留的最近结束的会话数，已结束的会话只累计数量与步数
+    """
+    def __init__(self, field_width=10, field_height=20, max_sessions=10000, high_water=256 * 1024, recent=10000):
+        self.field_width = field_width
+        self.field_height = field_height
+        self.rows_struct = getRowsStruct(field_width, field_height)
+        self.max_sessions = max_sessions
+        self.high_water = high_water
+        self.connections = set()
+        self.sessions_num = 0
+        self.finished_num = 0
+        self.recent_rates = deque(maxlen=recent)
+        self.moves_num = 0
+        self.server = None
+
+    def openSession(self, session_id, seed):
+        self.sessions_num += 1
+        return Session(session_id, self.field_width, self.field_height, seed)
+
+    def closeSession(self, session):
+        self.sessions_num -= 1
+        self.finished_num += 1
+        self.moves_num += session.game.pieces_num
+        if session.game.pieces_num > 0:
+            self.recent_rates.append(session.getMovesPerSecond())
+
+    def getSessions(self):
+        return [session for connection in self.connections for session in connection.sessions.values()]
+
+    def getReport(self):
+        """
+        统计所有进行中与已结束会话的总步数，以及进行中与最近结束的会话每秒的步数（不计还没有走过的会话）
+        """
+        sessions = self.getSessions()
+        rates = sorted(list(self.recent_rates) + [session.getMovesPerSecond() for session in sessions if session.game.pieces_num > 0])
+        return {"sessions": len(sessions),
+                "finished": self.finished_num,
+                "moves": self.moves_num + sum(session.game.pieces_num for session in sessions),
+                "session_rate_p50": rates[len(rates) // 2] if rates else 0.0,
+                "session_rate_min": rates[0] if rates else 0.0,
+                "session_rate_max": rates[-1] if rates else 0.0}
+
+    async def start(self, host="127.0.0.1", port=7777, unix=None):
+        loop = asyncio.get_running_loop()
+        if unix is not None:
+            self.server = await loop.create_unix_server(lambda: Connection(self), unix)
+        else:
+            self.server = await loop.create_server(lambda: Connection(self), host, port)
+        return self.server
+
+    async def report(self, interval):
+        last = (time.perf_counter(), 0)
+        while True:
+            await asyncio.sleep(interval)
+            report = self.getReport()
+            now = time.perf_counter()
+            print("Sessions: " + str(report["sessions"]) + "   Finished: " + str(report["finished"]) + "   Moves/s: " + format((report["moves"] - last[1]) / (now - last[0]), ".0f") + "   Per session moves/s p50: " + format(report["session_rate_p50"], ".1f") + " (min " + format(report["session_rate_min"], ".1f") + ", max " + format(report["session_rate_max"], ".1f") + ")", flush=True)
+            last = (now, report["moves"])
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        for connection in list(self.connections):
+            connection.transport.close()
+
+
+async def serve(args):
+    server = GameServer(max_sessions=args.max_sessions)
+    await server.start(args.host, args.port, args.unix)
+    print("Listening on " + (args.unix if args.unix is not None else args.host + ":" + str(args.port)), flush=True)
+    await server.report(args.report_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host many concurrent headless Tetris games for agents in other processes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--unix", default=None, help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--max-sessions", type=int, default=10000)
+    parser.add_argument("--report-interval", type=float, default=5.0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+适合很高的游戏区域（例如 Q learning 训练使用的 4x1000 的井）的位掩码表示：只保存从最底行到当前最高的小方格所在行之间的部分，
+并维护每一列的高度。判断某一行之上是否全空、查询每列堆顶都是 O(1) 或 O(列数)，
+放置、消行与创建的开销只与堆叠的高度有关，与游戏区域名义上的高度无关。接口和判断规则与 BitBoard 相同
+"""
+
+from gameconst import *
+from bitboard import getLayoutMasks
+
+
+
+class SparseBoard():
+    def __init__(self, field_width, field_height):
+        self.field_width = field_width
+        self.field_height = field_height
+        self.full_row = (1 << field_width) - 1
+        # band[i] 为第 field_height - 1 - i 行，band 之上的行都是空行
+        self.band = []
+        self.heights = [0] * field_width
+        self.full_rows = 0
+        self.saved_rows = []
+
+    def copy(self):
+        board = SparseBoard(self.field_width, self.field_height)
+        board.band = self.band[:]
+        board.heights = self.heights[:]
+        board.full_rows = self.full_rows
+        return board
+
+    def toMap(self):
+        """
+        转换为与 Game.field_map 相同的二维列表，有小方格的位置为 1
+        """
+        return [[(self.getRow(y) >> x) & 1 for x in range(self.field_width)] for y in range(self.field_height)]
+
+    def getHeight(self):
+        """
+        最高的小方格距离游戏区域底部的行数
+        """
+        return len(self.band)
+
+    def isEmptyAbove(self, y):
+        """
+        第 y 行及其上方是否都是空行
+        """
+        return self.field_height - 1 - y >= len(self.band)
+
+    def getRow(self, y):
+        i = self.field_height - 1 - y
+        return self.band[i] if 0 <= i < len(self.band) else 0
+
+    def setRow(self, y, row):
+        i = self.field_height - 1 - y
+        if i >= len(self.band):
+            self.band.extend([0] * (i + 1 - len(self.band)))
+        self.band[i] = row
+
+    def isLegal(self, layout, position):
+        """
+        与 Block.isLegal 的判断规则一致，其中第 0 行的小方格不参与碰撞检测
+        """
+        (x0, y0) = position
+        (min_x, max_x, masks) = getLayoutMasks(layout)
+        if x0 + min_x < 0 or x0 + max_x >= self.field_width:
+            return State.Middle
+        bottom = self.field_height - len(self.band)
+        for (y, mask) in masks:
+            if y + y0 >= self.field_height or (y + y0 > 0 and y + y0 >= bottom and self.band[self.field_height - 1 - y - y0] & (mask << (x0 + min_x))):
+                return State.Bottom
+        return State.Success
+
+    def place(self, layout, position):
+        """
+        将方块写入游戏区域，若方块有部分在游戏区域上方则返回 False
+        """
+        (x0, y0) = position
+        (min_x, max_x, masks) = getLayoutMasks(layout)
+        is_inside = True
+        for (y, mask) in masks:
+            if y + y0 < 0:
+                is_inside = False
+            else:
+                row = self.getRow(y + y0) | (mask << (x0 + min_x))
+                self.setRow(y + y0, row)
+                if row == self.full_row:
+                    self.full_rows += 1
+        for (x, y) in layout:
+            if y + y0 >= 0 and self.field_height - y - y0 > self.heights[x + x0]:
+                self.heights[x + x0] = self.field_height - y - y0
+        return is_inside
+
+    def mark(self, layout, position):
+        """
+        模拟放置方块并记录被修改的行，之后可通过 unmark 恢复
+        """
+        (x0, y0) = position
+        (min_x, max_x, masks) = getLayoutMasks(layout)
+        for (y, mask) in masks:
+            if y + y0 < 0:
+                return False
+        self.saved_rows = (len(self.band), self.heights[:], self.full_rows, [(y + y0, self.getRow(y + y0)) for (y, mask) in masks])
+        self.place(layout, position)
+        return True
+
+    def unmark(self):
+        (band_size, self.heights, self.full_rows, rows) = self.saved_rows
+        for (y, row) in reversed(rows):
+            self.setRow(y, row)
+        del self.band[band_size:]
+        self.saved_rows = []
+
+    def getCell(self, x, y):
+        return (self.getRow(y) >> x) & 1
+
+    def checkLine(self, line):
+        return self.getRow(line) == self.full_row
+
+    def eliminateLines(self):
+        """
+        只有 place 时出现了满行才需要遍历 band，消行后重新计算各列高度
+        """
+        if not self.full_rows:
+            return 0
+        band = [row for row in self.band if row != self.full_row]
+        lines = len(self.band) - len(band)
+        while band and band[-1] == 0:
+            band.pop()
+        self.band = band
+        self.full_rows = 0
+        for x in range(self.field_width):
+            bit = 1 << x
+            i = min(self.heights[x] - lines, len(band))
+            while i > 0 and not band[i - 1] & bit:
+                i -= 1
+            self.heights[x] = i
+        return lines
+
+    def getColumnTops(self, start=0):
+        """
+        计算每一列第 start 行及以下最上方小方格所在的行，空列为 field_height
+        """
+        tops = [self.field_height - height for height in self.heights]
+        if start > 0:
+            for x in range(self.field_width):
+                while tops[x] < start or (tops[x] < self.field_height and not (self.getRow(tops[x]) >> x) & 1):
+                    tops[x] += 1
+        return tops
@@ -0,0 +1,207 @@
+"""
+观战模式：AI 在单独的进程中不受限制地连续游戏，每放置一个方块就把局面写入共享内存中的双缓冲；
+pygame 主循环以固定帧率读取最新的局面并绘制，来不及绘制的局面直接跳过，因此显示窗口不会拖慢 AI。
+窗口中分别显示模拟速度（每秒放置的方块数）与绘制帧率。
+
+双缓冲不使用锁：写入方总是写入当前不被读取的一半，写入前把该半的序号置为 -1，写完后再写入新的序号并切换 front；
+读取方复制 front 指向的一半，复制前后的序号相同且不为 -1 时才使用，否则保留上一帧
+"""
+
+import argparse
+import time
+import numpy as np
+from multiprocessing import Process, shared_memory
+from gameconst import *
+from bitboard import BitBoard
+from batchrunner import initializeWorker
+from evaluator import parseAgent
+
+
+
+Header = ["seq", "games", "pieces", "lines", "score", "level", "cur_type", "cur_direction", "cur_x", "cur_y", "next_type", "next_direction", "sim_rate"]
+Header_size = len(Header)
+# control[0] 为 front，control[1] 非 0 时模拟进程退出
+Control_size = 2
+
+
+class SnapshotBuffer():
+    """
+    共享内存中的双缓冲，每一半为 Header 中的各项（sim_rate 以 0.001 方块/秒为单位）以及每一行的小方格位掩码。
+    name 为 None 时创建新的共享内存
+    """
+    def __init__(self, field_height, name=None):
+        self.field_height = field_height
+        size = 8 * (Control_size + 2 * (Header_size + field_height))
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.control = np.ndarray((Control_size,), dtype=np.int64, buffer=self.memory.buf)
+        self.slots = np.ndarray((2, Header_size + field_height), dtype=np.int64, buffer=self.memory.buf, offset=8 * Control_size)
+        if name is None:
+            self.control[:] = 0
+            self.slots[:] = 0
+        self.seq = 0
+
+    def publish(self, header, rows):
+        back = 1 - self.control[0]
+        slot = self.slots[back]
+        self.seq += 1
+        slot[0] = -1
+        slot[1:Header_size] = header
+        slot[Header_size:] = rows
+        slot[0] = self.seq
+        self.control[0] = back
+
+    def read(self, last_seq):
+        """
+        返回序号大于 last_seq 的最新局面，没有新的局面或读取时正在被写入则返回 None
+        """
+        slot = self.slots[self.control[0]]
+        seq = int(slot[0])
+        if seq <= last_seq:
+            return None
+        data = slot.copy()
+        if int(slot[0]) != seq:
+            return None
+        return data
+
+    def stop(self):
+        self.control[1] = 1
+
+    def isStopped(self):
+        return self.control[1] != 0
+
+    def close(self, unlink=False):
+        del self.control, self.slots
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def getRows(field_map):
+    if type(field_map) is BitBoard:
+        return field_map.rows
+    return [sum(1 << x for (x, brick) in enumerate(lows) if brick >= Brick_base) for lows in field_map]
+
+
+def simulate(agent, memory_name, field_height, seed, rate_interval=0.5):
+    """
+    模拟进程：一局结束后立即用下一个种子开始新的一局，直到 SnapshotBuffer.stop 被调用
+    """
+    initializeWorker()
+    buffer = SnapshotBuffer(field_height, memory_name)
+    games = 0
+    (last_time, last_pieces, total_pieces, rate) = (time.perf_counter(), 0, 0, 0.0)
+    while not buffer.isStopped():
+        game = agent.newGame(seed + games)
+        games += 1
+        while not buffer.isStopped() and agent.move(game):
+            total_pieces += 1
+            now = time.perf_counter()
+            if now - last_time >= rate_interval:
+                rate = (total_pieces - last_pieces) / (now - last_time)
+                (last_time, last_pieces) = (now, total_pieces)
+            (cur_block, next_block) = (game.block_factory.cur_block, game.block_factory.next_block)
+            buffer.publish((games, game.pieces_num, game.lines_num, game.score, game.level, cur_block.block_type, cur_block.direction,
+                            cur_block.position[0], cur_block.position[1], next_block.block_type, next_block.direction, int(rate * 1000)),
+                           getRows(game.field_map))
+    buffer.close()
+
+
+class SnapshotBlock():
+    def __init__(self, block_type, direction, position):
+        self.block_type = block_type
+        self.direction = direction
+        self.layout = Blocks_layout[block_type][direction]
+        self.position = position
+
+
+class SnapshotFactory():
+    def __init__(self, cur_block, next_block):
+        self.cur_block = cur_block
+        self.next_block = next_block
+
+
+class Snapshot():
+    """
+    由共享内存中的一半构造，提供 Renderer 需要的 Game 属性
+    """
+    def __init__(self, field_width, field_height, data=None):
+        self.field_width = field_width
+        self.field_height = field_height
+        if data is None:
+            data = [0] * (Header_size + field_height)
+        (self.seq, self.games, self.pieces_num, self.lines_num, self.score, self.level, cur_type, cur_direction, cur_x, cur_y, next_type, next_direction, sim_rate) = [int(value) for value in data[:Header_size]]
+        self.sim_rate = sim_rate / 1000
+        self.field_map = BitBoard(field_width, field_height, [int(row) for row in data[Header_size:]])
+        self.block_factory = SnapshotFactory(SnapshotBlock(cur_type, cur_direction, (cur_x, cur_y)), SnapshotBlock(next_type, next_direction, (0, 0)))
+
+
+class Spectator():
+    """
+    在单独的进程中运行 agent（evaluator.Agent），以 fps 的帧率绘制最新的局面。模拟进程意外退出时 start 抛出 RuntimeError
+    """
+    def __init__(self, agent, fps=30, seed=0, field_width=10, field_height=20):
+        self.agent = agent
+        self.fps = fps
+        self.seed = seed
+        self.field_width = field_width
+        self.field_height = field_height
+        self.frames = 0
+        self.skipped = 0
+
+    def start(self, duration=None):
+        from render import Renderer
+        import pygame
+        buffer = SnapshotBuffer(self.field_height)
+        process = Process(target=simulate, args=(self.agent, buffer.memory.name, self.field_height, self.seed), daemon=True)
+        process.start()
+        snapshot = Snapshot(self.field_width, self.field_height)
+        renderer = Renderer(snapshot)
+        clock = pygame.time.Clock()
+        start_time = time.perf_counter()
+        (last_time, ticks, last_ticks, render_rate) = (start_time, 0, 0, 0.0)
+        try:
+            while duration is None or time.perf_counter() - start_time < duration:
+                renderer.checkQuit()
+                if not process.is_alive():
+                    raise RuntimeError("simulation process exited with code " + str(process.exitcode))
+                data = buffer.read(snapshot.seq)
+                if data is not None:
+                    if snapshot.seq > 0:
+                        self.skipped += int(data[0]) - snapshot.seq - 1
+                    snapshot = Snapshot(self.field_width, self.field_height, data)
+                    renderer.game = snapshot
+                    self.frames += 1
+                ticks += 1
+                now = time.perf_counter()
+                if now - last_time >= 0.5:
+                    render_rate = (ticks - last_ticks) / (now - last_time)
+                    (last_time, last_ticks) = (now, ticks)
+                renderer.status = ["Game: " + str(snapshot.games) + "  Pieces: " + str(snapshot.pieces_num),
+                                   "Sim: " + format(snapshot.sim_rate, ".0f") + " pieces/s",
+                                   "Render: " + format(render_rate, ".1f") + " fps"]
+                renderer.draw()
+                clock.tick(self.fps)
+        finally:
+            buffer.stop()
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+            buffer.close(True)
+        return snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch an agent play at full speed while the window renders at a fixed frame rate")
+    parser.add_argument("--agent", default="dellacherie", help="[name=]dellacherie[:a1,...,a6[:features]] or [name=]qlearning[:path]")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duration", type=float, default=None, help="close the window after this many seconds")
+    args = parser.parse_args()
+
+    spectator = Spectator(parseAgent(args.agent), args.fps, args.seed)
+    snapshot = spectator.start(args.duration)
+    print("Games: " + str(snapshot.games) + "   Sim: " + format(snapshot.sim_rate, ".0f") + " pieces/s   Frames drawn: " + str(spectator.frames) + "   Snapshots skipped: " + str(spectator.skipped))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+用于测试 server.py 的本地客户端：在一个连接上同时进行 sessions 局游戏，每收到一个局面就立即返回一步放置，
+游戏结束后用新的随机种子开始下一局。policy 为 random 时随机选择合法的放置，为 dellacherie 时使用 Pierre Dellacherie 算法。
+指定 --local 时在同一进程中启动服务器，不需要另外运行 server.py
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from gameconst import *
+from bitboard import BitBoard
+from game import Block
+from geometry import getGeometry
+from server import *
+
+
+
+class StubAgent(asyncio.Protocol):
+    def __init__(self, sessions, policy="random", duration=10.0, seed=0):
+        self.sessions = sessions
+        self.policy = policy
+        self.duration = duration
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.buffer = bytearray()
+        self.field_width = None
+        self.field_height = None
+        self.rows_struct = None
+        self.next_session = 0
+        self.active = set()
+        self.results = []
+        self.errors = 0
+        self.moves_num = 0
+        self.ai = None
+        self.deadline = None
+        self.done = asyncio.get_running_loop().create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        if not self.done.done():
+            self.done.set_result(None)
+
+    def newSession(self):
+        self.active.add(self.next_session)
+        frame = New.pack(Msg_new, self.next_session, self.seed + self.next_session)
+        self.next_session += 1
+        return frame
+
+    def getMove(self, block_type, direction, rows):
+        if self.policy == "random":
+            direction = self.rng.randrange(len(Blocks_layout[block_type]))
+            return (direction, self.rng.choice(getGeometry(Blocks_layout[block_type][direction]).getLegalRange(self.field_width)))
+        if self.ai is None:
+            from PierreDellacherie import AI, Default_A
+            self.ai = AI(self.field_width, self.field_height, Default_A)
+        block = Block(self.field_width, self.field_height, block_type, direction, (self.field_width // 2 - 2, -4))
+        if not self.ai.ai(block, BitBoard(self.field_width, self.field_height, rows)):
+            # 没有不会导致游戏结束的放置位置，随便放置一个
+            return (direction, getGeometry(block.layout).getLegalRange(self.field_width)[0])
+        return (block.direction, block.position[0])
+
+    def data_received(self, data):
+        self.buffer += data
+        offset = 0
+        frames = []
+        if self.field_width is None:
+            if len(self.buffer) < Hello.size:
+                return
+            (magic, version, self.field_width, self.field_height) = Hello.unpack_from(self.buffer, 0)
+            if magic != Magic or version != Version:
+                self.transport.close()
+                return
+            self.rows_struct = getRowsStruct(self.field_width, self.field_height)
+            offset = Hello.size
+            self.deadline = time.perf_counter() + self.duration
+            frames = [self.newSession() for _ in range(self.sessions)]
+        stopping = time.perf_counter() > self.deadline
+        state_size = State_header.size + self.rows_struct.size
+        while offset < len(self.buffer):
+            msg = self.buffer[offset]
+            size = state_size if msg == Msg_state else Over.size if msg == Msg_over else Error.size
+            if len(self.buffer) - offset < size:
+                break
+            if msg == Msg_state:
+                (session_id, block_type, direction, next_type, lines_num, pieces_num, rows) = decodeState(self.buffer, offset, self.rows_struct)
+                if stopping:
+                    frames.append(Close.pack(Msg_close, session_id))
+                    self.active.discard(session_id)
+                else:
+                    frames.append(Move.pack(Msg_move, session_id, *self.getMove(block_type, direction, rows)))
+                    self.moves_num += 1
+            else:
+                if msg == Msg_over:
+                    self.results.append(Over.unpack_from(self.buffer, offset)[2:])
+                else:
+                    self.errors += 1
+                # 所有消息都以 类型、会话编号 开头
+                self.active.discard(Close.unpack_from(self.buffer, offset)[1])
+                if not stopping:
+                    frames.append(self.newSession())
+            offset += size
+        del self.buffer[:offset]
+        if frames:
+            self.transport.write(b"".join(frames))
+        if stopping and not self.active:
+            self.transport.close()
+
+
+async def run(args):
+    loop = asyncio.get_running_loop()
+    server = None
+    if args.local:
+        server = GameServer(max_sessions=args.sessions)
+        listener = await server.start(args.host, 0, args.unix)
+        port = listener.sockets[0].getsockname()[1] if args.unix is None else None
+    else:
+        port = args.port
+    start_time = time.perf_counter()
+    if args.unix is not None:
+        (transport, agent) = await loop.create_unix_connection(lambda: StubAgent(args.sessions, args.policy, args.duration, args.seed), args.unix)
+    else:
+        (transport, agent) = await loop.create_connection(lambda: StubAgent(args.sessions, args.policy, args.duration, args.seed), args.host, port)
+    await agent.done
+    elapsed = time.perf_counter() - start_time
+    lines = [lines_num for (pieces_num, lines_num, score) in agent.results]
+    print("Moves: " + str(agent.moves_num) + " in " + format(elapsed, ".1f") + "s (" + format(agent.moves_num / elapsed, ".0f") + " moves/s)   Games finished: " + str(len(agent.results)) + "   Mean lines: " + format(sum(lines) / len(lines) if lines else 0.0, ".1f") + "   Errors: " + str(agent.errors))
+    if server is not None:
+        report = server.getReport()
+        print("Server: " + str(report["moves"]) + " moves, per session moves/s p50 " + format(report["session_rate_p50"], ".1f") + " (min " + format(report["session_rate_min"], ".1f") + ", max " + format(report["session_rate_max"], ".1f") + ")")
+        server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub agent for the Tetris game server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--unix", default=None, help="connect to a Unix socket instead of TCP")
+    parser.add_argument("--local", action="store_true", help="start the server in this process")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--policy", choices=["random", "dellacherie"], default="random")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
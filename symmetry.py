@@ -0,0 +1,133 @@
+"""
+利用左右镜像对称压缩 Q learning 的状态：把井左右翻转后，相邻列高度差依次取反并倒序，S 与 Z、J 与 L 互换，I、O、T 不变，
+翻转前后局面的价值相同。Canonicalizer 把每个 (状态, 方块种类) 与它的镜像合并为一行，
+镜像一侧的放置方法换算为代表一侧对应的放置方法，因此 Q 表的行数约为原来的一半，镜像局面之间共享更新。
+
+压缩的 Q 表中放置方法按 (方块最左侧小方格所在的列, 方向) 存储。放置位置 x 从 0 开始时，最左侧有空列的方向
+（例如 O 型）无法贴住第 0 列，镜像后就没有对应的放置方法，所以使用压缩 Q 表时 x 可以为负数，由 getAllLocations 列出
+"""
+
+import numpy as np
+from gameconst import *
+from geometry import Blocks_geometry, getGeometry
+
+
+
+# 各方块种类镜像后的种类：长条、方块、T 型不变，Z 型与 S 型、J 型与 L 型互换
+Mirror_type = (0, 1, 2, 4, 3, 6, 5)
+
+
+def normalizeLayout(layout):
+    min_x = min(x for (x, y) in layout)
+    min_y = min(y for (x, y) in layout)
+    return frozenset((x - min_x, y - min_y) for (x, y) in layout)
+
+
+def getMirrorDirections():
+    """
+    对每种方块的每个方向，找出镜像种类中形状为它的镜像的方向
+    """
+    mirror = []
+    for block_type in range(len(Blocks_layout)):
+        directions = []
+        for layout in Blocks_layout[block_type]:
+            shape = normalizeLayout([(-x, y) for (x, y) in layout])
+            directions.append([normalizeLayout(target) for target in Blocks_layout[Mirror_type[block_type]]].index(shape))
+        mirror.append(directions)
+    return mirror
+
+
+def getAllLocations(field_width, layout):
+    """
+    方块不越过左右边界的所有放置位置 x，包括最左侧有空列的方向贴住第 0 列时的负数 x
+    """
+    geometry = getGeometry(layout)
+    return range(-geometry.min_x, field_width - geometry.max_x)
+
+
+class Canonicalizer():
+    """
+    field_width 列的井、状态为 base 进制的相邻列高度差编码时的镜像合并。getIndex 返回压缩后的 Q 表下标 (行, 列, 方向)
+    """
+    def __init__(self, field_width, base):
+        self.field_width = field_width
+        self.base = base
+        self.states_num = base**(field_width - 1)
+        self.mirror_directions = getMirrorDirections()
+        self.mirror_state = [self.getMirrorState(state) for state in range(self.states_num)]
+        self.rows = [[0] * 7 for _ in range(self.states_num)]
+        self.is_mirrored = [[False] * 7 for _ in range(self.states_num)]
+        self.rows_num = 0
+        for state in range(self.states_num):
+            for block_type in range(7):
+                mirror = (self.mirror_state[state], Mirror_type[block_type])
+                if mirror < (state, block_type):
+                    self.rows[state][block_type] = self.rows[mirror[0]][mirror[1]]
+                    self.is_mirrored[state][block_type] = True
+                else:
+                    self.rows[state][block_type] = self.rows_num
+                    self.rows_num += 1
+        # 自身镜像对称的情况下一个放置方法与它的镜像等价，取其中较小的一个
+        self.is_symmetric = [[self.mirror_state[state] == state and Mirror_type[block_type] == block_type for block_type in range(7)] for state in range(self.states_num)]
+
+    def getMirrorState(self, state):
+        """
+        第 i 个高度差 d 镜像后成为第 field_width - 2 - i 个高度差 -d，对应的 base 进制数位为 base - 1 - digit
+        """
+        digits = [(state // self.base**i) % self.base for i in range(self.field_width - 1)]
+        return sum(self.base**i * (self.base - 1 - digits[self.field_width - 2 - i]) for i in range(self.field_width - 1))
+
+    def getMirrorAction(self, block_type, x, direction):
+        """
+        放置在 x 的方块镜像后对应的镜像种类的放置方法 (x', direction')，两者所占的列关于井的中线对称
+        """
+        geometry = Blocks_geometry[block_type][direction]
+        mirror_direction = self.mirror_directions[block_type][direction]
+        mirror_geometry = Blocks_geometry[Mirror_type[block_type]][mirror_direction]
+        return (self.field_width - (x + geometry.min_x) - geometry.width - mirror_geometry.min_x, mirror_direction)
+
+    def getIndex(self, state, block_type, x, direction):
+        row = self.rows[state][block_type]
+        column = x + Blocks_geometry[block_type][direction].min_x
+        if self.is_mirrored[state][block_type] or self.is_symmetric[state][block_type]:
+            (mirror_x, mirror_direction) = self.getMirrorAction(block_type, x, direction)
+            mirror_column = mirror_x + Blocks_geometry[Mirror_type[block_type]][mirror_direction].min_x
+            if self.is_mirrored[state][block_type]:
+                (column, direction) = (mirror_column, mirror_direction)
+            else:
+                (column, direction) = min((column, direction), (mirror_column, mirror_direction))
+        return (row, column, direction)
+
+    def newTable(self):
+        return np.zeros((self.rows_num, self.field_width, 4))
+
+    def getActions(self, block_type):
+        """
+        未压缩的 Q 表中的放置方法，x 从 0 开始
+        """
+        return [(x, direction) for (direction, geometry) in enumerate(Blocks_geometry[block_type]) for x in geometry.getLegalRange(self.field_width)]
+
+    def canonicalizeTable(self, Q):
+        """
+        将未压缩的 Q 表（下标为状态、方块种类、列、方向）转换为压缩的 Q 表，合并到同一项的值取平均
+        """
+        table = self.newTable()
+        counts = np.zeros(table.shape)
+        for state in range(self.states_num):
+            for block_type in range(7):
+                for (x, direction) in self.getActions(block_type):
+                    index = self.getIndex(state, block_type, x, direction)
+                    table[index] += Q[state, block_type, x, direction]
+                    counts[index] += 1
+        return table / np.maximum(counts, 1)
+
+    def expandTable(self, table):
+        """
+        将压缩的 Q 表展开为未压缩的 Q 表
+        """
+        Q = np.zeros((self.states_num, 7, self.field_width, 4))
+        for state in range(self.states_num):
+            for block_type in range(7):
+                for (x, direction) in self.getActions(block_type):
+                    Q[state, block_type, x, direction] = table[self.getIndex(state, block_type, x, direction)]
+        return Q
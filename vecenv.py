@@ -0,0 +1,174 @@
+"""
+同步推进多局游戏的向量化环境：step 一次为 num_envs 局游戏各落定一个方块，观测写入预先分配的 NumPy 数组，
+调用方可以直接读取这些数组而不需要复制（下一次 step 时会被覆盖）。
+每一步只在 Python 中逐局执行落定和消行，占用格子、堆高、合法动作与落点等都对所有游戏一次性用数组运算得到；
+某一局结束时记录它的行数与方块数并立即用新的随机种子重新开始（自动重置）。
+动作为 方向 * field_width + 列，动作掩码的形状为 (num_envs, 4, field_width)
+"""
+
+import argparse
+import random
+import time
+import numpy as np
+from game import *
+from geometry import Blocks_geometry
+
+
+
+Max_directions = 4
+
+
+def getActionTables(field_width):
+    """
+    对每种方块、每个方向与列预先计算：是否不越过左右边界，方块覆盖的各列（不足 4 列的用第 0 列补齐）、
+    各列最下方小方格的偏移（补齐的列为一个很小的数，不影响取最小值）以及最上方小方格的偏移
+    """
+    legal = np.zeros((7, Max_directions, field_width), dtype=bool)
+    columns = np.zeros((7, Max_directions, field_width, 4), dtype=np.intp)
+    bottoms = np.full((7, Max_directions, field_width, 4), -1000, dtype=np.int32)
+    min_y = np.zeros((7, Max_directions), dtype=np.int32)
+    for block_type in range(7):
+        for (direction, geometry) in enumerate(Blocks_geometry[block_type]):
+            min_y[block_type, direction] = min(y for (x, y) in geometry.layout)
+            for x0 in geometry.getLegalRange(field_width):
+                legal[block_type, direction, x0] = True
+                for (k, (x, y)) in enumerate(geometry.bottoms):
+                    columns[block_type, direction, x0, k] = x0 + x
+                    bottoms[block_type, direction, x0, k] = y
+    return legal, columns, bottoms, min_y
+
+
+class VecEnv():
+    def __init__(self, num_envs, field_width=10, field_height=20, seed=0):
+        self.num_envs = num_envs
+        self.field_width = field_width
+        self.field_height = field_height
+        self.seed = seed
+        self.episodes_num = 0
+        (self.legal_table, self.columns_table, self.bottoms_table, self.min_y_table) = getActionTables(field_width)
+        self.shifts = np.arange(field_width, dtype=np.uint64)
+        self.rows = np.zeros((num_envs, field_height), dtype=np.uint64)
+        self.boards = np.zeros((num_envs, field_height, field_width), dtype=np.uint8)
+        self.tops = np.zeros((num_envs, field_width), dtype=np.int32)
+        self.heights = np.zeros((num_envs, field_width), dtype=np.int32)
+        self.pieces = np.zeros(num_envs, dtype=np.int8)
+        self.directions = np.zeros(num_envs, dtype=np.int8)
+        self.next_pieces = np.zeros(num_envs, dtype=np.int8)
+        self.action_mask = np.zeros((num_envs, Max_directions, field_width), dtype=bool)
+        self.safe_mask = np.zeros((num_envs, Max_directions, field_width), dtype=bool)
+        self.landing = np.zeros((num_envs, Max_directions, field_width), dtype=np.int32)
+        self.rewards = np.zeros(num_envs, dtype=np.float32)
+        self.dones = np.zeros(num_envs, dtype=bool)
+        self.lines = np.zeros(num_envs, dtype=np.int64)
+        self.pieces_num = np.zeros(num_envs, dtype=np.int64)
+        self.final_lines = np.zeros(num_envs, dtype=np.int64)
+        self.final_pieces = np.zeros(num_envs, dtype=np.int64)
+        self.observations = {"boards": self.boards,
+                             "heights": self.heights,
+                             "pieces": self.pieces,
+                             "directions": self.directions,
+                             "next_pieces": self.next_pieces,
+                             "action_mask": self.action_mask,
+                             "safe_mask": self.safe_mask,
+                             "landing": self.landing}
+        self.games = [None] * num_envs
+
+    def newGame(self, index):
+        game = Game(self.field_width, self.field_height, True, random.Random(self.seed + self.episodes_num))
+        game.initialize()
+        self.episodes_num += 1
+        self.games[index] = game
+        self.lines[index] = 0
+        self.pieces_num[index] = 0
+        self.writeGame(index)
+
+    def writeGame(self, index):
+        game = self.games[index]
+        self.rows[index] = game.field_map.rows
+        self.pieces[index] = game.block_factory.cur_block.block_type
+        self.directions[index] = game.block_factory.cur_block.direction
+        self.next_pieces[index] = game.block_factory.next_block.block_type
+
+    def writeObservations(self):
+        """
+        由各局的行位掩码和方块种类一次性计算所有观测。落点与 Block.drop 相同，
+        safe_mask 为落定后不会有小方格位于游戏区域上方（不会导致游戏结束）的动作
+        """
+        np.bitwise_and(np.right_shift(self.rows[:, :, None], self.shifts), 1, out=self.boards, casting="unsafe")
+        occupied = self.boards[:, 1:, :]
+        # 与 geometry.getColumnTops 一致，第 0 行的小方格不计入堆顶
+        np.copyto(self.tops, np.where(occupied.any(axis=1), occupied.argmax(axis=1) + 1, self.field_height))
+        np.subtract(self.field_height, self.tops, out=self.heights)
+        pieces = self.pieces.astype(np.intp)
+        np.copyto(self.action_mask, self.legal_table[pieces])
+        columns = self.columns_table[pieces]
+        landed = np.take_along_axis(self.tops, columns.reshape(self.num_envs, -1), axis=1).reshape(columns.shape)
+        np.subtract((landed - self.bottoms_table[pieces]).min(axis=3), 1, out=self.landing)
+        np.logical_and(self.action_mask, self.landing + self.min_y_table[pieces][:, :, None] >= 0, out=self.safe_mask)
+
+    def reset(self):
+        for index in range(self.num_envs):
+            self.newGame(index)
+        self.rewards[:] = 0
+        self.dones[:] = False
+        self.writeObservations()
+        return self.observations
+
+    def step(self, actions):
+        """
+        actions 为长度 num_envs 的动作（方向 * field_width + 列）。返回 (观测, 本步消除的行数, 是否结束)，
+        结束的游戏已自动重新开始，它的行数与方块数记录在 final_lines、final_pieces 中
+        """
+        actions = np.asarray(actions)
+        if not self.action_mask.reshape(self.num_envs, -1)[np.arange(self.num_envs), actions].all():
+            raise ValueError("illegal action for environment " + str(int(np.argmin(self.action_mask.reshape(self.num_envs, -1)[np.arange(self.num_envs), actions]))))
+        (directions, xs) = np.divmod(actions, self.field_width)
+        for index in range(self.num_envs):
+            game = self.games[index]
+            lines_num = game.lines_num
+            game.block_factory.drop(int(xs[index]), int(directions[index]), game.field_map, game.stats.getColumnTops(1))
+            game.update()
+            self.rewards[index] = game.lines_num - lines_num
+            self.pieces_num[index] += 1
+            self.lines[index] = game.lines_num
+            self.dones[index] = game.block_factory.is_failed
+            if self.dones[index]:
+                self.final_lines[index] = game.lines_num
+                self.final_pieces[index] = self.pieces_num[index]
+                self.newGame(index)
+            else:
+                self.writeGame(index)
+        self.writeObservations()
+        return self.observations, self.rewards, self.dones
+
+
+def getLowestActions(env):
+    """
+    示例的批量策略：对所有游戏一次性选择落点最低的安全动作，没有安全动作时选择任意一个合法动作
+    """
+    scores = np.where(env.safe_mask, env.landing, -1).reshape(env.num_envs, -1)
+    scores = np.where(env.action_mask.reshape(env.num_envs, -1), scores, -2)
+    return scores.argmax(axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Step many Tetris games in lockstep with NumPy observations")
+    parser.add_argument("--envs", type=int, default=256)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    env = VecEnv(args.envs, seed=args.seed)
+    env.reset()
+    (episodes, lines) = (0, 0)
+    start_time = time.perf_counter()
+    for step in range(args.steps):
+        (observations, rewards, dones) = env.step(getLowestActions(env))
+        episodes += int(dones.sum())
+        lines += int(env.final_lines[dones].sum())
+    elapsed = time.perf_counter() - start_time
+    print("Envs: " + str(args.envs) + "   Steps: " + str(args.steps) + "   " + format(args.envs * args.steps / elapsed, ".0f") + " env steps/s   Episodes finished: " + str(episodes) + "   Mean lines: " + format(lines / episodes if episodes else 0.0, ".1f"))
+
+
+if __name__ == '__main__':
+    main()